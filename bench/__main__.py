@@ -0,0 +1,81 @@
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from .benchmarks import BENCHMARKS
+
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+RESULTS  = Path(__file__).parent / 'results.json'
+
+def run(names):
+    results = {}
+    for name in names:
+        print(f'Running {name}...', file = sys.stderr)
+        try:
+            found = BENCHMARKS[name]()
+        except ImportError as e:
+            print(f'  skipped ({e})', file = sys.stderr)
+            continue
+        for key, result in found.items():
+            results[key] = result._asdict()
+    return {
+        'time':       datetime.now().isoformat(timespec = 'seconds'),
+        'python':     platform.python_version(),
+        'machine':    platform.machine(),
+        'benchmarks': results
+    }
+
+def compare(results, baseline, tolerance: float):
+    # Returns the regressions beyond the tolerance, as a fraction of the
+    # baseline value
+    regressions = []
+    for key, base in baseline['benchmarks'].items():
+        result = results['benchmarks'].get(key)
+        if result is None:
+            continue
+        change = (result['value'] - base['value']) / base['value']
+        if base['higher_is_better']:
+            change = -change
+        status = 'REGRESSION' if change > tolerance else 'ok'
+        print(f"{key:32} {base['value']:12.2f} -> {result['value']:12.2f} {result['unit']:8}"
+              f" {change * -100:+7.1f}%  {status}")
+        if change > tolerance:
+            regressions.append((key, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog = 'python -m bench',
+        description = "Benchmarks the Sjuan rules engine and compares against a baseline"
+    )
+    parser.add_argument('names', nargs = '*',
+                        help = f"benchmarks to run, out of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('-o', '--output', type = Path, default = RESULTS,
+                        help = "where to write the results as JSON")
+    parser.add_argument('-b', '--baseline', type = Path, default = BASELINE)
+    parser.add_argument('-t', '--tolerance', type = float, default = 0.2,
+                        help = "how much worse than the baseline a result may be, "
+                               "as a fraction (default: 0.2)")
+    parser.add_argument('--save-baseline', action = 'store_true',
+                        help = "store the results as the new baseline")
+    args = parser.parse_args()
+    unknown = [ name for name in args.names if name not in BENCHMARKS ]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = run(args.names or list(BENCHMARKS))
+    text = json.dumps(results, indent = 2)
+    args.output.write_text(text + '\n')
+
+    if args.save_baseline:
+        args.baseline.write_text(text + '\n')
+    elif args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%}')
+            sys.exit(1)
@@ -0,0 +1,311 @@
+import random
+import time
+import tracemalloc
+from copy import deepcopy
+from types import SimpleNamespace
+from typing import Callable, Dict, List, NamedTuple
+
+from card import *
+from card.games.sjuan import *
+from lib import const
+
+
+# Benchmarks of the Sjuan rules engine. Every benchmark is seeded, so that
+# runs play exactly the same games and can be compared with each other.
+
+class Result(NamedTuple):
+    value: float
+    unit:  str
+    # Whether a bigger value is an improvement
+    higher_is_better: bool = False
+
+
+NUM_PLAYERS = 2
+ALL_CARDS   = [ Card(suit, value) for suit in CardSuit for value in CardValue ]
+
+def is_queue(state: SjuanGameState) -> bool:
+    return state.phase.match(
+        do_queue = const(True), player_turn = const(False), give_cards = const(False)
+    )
+
+def phase_name(state: SjuanGameState) -> str:
+    return state.phase.match(
+        do_queue    = const('do_queue'),
+        player_turn = const('player_turn'),
+        give_cards  = const('give_cards')
+    )
+
+def pick_moves(game: SjuanGame, rng: random.Random) -> List[SjuanRules.Move]:
+    # Like the bots: a random card if one can be played, otherwise skip or ask
+    # for cards
+    options = game.suggested_moves()
+    if is_queue(game.state):
+        return options[0]
+    cards = [ moves for moves in options if moves[0].match(
+        the_action = const(False), from_to = const(True)
+    ) ]
+    return rng.choice(cards or options)
+
+def play_game(seed: int) -> int:
+    rng = random.Random(seed)
+    game = SjuanGame(NUM_PLAYERS, ALL_CARDS, rng = seed)
+    moves = 0
+    while len(game.state.players) > 1:
+        game.do(pick_moves(game, rng))
+        moves += 1
+    return moves
+
+
+def timed(f: Callable[[], None], repeat: int, rounds: int = 5) -> float:
+    # Seconds per call, from the fastest of a few rounds as the others were
+    # probably slowed down by something else going on
+    best = float('inf')
+    for r in range(rounds):
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            f()
+        best = min(best, (time.perf_counter() - t0) / repeat)
+    return best
+
+
+def bench_games(num_games: int = 10) -> Dict[str, Result]:
+    moves = sum(play_game(seed) for seed in range(num_games))
+    elapsed = timed(lambda: [ play_game(seed) for seed in range(num_games) ], 1)
+    return {
+        'games_per_sec': Result(num_games / elapsed, 'games/s', True),
+        'moves_per_sec': Result(moves / elapsed,     'moves/s', True)
+    }
+
+def bench_deal(repeat: int = 100) -> Dict[str, Result]:
+    state = SjuanGameState(ALL_CARDS, NUM_PLAYERS, rng = 0)
+    def deal():
+        state.reset()
+        # Dealing is done through the queue
+        while is_queue(state):
+            SjuanRules.do(list(state.queue), state)
+    return {
+        'deal_latency': Result(timed(deal, repeat) * 1e6, 'us')
+    }
+
+def sample_positions(num_games: int = 10, per_phase: int = 200):
+    # Copies of positions from seeded games, by phase, with the moves that
+    # were played in them
+    positions = { 'do_queue': [], 'player_turn': [], 'give_cards': [] }
+    rng = random.Random(1)
+    for seed in range(num_games):
+        game = SjuanGame(NUM_PLAYERS, ALL_CARDS, rng = seed)
+        while len(game.state.players) > 1:
+            moves = pick_moves(game, rng)
+            found = positions[phase_name(game.state)]
+            if len(found) < per_phase:
+                snapshot = SjuanGameState.from_state(deepcopy(game.state.get_state()))
+                found.append((snapshot, moves))
+            game.do(moves)
+    return positions
+
+def bench_move_info(repeat: int = 2) -> Dict[str, Result]:
+    res = {}
+    for phase, positions in sample_positions().items():
+        if not positions:
+            continue
+        def move_info():
+            for state, moves in positions:
+                SjuanRules.move_info(moves, state)
+        def move_is_valid():
+            for state, moves in positions:
+                SjuanRules.move_is_valid(moves, state)
+        n = len(positions)
+        res[f'move_info_{phase}']     = Result(timed(move_info,     repeat) / n * 1e6, 'us')
+        res[f'move_is_valid_{phase}'] = Result(timed(move_is_valid, repeat) / n * 1e6, 'us')
+    return res
+
+def bench_moves_for_card(repeat: int = 2) -> Dict[str, Result]:
+    positions = sample_positions()['player_turn']
+    def moves_for_card():
+        for state, _ in positions:
+            for i in range(len(state.players[state.turn_index()].cards)):
+                SjuanRules.moves_for_card(i, state)
+    calls = sum(len(state.players[state.turn_index()].cards) for state, _ in positions)
+    return {
+        'moves_for_card_latency': Result(timed(moves_for_card, repeat) / calls * 1e6, 'us')
+    }
+
+def cards_grouped() -> List[List[Card]]:
+    # The bots' groups, as in `main_train`
+    return [ [
+        Card(suit, value) for value in CardValue
+        if ((value.adj_value(aces_lowest = True) - 7) * dir > 0
+            or dir == 1 and value == CardValue.SEVEN)
+    ] for suit in CardSuit for dir in (1, -1) ]
+
+def bench_state_representation(repeat: int = 2) -> Dict[str, Result]:
+    # Needs torch
+    from train.playerbot import PlayerBot
+
+    # The bots only look at `sjuan.game.state`
+    sjuan = SimpleNamespace(game = SimpleNamespace(state = None))
+    bots = [ PlayerBot(sjuan, cards_grouped(), i) for i in range(NUM_PLAYERS) ]
+
+    positions = sample_positions()['player_turn']
+    def state_representation():
+        for state, _ in positions:
+            sjuan.game.state = state
+            bots[state.turn_index()].get_state_representation()
+    return {
+        'state_representation_latency': Result(
+            timed(state_representation, repeat) / len(positions) * 1e6, 'us'
+        )
+    }
+
+def bench_state_encoding(repeat: int = 5) -> Dict[str, Result]:
+    # Whether the encoder should fill one buffer rather than allocate: the
+    # bots keep every encoding (in the models' graphs and their `Decision`s),
+    # so a reused buffer would have to be copied out each time
+    import torch
+    from train.playerbot import StateEncoder
+
+    encoder = StateEncoder(cards_grouped())
+    masks = [
+        (card_mask(state.players[state.turn_index()].cards), state.sjuan_stack.stack_mask())
+        for state, _ in sample_positions()['player_turn']
+    ]
+    buffer = torch.empty(3 * encoder.num_cards)
+    def new_tensor():
+        for hand, stack in masks:
+            encoder.encode(hand, stack)
+    def reused():
+        for hand, stack in masks:
+            encoder.encode(hand, stack, buffer)
+    def reused_and_copied():
+        for hand, stack in masks:
+            encoder.encode(hand, stack, buffer)[0].clone()
+    new_tensor()
+    return {
+        f'state_encoding_{name}_latency': Result(timed(f, repeat) / len(masks) * 1e6, 'us')
+        for name, f in (('new_tensor', new_tensor), ('reused_buffer', reused),
+                        ('reused_buffer_copied', reused_and_copied))
+    }
+
+def bench_inference(num_games: int = 32) -> Dict[str, Result]:
+    # The same games played by bots one at a time, and all at once in
+    # threads with their forward passes batched by an `InferenceServer`, as
+    # actors play them with `games_at_once`
+    import threading
+    import torch
+    from train.inference import InferenceServer
+    from train.playerbot import PlayerBot
+    from train.selfplay import play_episode
+
+    torch.manual_seed(0)
+    bots = [ PlayerBot(None, cards_grouped(), i, name = f'Bot{i}') for i in range(NUM_PLAYERS) ]
+    moves = []
+    def play(players, seed):
+        with torch.no_grad():
+            play_episode(players, cards_grouped(), rng = seed,
+                         on_move = lambda *move: moves.append(move))
+
+    t0 = time.perf_counter()
+    for seed in range(num_games):
+        play(bots, seed)
+    one_at_a_time = time.perf_counter() - t0
+    num_moves = len(moves)
+
+    moves.clear()
+    with InferenceServer(max_batch = num_games) as server:
+        threads = [
+            threading.Thread(target = play, args = (
+                [ bot.sharing_models(server) for bot in bots ], seed
+            ))
+            for seed in range(num_games)
+        ]
+        t0 = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batched = time.perf_counter() - t0
+    assert len(moves) > 0
+
+    return {
+        'inference_moves_per_sec_one_at_a_time': Result(num_moves / one_at_a_time, 'moves/s', True),
+        'inference_moves_per_sec_batched':       Result(len(moves) / batched, 'moves/s', True),
+        'inference_mean_batch_size':             Result(server.mean_batch_size, 'states', True)
+    }
+
+def bench_actor_learner(games_per_actor: int = 20) -> Dict[str, Result]:
+    # How self-play scales with the actors, leaving a core for the learner:
+    # 1, 2, 4, ... actors up to one fewer than the cores. Timed from the first
+    # game in, so as to leave out starting the processes.
+    import os
+    from train.actor_learner import ActorLearner
+    from train.playerbot import PlayerBot
+
+    counts = [ 1 ]
+    while counts[-1] * 2 <= (os.cpu_count() or 2) - 1:
+        counts.append(counts[-1] * 2)
+
+    res = {}
+    rates = {}
+    for num_actors in counts:
+        bots = [ PlayerBot(None, cards_grouped(), i, name = f'Bot{i}') for i in range(4) ]
+        learner = ActorLearner(bots, cards_grouped(), num_actors = num_actors, seed = 0)
+        started = []
+        def on_game(record):
+            if not started:
+                started.append(time.perf_counter())
+        num_games = 1 + games_per_actor * num_actors
+        learner.run(num_games, on_game = on_game, log_every = 0)
+        rates[num_actors] = (num_games - 1) / (time.perf_counter() - started[0])
+        res[f'actor_learner_games_per_sec_{num_actors}'] = Result(rates[num_actors], 'games/s', True)
+    if len(counts) > 1:
+        # 1 for games/s going up in proportion to the actors
+        most = counts[-1]
+        res['actor_learner_scaling'] = Result(rates[most] / (most * rates[1]), 'x', True)
+    return res
+
+def bench_solver(num_positions: int = 20, cards_per_hand: int = 10) -> Dict[str, Result]:
+    # Solving positions from seeded games, played until neither hand has
+    # more than `cards_per_hand` cards, each with an empty table
+    positions = []
+    seed = 0
+    while len(positions) < num_positions:
+        rng = random.Random(seed)
+        engine = SjuanEngine(2, rng = seed)
+        seed += 1
+        while (not engine.is_terminal()
+               and max(bin(hand).count('1') for hand in engine.hands) > cards_per_hand):
+            moves = engine.legal_moves()
+            engine.step(rng.choice([ move for move in moves if move < MOVE_SKIP ] or moves))
+        if not engine.is_terminal():
+            positions.append(engine)
+
+    latencies = [ timed(lambda: SjuanSolver().solve(engine), 1) for engine in positions ]
+    return {
+        'solver_latency':     Result(sum(latencies) / len(latencies) * 1e3, 'ms'),
+        'solver_latency_max': Result(max(latencies) * 1e3, 'ms')
+    }
+
+def bench_memory(num_games: int = 5) -> Dict[str, Result]:
+    peaks = []
+    for seed in range(num_games):
+        tracemalloc.start()
+        play_game(seed)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        'peak_memory_per_game': Result(max(peaks) / 1024, 'KiB')
+    }
+
+
+BENCHMARKS = {
+    'games':                bench_games,
+    'deal':                 bench_deal,
+    'move_info':            bench_move_info,
+    'moves_for_card':       bench_moves_for_card,
+    'state_representation': bench_state_representation,
+    'state_encoding':       bench_state_encoding,
+    'inference':            bench_inference,
+    'actor_learner':        bench_actor_learner,
+    'solver':               bench_solver,
+    'memory':               bench_memory
+}
@@ -1,3 +1,8 @@
-from .card import *
-from .card_hand import *
-from .card_stack import *
+from .undo_log import UndoEntry, UndoLog, Undoable
+from .seeding import RandomLike, make_rng, derive_seed, seed_sequence
+from .card import (
+    CardColour, CardSuit, CardValue, Card, card_mask, mask_ids, mask_cards,
+    NormalAction, InsertAction, TakeAction, CollectionState, try_take, CardCollection
+)
+from .card_hand import CardHandAction, CardHandInsert, CardHandTake, CardHand
+from .card_stack import CardStackAction, CardStackInsert, CardStackTake, CardStack
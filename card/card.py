@@ -1,9 +1,10 @@
+from __future__ import annotations
 from abc import ABC, abstractmethod
 from enum import Enum, auto
 from typing import Callable, List, Generic, TypeVar, Optional
-from copy import deepcopy
 
 from lib import do_nothing
+from .undo_log import UndoLog, Undoable
 
 
 class CardColour(Enum):
@@ -101,26 +102,78 @@ class CardValue(Enum):
         return self.name_short()
 
 
+# Cards are interned: there is exactly one instance of each of the 52 cards,
+# so `Card(suit, value)` is a lookup, equality is identity and copying a card
+# (or a list of cards) never allocates new ones.
 class Card:
-    def __init__(self, suit: CardSuit, value: CardValue):
-        self.suit  = suit
-        self.value = value
+    __slots__ = ('suit', 'value', 'id')
+
+    NUM_CARDS = 52
+
+    def __new__(cls, suit: CardSuit, value: CardValue):
+        return cls._interned[suit, value]
+
+    @classmethod
+    def _intern(cls, suit: CardSuit, value: CardValue) -> Card:
+        card = object.__new__(cls)
+        object.__setattr__(card, 'suit',  suit)
+        object.__setattr__(card, 'value', value)
+        object.__setattr__(card, 'id',    (suit.value - 1) * 13 + (value.value - 2))
+        return card
+
+    @classmethod
+    def from_id(cls, id: int) -> Card:
+        return cls._by_id[id]
 
     @property
     def colour(self) -> CardColour:
         return self.suit.colour
 
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self!r} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self!r} is immutable")
+
+    def __hash__(self):
+        return self.id
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (Card, (self.suit, self.value))
+
     def __str__(self):
         return f"{self.value} of {self.suit}"
 
     def __repr__(self):
         return f"Card({repr(self.suit)}, {repr(self.value)})"
 
-    def __eq__(self, other):
-        try:
-            return self.suit == other.suit and self.value == other.value
-        except AttributeError:
-            return False
+Card._by_id    = [ Card._intern(suit, value) for suit in CardSuit for value in CardValue ]
+Card._interned = { (card.suit, card.value): card for card in Card._by_id }
+
+
+# Sets of cards as bitmasks over card ids
+def card_mask(cards) -> int:
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.id
+    return mask
+
+def mask_ids(mask: int) -> List[int]:
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    return ids
+
+def mask_cards(mask: int) -> List[Card]:
+    return [ Card._by_id[i] for i in mask_ids(mask) ]
 
 
 # Collections of cards
@@ -131,20 +184,20 @@ TakeAction   = TypeVar('TakeAction')
 CollectionState = TypeVar('CollectionState')
 
 def try_take(ref, move):
-    state0 = deepcopy(ref.get_state())
     if ref.take_is_valid(move):
+        checkpoint = ref.checkpoint()
         cards = ref._do_take(move)
-        state1 = deepcopy(ref.get_state())
-        ref.set_state(state0)
+        ref.rollback(checkpoint)
         return cards
     else:
         return None
 
-class CardCollection(ABC, Generic[
+class CardCollection(Undoable, ABC, Generic[
     NormalAction, InsertAction, TakeAction,
     CollectionState
 ]):
     def __init__(self):
+        self._undo_log = UndoLog()
         self._listen_action = []
         self._listen_insert = []
         self._listen_take   = []
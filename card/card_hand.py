@@ -64,8 +64,7 @@ class CardHand(CardCollection[
     def _do_insert(self, move: CardHandInsert, card: Card):
         if self.insert_is_valid(move, card):
             move.match(
-                hand_insert = lambda i:
-                    self.cards.insert(i, card)
+                hand_insert = lambda i: self._insert(i, card)
             )
     
     
@@ -80,7 +79,7 @@ class CardHand(CardCollection[
     def _do_take(self, move: CardHandTake) -> List[Card]:
         if self.take_is_valid(move):
             return move.match(
-                hand_take = lambda i: [ self.cards.pop(i) ]
+                hand_take = lambda i: [ self._pop(i) ]
             )
         else:
             return []
@@ -90,4 +89,14 @@ class CardHand(CardCollection[
         return self.cards
     
     def set_state(self, cards: List[Card]):
-        self.cards = cards
+        self._set_recorded('cards', cards)
+
+
+    def _insert(self, i: int, card: Card):
+        self._record(self.cards.pop, (i,), self.cards.insert, (i, card))
+        self.cards.insert(i, card)
+
+    def _pop(self, i: int) -> Card:
+        card = self.cards.pop(i)
+        self._record(self.cards.insert, (i, card), self.cards.pop, (i,))
+        return card
@@ -1,9 +1,9 @@
 from typing import List, Optional
-from random import shuffle
 
 from adt import adt, Case
 
 from card import Card, CardCollection
+from .seeding import RandomLike, make_rng
 
 
 @adt
@@ -34,13 +34,15 @@ class CardStack(CardCollection[
     def __init__(
         self, cards: List[Card],
         can_insert: bool = True, can_take: bool = True,
-        allow_duplicates: bool = False
+        allow_duplicates: bool = False, rng: RandomLike = None
     ):
         super().__init__()
         self.cards = cards
         self.can_insert = can_insert
         self.can_take   = can_take
         self.allow_duplicates = allow_duplicates
+        # What shuffles the cards (see `card.seeding`)
+        self.rng = make_rng(rng)
     
     
     def action_is_valid(self, move: CardStackAction):
@@ -51,8 +53,7 @@ class CardStack(CardCollection[
     def _do(self, move: CardStackAction):
         if self.action_is_valid(move):
             move.match(
-                stack_shuffle = lambda:
-                    shuffle(self.cards)
+                stack_shuffle = lambda: self._shuffle()
             )
     
     
@@ -68,7 +69,7 @@ class CardStack(CardCollection[
         if self.insert_is_valid(move, card):
             move.match(
                 stack_insert_bottom = lambda:
-                    self.cards.append(card)
+                    self._insert(len(self.cards), card)
             )
     
     
@@ -80,7 +81,7 @@ class CardStack(CardCollection[
     def _do_take(self, move: CardStackTake) -> List[Card]:
         if self.take_is_valid(move):
             return move.match(
-                stack_take_top = lambda: [ self.cards.pop(0) ]
+                stack_take_top = lambda: [ self._pop(0) ]
             )
         else:
             return []
@@ -90,4 +91,20 @@ class CardStack(CardCollection[
         return self.cards
     
     def set_state(self, cards):
-        self.cards = cards
+        self._set_recorded('cards', cards)
+
+
+    def _shuffle(self):
+        old_cards = list(self.cards)
+        self.rng.shuffle(self.cards)
+        self._record(self.cards.__setitem__, (slice(None), old_cards),
+                     self.cards.__setitem__, (slice(None), list(self.cards)))
+
+    def _insert(self, i: int, card: Card):
+        self._record(self.cards.pop, (i,), self.cards.insert, (i, card))
+        self.cards.insert(i, card)
+
+    def _pop(self, i: int) -> Card:
+        card = self.cards.pop(i)
+        self._record(self.cards.insert, (i, card), self.cards.pop, (i,))
+        return card
@@ -1,2 +1,2 @@
-from .game import *
-from .rules import *
+from .game import GameState, Game
+from .rules import Action, Insert, Take, Rules
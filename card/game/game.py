@@ -1,7 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Callable, Generic, TypeVar, Type
 
-from card import *
 
 
 GameState = TypeVar('GameState')
@@ -15,17 +14,32 @@ class Game(ABC, Generic[GameState, Rules]):
         self._on_move = []
 
     def do(self, moves):
-        old_state_state = deepcopy(self.state.get_state())
+        if not self._on_move:
+            return self.rules.do(moves, self.state)
+
+        checkpoint = self.state.checkpoint()
         res = self.rules.do(moves, self.state)
         if res:
-            old_state = self.state.__class__.from_state(old_state_state)
+            # Listeners get a snapshot of the state from before the moves,
+            # which they may keep. It is only taken for moves that were done:
+            # the state is wound back to it rather than copied up front.
+            changes = self.state.rollback(checkpoint)
+            try:
+                old_state = self.state.snapshot()
+            finally:
+                self.state.redo(changes)
             for f in self._on_move:
                 f(moves, old_state)
+        else:
+            self.state.commit(checkpoint)
         return res
 
     def is_valid(self, moves):
         return self.rules.move_is_valid(moves, self.state)
 
+    def suggested_moves(self):
+        return self.rules.suggested_moves(self.state)
+
     def moves_for_card(self, i: int):
         return self.rules.moves_for_card(i, self.state)
 
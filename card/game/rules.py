@@ -1,10 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Union
-from copy import deepcopy
+from typing import Generic, List, TypeVar, Union
 
 from adt import adt, Case
 
-from card import *
+from card import Card, CardCollection
 from .game import GameState
 
 
@@ -37,16 +36,16 @@ class Rules(ABC, Generic[Action, Insert, Take, GameState]):
     def move_is_valid(cls, moves: List[Move], state: GameState) -> bool:
         def from_to_valid(take, insert):
             ref_take, take_move = cls.reference(take, state)
-            state0 = deepcopy(ref_take.get_state())
             if not ref_take.take_is_valid(take_move):
                 return None
+            checkpoint = ref_take.checkpoint()
             cards = ref_take._do_take(take_move)
             ref_insert, insert_move = cls.reference(insert, state)
             valid = all(
                 ref_insert.insert_is_valid(insert_move, card)
                 for card in cards
             )
-            ref_take.set_state(state0)
+            ref_take.rollback(checkpoint)
             return valid
 
         def action_valid(action):
@@ -72,6 +71,7 @@ class Rules(ABC, Generic[Action, Insert, Take, GameState]):
             for card in cards:
                 insert_ref, insert_move = cls.reference(insert, state)
                 insert_ref.do_insert(insert_move, card)
+                cls._moved(take, insert, card, state)
 
         def the_action(action):
             action_ref, action_move = cls.reference(action, state)
@@ -89,7 +89,14 @@ class Rules(ABC, Generic[Action, Insert, Take, GameState]):
     def do(cls, move: Move, state: GameState) -> bool:
         pass
 
+    # Called by `_do` for every card it moves
+    @classmethod
+    def _moved(cls, take: Take, insert: Insert, card: Card, state: GameState):
+        pass
+
 
+    # Every move (as a list of moves to pass to `do`) that is legal in the
+    # given state
     @classmethod
     @abstractmethod
-    def suggested_moves(state: GameState): pass
+    def suggested_moves(cls, state: GameState) -> List[List[Move]]: pass
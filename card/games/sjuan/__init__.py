@@ -1,4 +1,18 @@
-from .game import *
-from .rules import *
-from .moves import *
-from .sjuan_card_stack import *
+from .game import NUM_CARDS_TO_TAKE, SjuanGameStatePhase, SjuanGameState, SjuanGame
+from .rules import SjuanRules
+from .moves import SjuanAction, SjuanInsert, SjuanTake
+from .sjuan_card_stack import (
+    SjuanCardStackAction, SjuanCardStackInsert, SjuanCardStackTake, SjuanCardStack,
+    NUM_ROW_STATES, ACE_RANK, SEVEN_RANK, KING_RANK, rank_of, rank_bit, bit_rank,
+    row_state, ROW_LOW, ROW_HIGH, ROW_PLAYABLE, ROW_CARDS, ROW_AFTER_INSERT,
+    playable_mask, stack_mask
+)
+from .engine import (
+    MOVE_SKIP, MOVE_ASK_FOR_CARDS, NUM_MOVES, PHASE_PLAYER_TURN, PHASE_GIVE_CARDS,
+    ALL_CARDS_MASK, EXTRA_TURN_MASK, SjuanEngine
+)
+from .zobrist import (
+    MAX_PLAYERS, HAND_KEYS, STACK_KEYS, TURN_KEYS, GIVE_KEYS, QUEUE_KEY, SKIP_KEY,
+    SUCCUMB_KEY, hands_hash, stack_hash, flags_hash, ReplacementPolicy, TranspositionTable
+)
+from .solver import WIN, DRAW, LOSS, CARDS_BEFORE, SolverResult, SjuanSolver
@@ -0,0 +1,310 @@
+import random
+from typing import List, Optional
+
+from card import (
+    Card, CardValue, CardSuit, CardHandTake, CardHandInsert,
+    card_mask, mask_ids, RandomLike, make_rng
+)
+from .game import SjuanGameState, NUM_CARDS_TO_TAKE
+from .rules import SjuanRules
+from .sjuan_card_stack import (
+    SjuanCardStackInsert, ROW_AFTER_INSERT, playable_mask, stack_mask
+)
+from .moves import SjuanAction, SjuanTake, SjuanInsert
+from .zobrist import (
+    HAND_KEYS, STACK_KEYS, TURN_KEYS, GIVE_KEYS, hands_hash, stack_hash,
+    flags_hash
+)
+
+
+# A headless Sjuan engine with the same rules as `SjuanRules`, but with every
+# hand stored as a bitmask over card ids, the Sjuan stack as the state of each
+# suit row (see `sjuan_card_stack`) and the phase as plain ints. Queue phases are resolved
+# immediately, so the engine is always in either a player's turn or a
+# give-cards phase.
+#
+# Moves are ints: 0-51 plays (or, when giving cards, gives) the card with that
+# id, and the two actions come after.
+
+MOVE_SKIP          = Card.NUM_CARDS
+MOVE_ASK_FOR_CARDS = Card.NUM_CARDS + 1
+NUM_MOVES          = Card.NUM_CARDS + 2
+
+PHASE_PLAYER_TURN = 0
+PHASE_GIVE_CARDS  = 1
+
+ALL_CARDS_MASK = (1 << Card.NUM_CARDS) - 1
+
+# Playing an ace or a king doesn't end the turn
+EXTRA_TURN_MASK = card_mask(
+    Card(suit, value)
+    for suit in CardSuit for value in (CardValue.ACE, CardValue.KING)
+)
+
+
+class SjuanEngine:
+    def __init__(
+        self, num_players: int, cards = None, can_always_skip: bool = True,
+        deal: bool = True, rng: RandomLike = None
+    ):
+        self._num_players     = num_players
+        self._deck            = ALL_CARDS_MASK if cards is None else card_mask(cards)
+        self._can_always_skip = can_always_skip
+        # Deals (see `card.seeding`); copies share it
+        self._rng             = make_rng(rng)
+
+        if deal:
+            self.reset()
+
+    def reset(self, first_player: Optional[int] = None, rng: RandomLike = None):
+        if rng is not None:
+            self._rng = make_rng(rng)
+        deck = mask_ids(self._deck)
+        self._rng.shuffle(deck)
+        hands = [ 0 for i in range(self._num_players) ]
+        for i, card_id in enumerate(deck):
+            hands[i % self._num_players] |= 1 << card_id
+
+        if first_player is None:
+            first_player = self._rng.randint(0, self._num_players - 1)
+        self.set_position(hands, first_player)
+
+    def set_position(
+        self, hands: List[int], turn: int, rows: Optional[List[int]] = None,
+        phase: int = PHASE_PLAYER_TURN, to_give: int = 0,
+        can_skip: Optional[bool] = None, can_succumb: Optional[bool] = None
+    ):
+        self.hands   = list(hands)
+        self.seats   = list(range(len(hands)))
+        self.winners = []
+        # Row states, indexed by `CardSuit.value - 1`
+        self.rows    = [ 0, 0, 0, 0 ] if rows is None else list(rows)
+        self.phase   = phase
+        self.turn    = turn
+        self.to_give = to_give
+        self._turn_change()
+        if can_skip is not None:
+            self.can_skip = can_skip
+        if can_succumb is not None:
+            self.can_succumb = can_succumb
+
+        # Zobrist keys of the cards, kept up to date by `step`
+        self._hands_hash = hands_hash(self.hands)
+        self._stack_hash = stack_hash(self.stack_mask())
+
+    def set_hands(self, hands: List[int]):
+        # Redeal the same number of players' hands, keeping everything else
+        self.hands       = list(hands)
+        self._hands_hash = hands_hash(self.hands)
+
+    @classmethod
+    def from_state(cls, state: SjuanGameState):
+        me = cls(state._num_players, state._cards, state._can_always_skip,
+                 deal = False)
+
+        # Deal out whatever is left in the queue
+        hands = [ card_mask(player.cards) for player in state.players ]
+        queue_cards = list(state.source_stack.cards)
+        for move in state.queue:
+            move.match(
+                the_action = lambda _: None,
+                from_to    = lambda take, insert: insert.match(
+                    sjuan_stack = lambda _: None,
+                    player      = lambda i, _:
+                        hands.__setitem__(i, hands[i] | (1 << queue_cards.pop(0).id))
+                )
+            )
+
+        def inner(phase):
+            return phase.match(
+                do_queue    = inner,
+                player_turn = lambda i:    (PHASE_PLAYER_TURN, i, 0),
+                give_cards  = lambda i, n: (PHASE_GIVE_CARDS,  i, n)
+            )
+        phase, turn, to_give = inner(state.phase)
+        in_queue = state.phase.match(
+            do_queue = lambda _: True, player_turn = lambda _: False,
+            give_cards = lambda _, __: False
+        )
+
+        me.set_position(
+            hands, turn, state.sjuan_stack.row_states, phase, to_give,
+            None if in_queue else bool(state.can_skip),
+            None if in_queue else state.can_succumb
+        )
+        return me
+
+
+    @property
+    def num_players(self) -> int:
+        return len(self.hands)
+
+    @property
+    def can_always_skip(self) -> bool:
+        return self._can_always_skip
+
+    def is_terminal(self) -> bool:
+        return len(self.hands) <= 1
+
+    def playable_mask(self) -> int:
+        return playable_mask(self.rows)
+
+    def stack_mask(self) -> int:
+        return stack_mask(self.rows)
+
+    @property
+    def zobrist(self) -> int:
+        # The same as `SjuanGameState.zobrist` outside of queue phases
+        key = self._hands_hash ^ self._stack_hash ^ TURN_KEYS[self.turn]
+        if self.phase == PHASE_GIVE_CARDS:
+            key ^= GIVE_KEYS[self.to_give]
+        return key ^ flags_hash(self.can_skip, self.can_succumb)
+
+    def legal_moves(self) -> List[int]:
+        if len(self.hands) <= 1:
+            return []
+        hand = self.hands[self.turn]
+        if self.phase == PHASE_GIVE_CARDS:
+            return mask_ids(hand)
+
+        moves = mask_ids(hand & self.playable_mask())
+        if self.can_skip:
+            moves.append(MOVE_SKIP)
+        if self.can_succumb:
+            moves.append(MOVE_ASK_FOR_CARDS)
+        return moves
+
+    def is_legal(self, move: int) -> bool:
+        if len(self.hands) <= 1:
+            return False
+        if move < Card.NUM_CARDS:
+            bit = 1 << move
+            if not self.hands[self.turn] & bit:
+                return False
+            return (self.phase == PHASE_GIVE_CARDS
+                    or bool(self.playable_mask() & bit))
+        elif self.phase == PHASE_GIVE_CARDS:
+            return False
+        elif move == MOVE_SKIP:
+            return bool(self.can_skip)
+        elif move == MOVE_ASK_FOR_CARDS:
+            return self.can_succumb
+        return False
+
+
+    def step(self, move: int) -> bool:
+        if not self.is_legal(move):
+            return False
+
+        i = self.turn
+        if self.phase == PHASE_PLAYER_TURN:
+            if move == MOVE_SKIP:
+                self._next_phase()
+            elif move == MOVE_ASK_FOR_CARDS:
+                self.phase   = PHASE_GIVE_CARDS
+                self.turn    = (i - 1) % len(self.hands)
+                self.to_give = NUM_CARDS_TO_TAKE
+                self._turn_change()
+            else:
+                bit = 1 << move
+                self.hands[i] ^= bit
+                self._hands_hash ^= HAND_KEYS[i][move]
+                self._stack_hash ^= STACK_KEYS[move]
+                self._insert_into_stack(move)
+                if self.hands[i] == 0:
+                    self._player_won(i)
+                if bit & EXTRA_TURN_MASK:
+                    self.can_skip    = True
+                    self.can_succumb = False
+                else:
+                    self._next_phase()
+        else:
+            bit = 1 << move
+            self.hands[i] ^= bit
+            receiver = (i + 1) % len(self.hands)
+            self.hands[receiver] |= bit
+            self._hands_hash ^= HAND_KEYS[i][move] ^ HAND_KEYS[receiver][move]
+            if self.hands[i] == 0:
+                self._player_won(i)
+                # That ends the giving; the player who asked is in the
+                # giver's seat now, and loses their turn
+                self.phase   = PHASE_PLAYER_TURN
+                self.to_give = 0
+            self._next_phase()
+
+        return True
+
+    def _insert_into_stack(self, card_id: int):
+        s = card_id // 13
+        self.rows[s] = ROW_AFTER_INSERT[self.rows[s]][card_id % 13]
+
+
+    def _turn_change(self):
+        self.can_skip    = self._can_always_skip
+        self.can_succumb = self.phase == PHASE_PLAYER_TURN
+
+    def _next_phase(self):
+        n = len(self.hands)
+        if n <= 1:
+            return
+        if self.phase == PHASE_PLAYER_TURN:
+            self.turn = (self.turn + 1) % n
+        elif self.to_give - 1 > 0:
+            self.to_give -= 1
+        else:
+            # The player who asked for cards loses their turn
+            self.phase   = PHASE_PLAYER_TURN
+            self.turn    = (self.turn + 2) % n
+            self.to_give = 0
+        self._turn_change()
+
+    def _player_won(self, i: int):
+        self.hands.pop(i)
+        self.winners.append(self.seats.pop(i))
+        # Everyone after the winner has moved down a seat
+        self._hands_hash = hands_hash(self.hands)
+        if self.turn > i:
+            self.turn -= 1
+        if len(self.hands) > 0:
+            self.turn %= len(self.hands)
+        self._turn_change()
+
+
+    def copy(self):
+        other = object.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other.hands   = list(self.hands)
+        other.seats   = list(self.seats)
+        other.winners = list(self.winners)
+        other.rows    = list(self.rows)
+        return other
+
+    def __getstate__(self):
+        # The global `random` module can't be pickled, so it goes as None,
+        # which stands for it (see `card.seeding`)
+        state = dict(self.__dict__)
+        if state['_rng'] is random:
+            state['_rng'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._rng = make_rng(self._rng)
+
+    def to_move(self, move: int, state: SjuanGameState) -> SjuanRules.Move:
+        # The equivalent move in a `SjuanGame` that is in the same position
+        if move == MOVE_SKIP:
+            return SjuanRules.Move.THE_ACTION(SjuanAction.SKIP())
+        if move == MOVE_ASK_FOR_CARDS:
+            return SjuanRules.Move.THE_ACTION(SjuanAction.ASK_FOR_CARDS())
+
+        i = state.turn_index()
+        take = SjuanTake.MYSELF(CardHandTake.HAND_TAKE(
+            state.players[i].cards.index(Card.from_id(move))
+        ))
+        if self.phase == PHASE_GIVE_CARDS:
+            insert = SjuanInsert.PLAYER(state.turn_incr(i, 1),
+                                        CardHandInsert.HAND_INSERT(0))
+        else:
+            insert = SjuanInsert.SJUAN_STACK(SjuanCardStackInsert.SJUAN_INSERT())
+        return SjuanRules.Move.FROM_TO(take, insert)
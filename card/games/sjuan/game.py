@@ -1,14 +1,16 @@
-import random
 from collections import deque
-from typing import Any
-from copy import deepcopy
+from typing import Any, Callable, Optional
 
 from adt import adt, Case
 
-from card import *
+from card import (
+    CardHand, CardHandInsert, CardStack, CardStackAction, CardStackTake,
+    UndoLog, Undoable, card_mask, RandomLike, make_rng
+)
 from card.game import Game
-from .sjuan_card_stack import *
-from .moves import *
+from .sjuan_card_stack import SjuanCardStack
+from .moves import SjuanInsert, SjuanTake
+from . import zobrist
 from lib import const, do_nothing
 
 
@@ -35,11 +37,17 @@ class SjuanGameStatePhase:
                 else SjuanGameStatePhase.PLAYER_TURN(i + 1).next(num_players)
         )
 
-class SjuanGameState:
-    def __init__(self, cards, num_players: int, can_always_skip: bool = True):
+class SjuanGameState(Undoable):
+    def __init__(
+        self, cards, num_players: int, can_always_skip: bool = True,
+        rng: RandomLike = None
+    ):
+        self._undo_log        = UndoLog()
         self._cards           = cards
         self._num_players     = num_players
         self._can_always_skip = can_always_skip
+        # Deals and picks who starts (see `card.seeding`)
+        self._rng             = make_rng(rng)
 
         self._on_turn_change        = []
         self._on_skippable_change   = []
@@ -48,10 +56,14 @@ class SjuanGameState:
 
         self.reset()
 
-    def reset(self):
+    def reset(self, rng: RandomLike = None):
+        # A new `rng` replaces the one the state was made with, so a seed
+        # deals the same game again
+        if rng is not None:
+            self._rng = make_rng(rng)
         self.queue = deque()
 
-        first_player = random.randint(0, self._num_players - 1)
+        first_player = self._rng.randint(0, self._num_players - 1)
         self.phase = SjuanGameStatePhase.DO_QUEUE(
             SjuanGameStatePhase.PLAYER_TURN(first_player)
         )
@@ -61,8 +73,9 @@ class SjuanGameState:
         ]
         self.sjuan_stack = SjuanCardStack()
 
-        all_cards = deepcopy(self._cards)
-        self.source_stack = CardStack(all_cards)
+        all_cards = list(self._cards)
+        self.source_stack = CardStack(all_cards, rng = self._rng)
+        self.share_undo_log(*self.players, self.sjuan_stack, self.source_stack)
         self.source_stack.do(CardStackAction.STACK_SHUFFLE())
 
         for i, card in enumerate(all_cards):
@@ -74,6 +87,8 @@ class SjuanGameState:
         self._can_skip    = None
         self._can_succumb = True
 
+        self.zobrist = self._full_zobrist()
+
 
     def get_state(self):
         return { 'cards': self._cards, 'num_players': self._num_players, 'can_always_skip': self._can_always_skip,
@@ -84,9 +99,9 @@ class SjuanGameState:
                  'can_skip': self._can_skip, 'can_succumb': self._can_succumb }
 
     @classmethod
-    def from_state(cls, state):
-        me = SjuanGameState(state['cards'], state['num_players'], state['can_always_skip'])
-        me.queue = state['queue']
+    def from_state(cls, state, rng: RandomLike = None):
+        me = SjuanGameState(state['cards'], state['num_players'], state['can_always_skip'], rng)
+        me.queue = deque(state['queue'])
         me.phase = state['phase']
         for i, player in enumerate(me.players):
             player.set_state(state['players'][i])
@@ -94,6 +109,38 @@ class SjuanGameState:
         me.source_stack.set_state(state['source_stack'])
         me._can_skip = state['can_skip']
         me._can_succumb = state['can_succumb']
+        me.zobrist = me._full_zobrist()
+        return me
+
+    def snapshot(self):
+        # A copy that shares nothing that changes with this state, without
+        # dealing a game first as `from_state` does. It has no listeners, and
+        # draws from the global random module.
+        me = SjuanGameState.__new__(SjuanGameState)
+        me._undo_log        = UndoLog()
+        me._cards           = self._cards
+        me._num_players     = self._num_players
+        me._can_always_skip = self._can_always_skip
+        me._rng             = make_rng(None)
+
+        me._on_turn_change        = []
+        me._on_skippable_change   = []
+        me._on_succumbable_change = []
+        me._on_win                = []
+
+        me.queue = deque(self.queue)
+        me.phase = self.phase
+        me.players = [ CardHand(list(player.cards)) for player in self.players ]
+        me.sjuan_stack = SjuanCardStack()
+        me.sjuan_stack.set_state({
+            suit: list(row) for suit, row in self.sjuan_stack.get_state().items()
+        })
+        me.source_stack = CardStack(list(self.source_stack.cards), rng = me._rng)
+        me.share_undo_log(*me.players, me.sjuan_stack, me.source_stack)
+
+        me._can_skip    = self._can_skip
+        me._can_succumb = self._can_succumb
+        me.zobrist      = self.zobrist
         return me
 
     @property
@@ -103,7 +150,9 @@ class SjuanGameState:
     @can_skip.setter
     def can_skip(self, can_skip):
         if can_skip != self._can_skip:
-            self._can_skip = can_skip
+            self.update_zobrist(zobrist.flags_hash(self._can_skip, False)
+                                ^ zobrist.flags_hash(can_skip, False))
+            self._set_recorded('_can_skip', can_skip)
             self.event(self._on_skippable_change, can_skip)
 
     @property
@@ -113,7 +162,9 @@ class SjuanGameState:
     @can_succumb.setter
     def can_succumb(self, can_succumb):
         if can_succumb != self._can_succumb:
-            self._can_succumb = can_succumb
+            self.update_zobrist(zobrist.flags_hash(False, self._can_succumb)
+                                ^ zobrist.flags_hash(False, can_succumb))
+            self._set_recorded('_can_succumb', can_succumb)
             self.event(self._on_succumbable_change, can_succumb)
 
 
@@ -131,6 +182,31 @@ class SjuanGameState:
         return self.turn_index_(self.phase)
 
 
+    # Zobrist hash of the position, kept up to date as the state changes
+    def update_zobrist(self, key: int):
+        self._set_recorded('zobrist', self.zobrist ^ key)
+
+    def _phase_zobrist(self, phase):
+        return phase.match(
+            do_queue    = lambda p:    zobrist.QUEUE_KEY ^ self._phase_zobrist(p),
+            player_turn = lambda i:    zobrist.TURN_KEYS[i],
+            give_cards  = lambda i, n: zobrist.TURN_KEYS[i] ^ zobrist.GIVE_KEYS[n]
+        )
+
+    def _full_zobrist(self):
+        return (zobrist.hands_hash([ card_mask(p.cards) for p in self.players ])
+              ^ zobrist.stack_hash(card_mask(
+                    card for row in self.sjuan_stack.cards.values() for card in row
+                ))
+              ^ self._phase_zobrist(self.phase)
+              ^ zobrist.flags_hash(self._can_skip, self._can_succumb))
+
+    def _set_phase(self, phase):
+        self.update_zobrist(self._phase_zobrist(self.phase)
+                            ^ self._phase_zobrist(phase))
+        self._set_recorded('phase', phase)
+
+
     def _turn_change(self, old_phase):
         self.can_skip = self._can_always_skip
         self.can_succumb = self.phase.match(
@@ -141,38 +217,50 @@ class SjuanGameState:
         self.event(self._on_turn_change, old_phase, self.phase, False)
 
     def next_phase(self):
-        old_phase = deepcopy(self.phase)
-        self.phase = self.phase.next(len(self.players))
+        old_phase = self.phase
+        self._set_phase(self.phase.next(len(self.players)))
         self._turn_change(old_phase)
 
     def ask_for_cards(self):
-        old_phase = deepcopy(self.phase)
+        old_phase = self.phase
         i = self.turn_index()
-        self.phase = SjuanGameStatePhase.DO_QUEUE(
+        self._set_phase(SjuanGameStatePhase.DO_QUEUE(
             SjuanGameStatePhase.GIVE_CARDS(self.turn_incr(i, -1),
                                            NUM_CARDS_TO_TAKE)
-        )
+        ))
         self._turn_change(old_phase)
 
+    def pop_queue(self):
+        move = self.queue.popleft()
+        self._record(self.queue.appendleft, (move,), self.queue.popleft, ())
+        return move
+
 
     def player_won(self, i: int):
         self.remove_player(i)
         self.event(self._on_win, i)
 
     def remove_player(self, i: int):
-        self.players.pop(i)
-        old_phase = deepcopy(self.phase)
+        player = self.players.pop(i)
+        self._record(self.players.insert, (i, player), self.players.pop, (i,))
+        old_phase = self.phase
 
         def adjusted_phase(phase):
-            return self.phase.match(
+            return phase.match(
                 do_queue = lambda p:
                     SjuanGameStatePhase.DO_QUEUE(adjusted_phase(p)),
                 player_turn = lambda j:
                     SjuanGameStatePhase.PLAYER_TURN(j - 1 if j > i else j),
+                # A giver who gave away their last card ends the giving, as
+                # if it was their last card to give: the player who asked,
+                # now in their seat, loses their turn
                 give_cards = lambda j, n:
-                    SjuanGameStatePhase.GIVE_CARDS(j - 1 if j > i else j, n)
+                    SjuanGameStatePhase.GIVE_CARDS(j - 1 if j > i else j, n) if j != i
+                    else SjuanGameStatePhase.PLAYER_TURN(i % len(self.players))
             )
-        self.phase = adjusted_phase(self.phase)
+        self._set_recorded('phase', adjusted_phase(self.phase))
+        # Everyone after the winner has moved down a seat
+        self._set_recorded('zobrist', self._full_zobrist())
 
         self._turn_change(old_phase)
 
@@ -209,13 +297,16 @@ class SjuanGameState:
 from .rules import SjuanRules
 
 class SjuanGame(Game[SjuanGameState, SjuanRules]):
-    def __init__(self, num_players: int, cards = None, player_names = None):
+    def __init__(
+        self, num_players: int, cards = None, player_names = None,
+        rng: RandomLike = None
+    ):
         super().__init__()
         self._rules = SjuanRules
         self._num_players = num_players
         self._player_names = player_names
         self._cards = cards
-        self._state = SjuanGameState(self._cards, self._num_players)
+        self._state = SjuanGameState(self._cards, self._num_players, rng = rng)
 
     @property
     def player_names(self):
@@ -238,5 +329,5 @@ class SjuanGame(Game[SjuanGameState, SjuanRules]):
         return self._player_types
 
 
-    def reset(self):
-        self._state.reset()
+    def reset(self, rng: RandomLike = None):
+        self._state.reset(rng)
@@ -1,5 +1,7 @@
-from card import *
-from .sjuan_card_stack import *
+from adt import adt, Case
+
+from card import CardHandInsert, CardHandTake, CardStackTake
+from .sjuan_card_stack import SjuanCardStackInsert
 
 
 @adt
@@ -1,18 +1,20 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from collections import deque
 from recordclass import RecordClass
-from typing import Generic, TypeVar, NamedTuple, Union, Any, Optional, Callable
+from typing import Generic, TypeVar, NamedTuple, Union, Any, Optional, Callable, List, Tuple
 from itertools import islice
 
 from adt import adt, Case
 
-from lib import *
-from card import *
+from lib import const, do_nothing
+from card import (
+    Card, CardCollection, CardHandInsert, CardHandTake, CardValue, try_take
+)
 from card.game import GameState, Rules
 from .game import SjuanGameState
-from .sjuan_card_stack import *
-from .moves import *
+from . import zobrist
+from .sjuan_card_stack import SjuanCardStackInsert
+from .moves import SjuanAction, SjuanInsert, SjuanTake
 
 
 class SjuanRules(Rules[
@@ -154,7 +156,7 @@ class SjuanRules(Rules[
 
         info = state.phase.match(
           do_queue = lambda _: SjuanRules.MoveInfo(
-            is_valid  = deque(islice(state.queue, 0, len(moves))) == moves,
+            is_valid  = list(islice(state.queue, 0, len(moves))) == list(moves),
             ends_turn = len(state.queue) == len(moves)
           ),
           player_turn = lambda i:    player_turn(i),
@@ -199,7 +201,7 @@ class SjuanRules(Rules[
 
         state.phase.match(
             do_queue = lambda _: do_moves(
-                after_each = state.queue.popleft, at_end = finish_turn
+                after_each = state.pop_queue, at_end = finish_turn
             ),
             player_turn = lambda _: do_moves(
                 at_end = finish_turn
@@ -213,7 +215,62 @@ class SjuanRules(Rules[
 
 
     @classmethod
-    def suggested_moves(cls): pass
+    def _moved(
+        cls, take: SjuanTake, insert: SjuanInsert, card: Card,
+        state: SjuanGameState
+    ):
+        state.update_zobrist(take.match(
+            src_stack = const(0),
+            myself    = lambda _: zobrist.HAND_KEYS[state.turn_index()][card.id]
+        ) ^ insert.match(
+            sjuan_stack = lambda _:    zobrist.STACK_KEYS[card.id],
+            player      = lambda i, _: zobrist.HAND_KEYS[i][card.id]
+        ))
+
+    @classmethod
+    def suggested_moves(
+        cls, state: SjuanGameState
+    ) -> List[List[SjuanRules.Move]]:
+        # All legal moves, built straight from the hand and the cards the
+        # stack's rows can take. Rearranging one's own hand is always legal and
+        # is left out.
+        def do_queue(_):
+            return [ list(state.queue) ]
+
+        def player_turn(i):
+            playable = state.sjuan_stack.playable_mask()
+            insert   = SjuanInsert.SJUAN_STACK(SjuanCardStackInsert.SJUAN_INSERT())
+            moves = [
+                [ SjuanRules.Move.FROM_TO(
+                    SjuanTake.MYSELF(CardHandTake.HAND_TAKE(j)), insert
+                ) ]
+                for j, card in enumerate(state.players[i].cards)
+                if (playable >> card.id) & 1
+            ]
+            if state.can_skip:
+                moves.append([ SjuanRules.Move.THE_ACTION(SjuanAction.SKIP()) ])
+            if state.can_succumb:
+                moves.append([
+                    SjuanRules.Move.THE_ACTION(SjuanAction.ASK_FOR_CARDS())
+                ])
+            return moves
+
+        def give_cards(i, n):
+            insert = SjuanInsert.PLAYER(
+                state.turn_incr(i, 1), CardHandInsert.HAND_INSERT(0)
+            )
+            return [
+                [ SjuanRules.Move.FROM_TO(
+                    SjuanTake.MYSELF(CardHandTake.HAND_TAKE(j)), insert
+                ) ]
+                for j in range(len(state.players[i].cards))
+            ]
+
+        return state.phase.match(
+            do_queue    = do_queue,
+            player_turn = player_turn,
+            give_cards  = give_cards
+        )
 
     @classmethod
     def moves_for_card(cls, i: int, state: SjuanGameState):
@@ -236,25 +293,24 @@ class SjuanRules(Rules[
                     curr_player_i, CardHandInsert.HAND_INSERT(j)
                 ))
 
-            def player_turn():
-                # Inserts into stack
-                card = curr_player.cards[i]
-                move = SjuanCardStackInsert.SJUAN_INSERT()
-                if state.sjuan_stack.insert_is_valid(move, card):
-                    add_move(SjuanInsert.SJUAN_STACK(move))
-
-            def give_cards():
-                # Inserts into next player's hands
-                next_player_i = state.turn_incr(curr_player_i, 1)
-                add_move(SjuanInsert.PLAYER(
-                    next_player_i, CardHandInsert.HAND_INSERT(0)
+        def player_turn():
+            # Inserts into stack
+            if (state.sjuan_stack.playable_mask() >> curr_player.cards[i].id) & 1:
+                add_move(SjuanInsert.SJUAN_STACK(
+                    SjuanCardStackInsert.SJUAN_INSERT()
                 ))
 
-            state.phase.match(
-                do_queue    = do_nothing,
-                player_turn = lambda _: player_turn(),
-                give_cards  = lambda _, __: give_cards()
-            )
+        def give_cards():
+            # Inserts into next player's hands
+            next_player_i = state.turn_incr(curr_player_i, 1)
+            add_move(SjuanInsert.PLAYER(
+                next_player_i, CardHandInsert.HAND_INSERT(0)
+            ))
 
+        state.phase.match(
+            do_queue    = do_nothing,
+            player_turn = lambda _: player_turn(),
+            give_cards  = lambda _, __: give_cards()
+        )
 
         return moves
@@ -1,9 +1,8 @@
 from typing import List, Dict
-from copy import deepcopy
 
 from adt import adt, Case
 
-from card import Card, CardValue, CardSuit, CardCollection
+from card import Card, CardValue, CardSuit, CardCollection, mask_cards
 
 
 @adt
@@ -23,6 +22,88 @@ class SjuanCardStackTake:
 
 
 
+# Each suit's row in the stack is in one of 50 states: empty (state 0), or
+# running from rank `low` up to rank `high`, where aces are rank 1 and every
+# row starts at 7. Everything about a row that matters to the rules is
+# precomputed per state.
+NUM_ROW_STATES = 50
+
+ACE_RANK   = 1
+SEVEN_RANK = 7
+KING_RANK  = 13
+
+def rank_of(value: CardValue) -> int:
+    return value.adj_value(aces_lowest = True)
+
+# Position of a rank within a suit's 13 card ids, and back
+def rank_bit(rank: int) -> int:
+    return 12 if rank == ACE_RANK else rank - 2
+
+def bit_rank(bit: int) -> int:
+    return ACE_RANK if bit == 12 else bit + 2
+
+def row_state(low: int, high: int) -> int:
+    if low == 0:
+        return 0
+    return 1 + (low - 1) * 7 + (high - SEVEN_RANK)
+
+ROW_LOW  = [ 0 ] + [ low  for low in range(1, 8) for high in range(7, 14) ]
+ROW_HIGH = [ 0 ] + [ high for low in range(1, 8) for high in range(7, 14) ]
+
+def _row_playable_ranks(state: int) -> List[int]:
+    if state == 0:
+        return [ SEVEN_RANK ]
+    ranks = []
+    if ROW_LOW[state] != ACE_RANK:
+        ranks.append(ROW_LOW[state] - 1)
+    if ROW_HIGH[state] != KING_RANK:
+        ranks.append(ROW_HIGH[state] + 1)
+    return ranks
+
+# ROW_PLAYABLE[suit index][state]: mask (over card ids) of the cards that can
+# go on that row
+ROW_PLAYABLE = [
+    [
+        sum(1 << (s * 13 + rank_bit(rank)) for rank in _row_playable_ranks(state))
+        for state in range(NUM_ROW_STATES)
+    ]
+    for s in range(len(CardSuit))
+]
+
+# ROW_CARDS[suit index][state]: mask of the cards on the row
+ROW_CARDS = [
+    [
+        0 if state == 0 else sum(
+            1 << (s * 13 + rank_bit(rank))
+            for rank in range(ROW_LOW[state], ROW_HIGH[state] + 1)
+        )
+        for state in range(NUM_ROW_STATES)
+    ]
+    for s in range(len(CardSuit))
+]
+
+# ROW_AFTER_INSERT[state][rank bit]: the state after a (playable) card goes on
+# the row
+ROW_AFTER_INSERT = [
+    [
+        row_state(bit_rank(bit), bit_rank(bit)) if state == 0
+        else (row_state(bit_rank(bit), ROW_HIGH[state])
+              if bit_rank(bit) < ROW_LOW[state]
+              else row_state(ROW_LOW[state], bit_rank(bit)))
+        for bit in range(13)
+    ]
+    for state in range(NUM_ROW_STATES)
+]
+
+def playable_mask(row_states: List[int]) -> int:
+    return (ROW_PLAYABLE[0][row_states[0]] | ROW_PLAYABLE[1][row_states[1]]
+          | ROW_PLAYABLE[2][row_states[2]] | ROW_PLAYABLE[3][row_states[3]])
+
+def stack_mask(row_states: List[int]) -> int:
+    return (ROW_CARDS[0][row_states[0]] | ROW_CARDS[1][row_states[1]]
+          | ROW_CARDS[2][row_states[2]] | ROW_CARDS[3][row_states[3]])
+
+
 class SjuanCardStack(CardCollection[
     SjuanCardStackAction, SjuanCardStackInsert, SjuanCardStackTake,
     Dict[CardSuit, List[Card]]
@@ -30,6 +111,8 @@ class SjuanCardStack(CardCollection[
     def __init__(self):
         super().__init__()
         self._cards: Dict[CardSuit, List[Card]] = {}
+        # Indexed by `CardSuit.value - 1`
+        self._row_states = [ 0, 0, 0, 0 ]
 
     def action_is_valid(self, move): pass
     def _do(self, move): pass
@@ -40,34 +123,61 @@ class SjuanCardStack(CardCollection[
     def cards(self):
         return self._cards
 
+    @property
+    def row_states(self) -> List[int]:
+        return self._row_states
+
+
+    def playable_mask(self) -> int:
+        return playable_mask(self._row_states)
+
+    def playable_cards(self) -> List[Card]:
+        return mask_cards(self.playable_mask())
+
+    def stack_mask(self) -> int:
+        return stack_mask(self._row_states)
 
     def insert_is_valid(self, move: SjuanCardStackInsert, card: Card) -> bool:
-        try:
-            row = self._cards[card.suit]
-            lowest = row[0].value
-            highest = row[-1].value
-            res = ((lowest  != CardValue.ACE  and card.value == lowest  - 1)
-                or (highest != CardValue.KING and card.value == highest + 1))
-            return res
-        except KeyError:
-            res = (card.value == CardValue.SEVEN)
-            return res
-
-    def _do_insert(self, move: SjuanCardStackInsert, card_: Card):
-        card = deepcopy(card_)
-        try:
+        return bool((self.playable_mask() >> card.id) & 1)
+
+    def _do_insert(self, move: SjuanCardStackInsert, card: Card):
+        if not self.insert_is_valid(move, card):
+            return
+
+        s = card.id // 13
+        state = self._row_states[s]
+        self._set_row_state(s, ROW_AFTER_INSERT[state][card.id % 13])
+        if state == 0:
+            row = [card]
+            self._record(self._cards.pop, (card.suit,),
+                         self._cards.__setitem__, (card.suit, row))
+            self._cards[card.suit] = row
+        else:
             row = self._cards[card.suit]
-            if row[0].value - 1 == card.value:
-                row.insert(0, card)
-            elif row[-1].value + 1 == card.value:
-                row.append(card)
-        except KeyError:
-            if card.value == CardValue.SEVEN:
-                self._cards[card.suit] = [card]
+            if rank_of(card.value) < ROW_LOW[state]:
+                self._insert(row, 0, card)
+            else:
+                self._insert(row, len(row), card)
 
 
     def get_state(self):
         return self._cards
 
     def set_state(self, cards):
-        self._cards = cards
+        self._set_recorded('_cards', cards)
+        row_states = [ 0, 0, 0, 0 ]
+        for suit, row in cards.items():
+            ranks = [ rank_of(card.value) for card in row ]
+            row_states[suit.value - 1] = row_state(min(ranks), max(ranks))
+        self._set_recorded('_row_states', row_states)
+
+
+    def _insert(self, row: List[Card], i: int, card: Card):
+        self._record(row.pop, (i,), row.insert, (i, card))
+        row.insert(i, card)
+
+    def _set_row_state(self, s: int, state: int):
+        row_states = self._row_states
+        self._record(row_states.__setitem__, (s, row_states[s]),
+                     row_states.__setitem__, (s, state))
+        row_states[s] = state
@@ -0,0 +1,218 @@
+from itertools import combinations
+from typing import Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from card import Card, mask_ids
+from .game import SjuanGameState
+from .engine import SjuanEngine, MOVE_SKIP, PHASE_GIVE_CARDS, EXTRA_TURN_MASK
+from .sjuan_card_stack import SEVEN_RANK, rank_bit, bit_rank
+from .zobrist import TranspositionTable
+
+
+# An exact solver for two-player Sjuan positions where both hands are known.
+#
+# Values are 1 if the player to move can force a win, -1 if the other player
+# can, and 0 if neither can, so that with best play the game never ends.
+#
+# With `can_always_skip`, as in the usual rules, the value of a player's turn
+# follows from the hands alone. A card can only go on the stack once every
+# card between it and its row's 7 (and the 7) has; call a hand self-sufficient
+# if all of those are either on the stack or in the hand.
+#  - A player whose hand isn't can't win: the other player holds a card they
+#    need (or it's out of the game), and can skip for ever without giving it
+#    away, as whoever gives cards picks which.
+#  - If only one player's hand is, that player wins: they play the cards the
+#    other player needs last, and when asked for cards give away the ones at
+#    the ends of their rows.
+#  - If both are, they have no rows in common, and it's a race: the player to
+#    move wins if they need no more turns than the other to play out their
+#    hand. Asking for cards only ever helps the player asked.
+# All that is searched is which cards to give, and the best move is picked by
+# the values of the positions one move on, trying card plays first so that a
+# winning player keeps getting closer to winning.
+#
+# Without `can_always_skip`, positions are searched with alpha-beta all the
+# way to the end of the game, and one that comes up again on the way counts
+# as a draw. That is just as exact, but takes far longer.
+#
+# Searched positions are memoised by their Zobrist hash.
+
+WIN  =  1
+DRAW =  0
+LOSS = -1
+
+_EXACT = 0
+_LOWER = 1
+_UPPER = 2
+
+def _cards_before(card_id: int) -> int:
+    s, bit = divmod(card_id, 13)
+    rank = bit_rank(bit)
+    if rank > SEVEN_RANK:
+        ranks = range(SEVEN_RANK, rank)
+    else:
+        ranks = range(rank + 1, SEVEN_RANK + 1)
+    return sum(1 << (s * 13 + rank_bit(r)) for r in ranks)
+
+# CARDS_BEFORE[card id]: mask of the cards that go on the stack before it
+CARDS_BEFORE = [ _cards_before(i) for i in range(Card.NUM_CARDS) ]
+
+def _cards_needed(hand: int) -> int:
+    # Every card that goes on the stack before some card in `hand`
+    needed = 0
+    while hand:
+        low = hand & -hand
+        needed |= CARDS_BEFORE[low.bit_length() - 1]
+        hand ^= low
+    return needed
+
+def _turns_to_play_out(hand: int, needed: int) -> int:
+    # Turns, counting the current one, a player needs to play out a
+    # self-sufficient hand on their own: one per card that ends the turn, with
+    # aces and kings played on the side. The last turn can't end with a card
+    # an ace or a king in the hand comes after, so if every card at the end of
+    # a row is an ace or a king, they take a turn of their own.
+    others = hand & ~EXTRA_TURN_MASK
+    if not others:
+        return 1
+    return bin(others).count('1') + (0 if others & ~needed else 1)
+
+
+class SolverResult(NamedTuple):
+    value: int
+    # None if the game is already over
+    move: Optional[int]
+
+
+class SjuanSolver:
+    def __init__(self, table: Optional[TranspositionTable] = None):
+        # The table can be shared between solvers, and kept between calls. It
+        # only needs to be big for solving without `can_always_skip`.
+        self.table = TranspositionTable(size_log2 = 16) if table is None else table
+        self.nodes = 0
+
+    def solve(self, engine: SjuanEngine) -> SolverResult:
+        if engine.num_players != 2:
+            raise ValueError(f"Can only solve two-player positions, got {engine.num_players} players")
+        if engine.is_terminal():
+            return SolverResult(LOSS, None)
+
+        value, move, _ = self._expand(engine, LOSS, WIN, set())
+        # Values are searched for as seen by player 0
+        return SolverResult(value if engine.turn == 0 else -value, move)
+
+    def solve_state(self, state: SjuanGameState) -> SolverResult:
+        # The best move is given as an ordinary `SjuanRules.Move`
+        engine = SjuanEngine.from_state(state)
+        value, move = self.solve(engine)
+        return SolverResult(value, None if move is None else engine.to_move(move, state))
+
+    def best_move(self, engine: SjuanEngine) -> Optional[int]:
+        return self.solve(engine).move
+
+
+    def _value(self, engine: SjuanEngine) -> Optional[int]:
+        # The value for player 0 of a player's turn, if it follows from the
+        # hands (see the top)
+        if engine.phase == PHASE_GIVE_CARDS or not engine.can_always_skip:
+            return None
+        stack  = engine.stack_mask()
+        hands  = engine.hands
+        needed = [ _cards_needed(hand) for hand in hands ]
+        enough = [ not (need & ~stack & ~hand) for hand, need in zip(hands, needed) ]
+        if enough[0] and enough[1]:
+            turns = [ _turns_to_play_out(hand, need) for hand, need in zip(hands, needed) ]
+            i = engine.turn
+            winner = i if turns[i] <= turns[1 - i] else 1 - i
+            return WIN if winner == 0 else LOSS
+        if enough[0]:
+            return WIN
+        if enough[1]:
+            return LOSS
+        return DRAW
+
+    def _search(self, engine: SjuanEngine, alpha: int, beta: int, path: Set[int]):
+        # Returns (value for player 0, best move, whether the value depends on
+        # a position on `path` coming up again, in which case it isn't kept)
+        if engine.is_terminal():
+            return (WIN if engine.winners[0] == 0 else LOSS), None, False
+        value = self._value(engine)
+        if value is not None:
+            return value, None, False
+
+        key = engine.zobrist
+        if key in path:
+            return DRAW, None, True
+        entry = self.table.get(key)
+        if entry is not None:
+            _, (bound, value, move) = entry
+            if (bound == _EXACT or bound == _LOWER and value >= beta
+                    or bound == _UPPER and value <= alpha):
+                return value, move, False
+        return self._expand(engine, alpha, beta, path)
+
+    def _expand(self, engine: SjuanEngine, alpha: int, beta: int, path: Set[int]):
+        self.nodes += 1
+        key = engine.zobrist
+        path.add(key)
+
+        maximising = engine.turn == 0
+        alpha0, beta0 = alpha, beta
+        best, best_move = (LOSS - 1, None) if maximising else (WIN + 1, None)
+        repeated = False
+        for move, child in self._children(engine):
+            value, _, child_repeated = self._search(child, alpha, beta, path)
+            repeated = repeated or child_repeated
+
+            if value > best if maximising else value < best:
+                best, best_move = value, move
+            if maximising:
+                alpha = max(alpha, best)
+            else:
+                beta = min(beta, best)
+            if alpha >= beta:
+                break
+        path.discard(key)
+
+        if not repeated:
+            # What was found is a bound on one side if the search was cut off
+            # or failed, and is exact otherwise
+            if best <= alpha0:
+                bound = _UPPER
+            elif best >= beta0:
+                bound = _LOWER
+            else:
+                bound = _EXACT
+            depth = sum(bin(hand).count('1') for hand in engine.hands)
+            self.table.put(key, (bound, best, best_move), depth)
+        return best, best_move, repeated
+
+    def _children(self, engine: SjuanEngine) -> Iterator[Tuple[int, SjuanEngine]]:
+        # (move, position after it) for each choice, in the order to try them
+        if engine.phase != PHASE_GIVE_CARDS:
+            for move in self._ordered_moves(engine):
+                child = engine.copy()
+                child.step(move)
+                yield move, child
+            return
+
+        # The cards given make one choice, as the order they're given in makes
+        # no difference; its move is the first of them. Cards the giver doesn't
+        # need to get others on the stack first, then those the receiver can't
+        # play right away.
+        hand = engine.hands[engine.turn]
+        needed = _cards_needed(hand)
+        playable = engine.playable_mask()
+        cards = sorted(mask_ids(hand), key = lambda card:
+            (bool(needed & (1 << card)), bool(playable & (1 << card))))
+        for given in combinations(cards, min(engine.to_give, len(cards))):
+            child = engine.copy()
+            for card in given:
+                child.step(card)
+            yield given[0], child
+
+    def _ordered_moves(self, engine: SjuanEngine) -> List[int]:
+        # Aces and kings first as they keep the turn, asking for cards last
+        return sorted(engine.legal_moves(), key = lambda move:
+            0 if move < MOVE_SKIP and (1 << move) & EXTRA_TURN_MASK else
+            1 if move < MOVE_SKIP else
+            2 if move == MOVE_SKIP else 3)
@@ -0,0 +1,127 @@
+import random
+from enum import Enum, auto
+from typing import Any, List, Optional, Tuple
+
+from card import Card
+
+
+# Zobrist keys for Sjuan positions: a position's hash is the XOR of the keys
+# of every card in a hand (per player) or on the stack, of whose turn it is,
+# of how many cards are left to give and of the skip/succumb flags. The keys
+# are fixed, so hashes agree between processes.
+
+MAX_PLAYERS = 8
+
+_rng = random.Random(0x5A7E)
+def _key() -> int:
+    return _rng.getrandbits(64)
+
+HAND_KEYS  = [ [ _key() for i in range(Card.NUM_CARDS) ] for p in range(MAX_PLAYERS) ]
+STACK_KEYS = [ _key() for i in range(Card.NUM_CARDS) ]
+TURN_KEYS  = [ _key() for p in range(MAX_PLAYERS) ]
+GIVE_KEYS  = [ _key() for n in range(Card.NUM_CARDS + 1) ]
+QUEUE_KEY   = _key()
+SKIP_KEY    = _key()
+SUCCUMB_KEY = _key()
+
+def hands_hash(hands: List[int]) -> int:
+    # From hand masks
+    key = 0
+    for p, hand in enumerate(hands):
+        keys = HAND_KEYS[p]
+        while hand:
+            low = hand & -hand
+            key ^= keys[low.bit_length() - 1]
+            hand ^= low
+    return key
+
+def stack_hash(stack: int) -> int:
+    key = 0
+    while stack:
+        low = stack & -stack
+        key ^= STACK_KEYS[low.bit_length() - 1]
+        stack ^= low
+    return key
+
+def flags_hash(can_skip, can_succumb) -> int:
+    return (SKIP_KEY if can_skip else 0) ^ (SUCCUMB_KEY if can_succumb else 0)
+
+
+class ReplacementPolicy(Enum):
+    # Always overwrite the slot
+    ALWAYS          = auto()
+    # Only overwrite entries searched to at most the same depth
+    DEPTH_PREFERRED = auto()
+    # Two slots per key: one depth-preferred, one always replaced
+    TWO_TIER        = auto()
+
+
+class TranspositionTable:
+    def __init__(
+        self, size_log2: int = 20,
+        policy: ReplacementPolicy = ReplacementPolicy.DEPTH_PREFERRED
+    ):
+        self._size   = 1 << size_log2
+        self._mask   = self._size - 1
+        self._policy = policy
+
+        slots = self._size * (2 if policy == ReplacementPolicy.TWO_TIER else 1)
+        self._keys:   List[Optional[int]] = [ None ] * slots
+        self._depths: List[int] = [ 0 ] * slots
+        self._values: List[Any] = [ None ] * slots
+
+        self.hits   = 0
+        self.misses = 0
+
+    @property
+    def policy(self) -> ReplacementPolicy:
+        return self._policy
+
+    def __len__(self):
+        return sum(key is not None for key in self._keys)
+
+    def clear(self):
+        for i in range(len(self._keys)):
+            self._keys[i]   = None
+            self._values[i] = None
+        self.hits = self.misses = 0
+
+    def _slots(self, key: int) -> Tuple[int, ...]:
+        i = key & self._mask
+        if self._policy == ReplacementPolicy.TWO_TIER:
+            return (2 * i, 2 * i + 1)
+        return (i,)
+
+    def get(self, key: int) -> Optional[Tuple[int, Any]]:
+        # (depth, value) stored for the key, if any
+        for i in self._slots(key):
+            if self._keys[i] == key:
+                self.hits += 1
+                return self._depths[i], self._values[i]
+        self.misses += 1
+        return None
+
+    def put(self, key: int, value: Any, depth: int = 0):
+        slots = self._slots(key)
+        for n, i in enumerate(slots):
+            if self._keys[i] == key:
+                if (self._policy == ReplacementPolicy.ALWAYS or n == 1
+                        or depth >= self._depths[i]):
+                    self._store(i, key, value, depth)
+                return
+
+        i = slots[0]
+        if self._policy == ReplacementPolicy.ALWAYS or self._keys[i] is None:
+            self._store(i, key, value, depth)
+        elif depth >= self._depths[i]:
+            if self._policy == ReplacementPolicy.TWO_TIER:
+                # The old entry moves down to the always-replaced slot
+                self._store(slots[1], self._keys[i], self._values[i], self._depths[i])
+            self._store(i, key, value, depth)
+        elif self._policy == ReplacementPolicy.TWO_TIER:
+            self._store(slots[1], key, value, depth)
+
+    def _store(self, i: int, key: int, value: Any, depth: int):
+        self._keys[i]   = key
+        self._depths[i] = depth
+        self._values[i] = value
@@ -0,0 +1,39 @@
+import hashlib
+import random
+from typing import Any, List, Union
+
+
+# Where games get their randomness from. Anything that deals or samples takes
+# an `rng`, which can be
+#
+#   None                    the global `random` module, as always before
+#   an int                  a seed for a `random.Random` of its own
+#   a `random.Random`       used as it is
+#   a NumPy `Generator`     used to seed a `random.Random` of its own
+#
+# Seeds for many games or processes are derived from one root seed and a path
+# of indices (worker, then game, say) by hashing, so every stream is
+# reproducible on its own and independent of how the work is split up.
+
+RandomLike = Union[None, int, random.Random, Any]
+
+def make_rng(rng: RandomLike = None):
+    if rng is None or rng is random:
+        return random
+    if isinstance(rng, random.Random):
+        return rng
+    if isinstance(rng, int):
+        return random.Random(rng)
+    if hasattr(rng, 'integers'):
+        return random.Random(int(rng.integers(1 << 63)))
+    raise TypeError(f"Can't make a random number generator out of {rng!r}")
+
+
+def derive_seed(seed: int, *path: int) -> int:
+    # A 64-bit seed for the stream at `path` under `seed`
+    key = b''.join(int(k).to_bytes(16, 'little', signed = True) for k in (seed, *path))
+    return int.from_bytes(hashlib.blake2b(key, digest_size = 8).digest(), 'little')
+
+def seed_sequence(seed: int, n: int, *path: int) -> List[int]:
+    # Seeds for `n` streams next to each other, e.g. one per worker
+    return [ derive_seed(seed, *path, i) for i in range(n) ]
@@ -0,0 +1,73 @@
+from typing import Any, Callable, List, Tuple
+
+
+# An entry is (undo, undo_args, redo, redo_args)
+UndoEntry = Tuple[Callable, tuple, Callable, tuple]
+
+class UndoLog:
+    def __init__(self):
+        self.entries: List[UndoEntry] = []
+        # Changes are only recorded while there is an open checkpoint
+        self.depth = 0
+
+    def record(self, undo: Callable, undo_args: tuple,
+                     redo: Callable, redo_args: tuple):
+        if self.depth:
+            self.entries.append((undo, undo_args, redo, redo_args))
+
+    def checkpoint(self) -> int:
+        self.depth += 1
+        return len(self.entries)
+
+    def rollback(self, checkpoint: int) -> List[UndoEntry]:
+        # Undoes everything since the checkpoint, returning what was undone so
+        # that it can be redone
+        undone = self.entries[checkpoint:]
+        del self.entries[checkpoint:]
+        for undo, undo_args, _, _ in reversed(undone):
+            undo(*undo_args)
+        self._close()
+        return undone
+
+    def commit(self, checkpoint: int):
+        self._close()
+
+    def redo(self, changes: List[UndoEntry]):
+        for _, _, redo, redo_args in changes:
+            redo(*redo_args)
+        if self.depth:
+            self.entries.extend(changes)
+
+    def _close(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self.entries.clear()
+
+
+class Undoable:
+    _undo_log: UndoLog
+
+    def share_undo_log(self, *others: 'Undoable'):
+        for other in others:
+            other._undo_log = self._undo_log
+
+    def _record(self, undo: Callable, undo_args: tuple,
+                      redo: Callable, redo_args: tuple):
+        self._undo_log.record(undo, undo_args, redo, redo_args)
+
+    def _set_recorded(self, name: str, value: Any):
+        self._record(setattr, (self, name, getattr(self, name)),
+                     setattr, (self, name, value))
+        setattr(self, name, value)
+
+    def checkpoint(self) -> int:
+        return self._undo_log.checkpoint()
+
+    def rollback(self, checkpoint: int) -> List[UndoEntry]:
+        return self._undo_log.rollback(checkpoint)
+
+    def commit(self, checkpoint: int):
+        self._undo_log.commit(checkpoint)
+
+    def redo(self, changes: List[UndoEntry]):
+        self._undo_log.redo(changes)
@@ -1,5 +1,6 @@
 from copy import deepcopy
 from itertools import islice
+from typing import List
 
 from pyglet import shapes as shp, text as txt, font
 from pyglet.graphics import Batch
@@ -1,4 +1,5 @@
 from copy import deepcopy
+from typing import List
 
 from pyglet import shapes as shp, text as txt, font
 from pyglet.graphics import Batch
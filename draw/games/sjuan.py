@@ -1,21 +1,24 @@
 from pathlib import Path
+from typing import Optional
 
-from card import *
-from card.game import *
-from card.games.sjuan import *
+from card import Card, CardSuit, CardValue, RandomLike, try_take
+from card.games.sjuan import SjuanGame, SjuanRules, SjuanAction, SjuanInsert, SjuanTake
 
-from draw.draw import *
 from draw.shape import RectangleShape
 from draw.vector import Vector
-from draw.manage import *
+from draw.world import World
 from lib import const, do_nothing
 
-import torch
-from train.playerbot import PlayerBot
+# What draws the game is only imported for graphical games, and the bots
+# only for games with robot players, as pyglet and torch take seconds to
+# import
 
 
 class Sjuan:
-    def __init__(self, players, bounds: RectangleShape, cards_grouped = None, graphical: bool = True):
+    def __init__(
+        self, players, bounds: RectangleShape, cards_grouped = None, graphical: bool = True,
+        rng: RandomLike = None
+    ):
         if cards_grouped is None:
             cards_grouped = [ [
                 Card(suit, value) for value in CardValue
@@ -25,18 +28,23 @@ class Sjuan:
         cards_flat = [ x for group in cards_grouped for x in group ]
 
         game = SjuanGame(
-            len(players), cards_flat, [ player['name'] for player in players ]
+            len(players), cards_flat, [ player['name'] for player in players ], rng = rng
         )
         self._game = game
         self._players = players
 
         self._bounds = bounds
         self._done   = False
+        self._bots   = []
         self.graphical = graphical
 
         self._world = World(self)
 
         if graphical:
+            from draw.manage import (
+                CardStackManager, SjuanStackManager, CardHandManager, ButtonManager
+            )
+
             self._source_stack_manager = CardStackManager(
                 game.state.source_stack, bounds.centre,
                 label = None, interactable = False
@@ -50,7 +58,6 @@ class Sjuan:
             self._world.add_object(self._sjuan_stack_manager)
 
             self._player_managers = []
-            self._bots = []
             for i, player in enumerate(game.state.players):
                 player_config = players[i]
                 manager = CardHandManager(
@@ -58,13 +65,18 @@ class Sjuan:
                 )
                 self._player_managers.append(manager)
                 self._world.add_object(manager)
-                if player_config['type'] == 'robot':
+                if player_config['type'] == 'robot' and player_config.get('bot') == 'ismcts':
+                    from train.ismcts import ISMCTSBot
+                    self._bots.append(ISMCTSBot(
+                        self, i, name = game.player_names[i],
+                        playouts    = player_config.get('playouts', 1000),
+                        time_budget = player_config.get('time_budget'),
+                        processes   = player_config.get('processes', 1)
+                    ))
+                elif player_config['type'] == 'robot':
+                    from train.playerbot import PlayerBot
                     bot = PlayerBot(self, cards_grouped, i, name = game.player_names[i])
-                    checkpoint = torch.load(Path.cwd() / player_config['file'])
-                    bot._player_turn_model.model.load_state_dict(checkpoint['player_turn_model'])
-                    bot._give_cards_model.model.load_state_dict(checkpoint['give_cards_model'])
-                    bot._player_turn_model.model.eval()
-                    bot._give_cards_model.model.eval()
+                    bot.load_checkpoint(Path.cwd() / player_config['file'])
                     self._bots.append(bot)
                 else:
                     self._bots.append(None)
@@ -101,6 +113,7 @@ class Sjuan:
             if len(self.game.state.players) <= 1:
                 self._done = True
                 self._world.game_over()
+                self.close()
 
         game.state.listen(on_win = player_won)
 
@@ -225,10 +238,17 @@ class Sjuan:
                 on_succumbable_change = update_ask_cards_button
             )
 
-    def reset(self):
-        self._game.reset()
+    def reset(self, rng: RandomLike = None):
+        self._game.reset(rng)
         self._done = False
 
+    def close(self):
+        # Stops the bots' worker processes, if they have any. Bots start them
+        # again if they're asked to play after all.
+        for bot in self._bots:
+            if hasattr(bot, 'close'):
+                bot.close()
+
     @property
     def game(self):
         return self._game
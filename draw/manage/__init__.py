@@ -1,4 +1,4 @@
-from .world import *
+from draw.world import *
 from .floating_card_manager import *
 from .card_hand_manager import *
 from .card_stack_manager import *
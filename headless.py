@@ -0,0 +1,7 @@
+# Importing this imports what it takes to play games without drawing them:
+# the game, the bots and torch, but not pyglet, which only graphical games
+# need. Worker processes preload it (see `train.pool`).
+
+import draw.games.sjuan
+import train.playerbot
+import train.selfplay
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import sys
+
+from main_train import get_cards_grouped
+from train.evaluate import Evaluation
+
+
+# Plays bot checkpoints against each other until it is clear which of each
+# pair is better, e.g.
+#
+#   python main_evaluate.py "saved_models/<session>/<checkpoint>/models/"{Gudrun,Lasse}.bot
+
+def parse_args():
+    parser = argparse.ArgumentParser(description = 'Evaluate bot checkpoints against each other.')
+    parser.add_argument('checkpoints', nargs = '+', help = '.bot files, as saved while training')
+    parser.add_argument('--games', type = int, default = 1000,
+                        help = 'most games per pair (default: %(default)s)')
+    parser.add_argument('--min-games', type = int, default = 20,
+                        help = 'fewest games per pair before stopping early (default: %(default)s)')
+    parser.add_argument('--processes', type = int, default = os.cpu_count() or 1)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--test', choices = ('sprt', 'ci'), default = 'sprt')
+    parser.add_argument('--p0', type = float, default = 0.45,
+                        help = 'SPRT null win rate, 1 - p1 (default: %(default)s)')
+    parser.add_argument('--p1', type = float, default = 0.55,
+                        help = 'SPRT alternative win rate (default: %(default)s)')
+    parser.add_argument('--alpha', type = float, default = 0.05)
+    parser.add_argument('--beta', type = float, default = 0.05)
+    parser.add_argument('-z', type = float, default = 1.96, help = 'CI width in standard deviations')
+    parser.add_argument('-o', '--output', help = 'also write the results here as JSON')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if len(args.checkpoints) < 2:
+        sys.exit('Need at least two checkpoints')
+
+    if args.test == 'sprt':
+        test_args = { 'p0': args.p0, 'p1': args.p1, 'alpha': args.alpha, 'beta': args.beta }
+    else:
+        test_args = { 'z': args.z }
+    try:
+        evaluation = Evaluation(
+            args.checkpoints, get_cards_grouped(), processes = args.processes,
+            test = args.test, max_games = args.games, min_games = args.min_games,
+            seed = args.seed, **test_args
+        )
+    except ValueError as e:
+        sys.exit(str(e))
+
+    def on_result(pair, result):
+        i, j = pair
+        if args.test == 'sprt':
+            # Rejecting `p1` only says the first bot doesn't win that often
+            worse = f'{evaluation.names[i]} is not better than p1 = {args.p1}'
+        else:
+            worse = f'{evaluation.names[j]} is better'
+        verdict = { 1: f'{evaluation.names[i]} is better', -1: worse, 0: '' }[result.decision]
+        print(f'{evaluation.names[i]} vs {evaluation.names[j]}: '
+              f'{result.wins}/{result.games} ({result.win_rate:.3f}) {verdict}', flush = True)
+
+    evaluation.run(on_result)
+    print()
+    print(evaluation.table())
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(evaluation.to_dict(), f, indent = 2)
@@ -55,4 +55,7 @@ def main(players, window, WINDOW_SIZE):
         pass
 
     pyglet.clock.schedule_interval(update, 1/60)
-    pyglet.app.run()
+    try:
+        pyglet.app.run()
+    finally:
+        sjuan.close()
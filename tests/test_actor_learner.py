@@ -0,0 +1,50 @@
+import torch
+
+from main_train import get_cards_grouped
+from train.actor_learner import ActorLearner
+from train.io import SessionFile, SessionSaver
+from train.playerbot import PlayerBot
+from train.replay import replay_session
+
+
+def test_runs_are_saved(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cards_grouped = get_cards_grouped()
+    bots = [ PlayerBot(None, cards_grouped, i, name = f'Bot{i}') for i in range(3) ]
+    saver = SessionSaver(bots, keep_last = 1)
+    learner = ActorLearner(bots, cards_grouped, num_actors = 1, batch_size = 32, seed = 0)
+    learner.run(7, saver = saver, save_every = 4, log_every = 0)
+    saver.close()
+    assert learner.steps > 0
+
+    # Every 4 games and at the end, keeping the last checkpoint's models
+    checkpoints = sorted(saver.directory.glob('* iterations *'))
+    assert len(checkpoints) == 2
+    (models,) = saver.directory.glob('*/models')
+    for bot in bots:
+        loaded = PlayerBot(None, cards_grouped, 0, name = bot.name)
+        loaded.load_checkpoint(models / f'{bot.name}.bot')
+        for model, weights in bot.state_dict().items():
+            for key, value in weights.items():
+                assert torch.equal(loaded.state_dict()[model][key], value)
+
+    # Every game learned from, as it was played
+    games = 0
+    for checkpoint in checkpoints:
+        with SessionFile(checkpoint / 'games.data') as session:
+            for k, steps in replay_session(session):
+                steps = list(steps)
+                assert len(steps) == session.num_moves(k) > 0
+                games += 1
+    assert games == learner.games == 7
+
+def test_actors_play_several_games_at_once():
+    cards_grouped = get_cards_grouped()
+    bots = [ PlayerBot(None, cards_grouped, i, name = f'Bot{i}') for i in range(3) ]
+    learner = ActorLearner(bots, cards_grouped, num_actors = 1, batch_size = 32,
+                           games_at_once = 4, seed = 0)
+    records = []
+    learner.run(8, on_game = records.append, log_every = 0)
+    assert learner.games == 8 and learner.steps > 0
+    # Each game once, from its own deal
+    assert len({ tuple(map(tuple, record.hands)) for record in records }) == 8
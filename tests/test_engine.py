@@ -0,0 +1,118 @@
+import pickle
+import random
+
+import pytest
+
+from card import *
+from card.games.sjuan import *
+from lib import const
+
+
+ALL_CARDS = [ Card(suit, value) for suit in CardSuit for value in CardValue ]
+
+def in_queue(state: SjuanGameState) -> bool:
+    return state.phase.match(
+        do_queue = const(True), player_turn = const(False), give_cards = const(False)
+    )
+
+def resolve_queue(game: SjuanGame):
+    while in_queue(game.state):
+        assert game.do(list(game.state.queue))
+
+def position(engine: SjuanEngine):
+    return (list(engine.hands), list(engine.rows), engine.phase, engine.turn,
+            engine.to_give, bool(engine.can_skip), engine.can_succumb, engine.zobrist)
+
+def game_legal_moves(game: SjuanGame, engine: SjuanEngine):
+    # Which engine moves `SjuanRules` takes, out of every card in hand and
+    # both actions
+    state = game.state
+    candidates = [ card.id for card in state.players[state.turn_index()].cards ]
+    candidates += [ MOVE_SKIP, MOVE_ASK_FOR_CARDS ]
+    return sorted(
+        move for move in candidates
+        if game.is_valid([ engine.to_move(move, state) ])
+    )
+
+
+# The engine against the rules it reimplements: random seeded games played
+# on both, checking that they allow the same moves and get to the same
+# position after every one
+@pytest.mark.parametrize('num_players', [ 2, 3, 4 ])
+def test_engine_plays_like_the_rules(num_players):
+    for seed in range(10):
+        rng = random.Random(seed)
+        game = SjuanGame(num_players, ALL_CARDS, rng = seed)
+        resolve_queue(game)
+        engine = SjuanEngine.from_state(game.state)
+
+        while not engine.is_terminal():
+            assert position(engine) == position(SjuanEngine.from_state(game.state))
+            assert engine.zobrist == game.state.zobrist
+            legal = sorted(engine.legal_moves())
+            assert legal == game_legal_moves(game, engine)
+            for move in range(NUM_MOVES):
+                assert engine.is_legal(move) == (move in legal)
+
+            move = rng.choice(legal)
+            assert game.do([ engine.to_move(move, game.state) ])
+            assert engine.step(move)
+            resolve_queue(game)
+
+        assert len(game.state.players) == 1
+        assert engine.hands == [ card_mask(game.state.players[0].cards) ]
+        assert sorted(engine.winners + engine.seats) == list(range(num_players))
+
+def test_illegal_moves_change_nothing():
+    rng = random.Random(0)
+    engine = SjuanEngine(3, rng = 0)
+    for i in range(200):
+        if engine.is_terminal():
+            break
+        before = position(engine)
+        for move in set(range(NUM_MOVES)) - set(engine.legal_moves()):
+            assert not engine.step(move)
+        assert position(engine) == before
+        engine.step(rng.choice(engine.legal_moves()))
+
+def test_copies_and_pickles_play_on_alike():
+    engine = SjuanEngine(2, rng = 3)
+    rng = random.Random(3)
+    for i in range(20):
+        engine.step(rng.choice(engine.legal_moves()))
+    copy, unpickled = engine.copy(), pickle.loads(pickle.dumps(engine))
+
+    moves = []
+    while not engine.is_terminal():
+        moves.append(rng.choice(engine.legal_moves()))
+        engine.step(moves[-1])
+    for other in (copy, unpickled):
+        for move in moves:
+            assert other.step(move)
+        assert position(other) == position(engine)
+        assert other.winners == engine.winners
+
+def test_giving_away_the_last_card_ends_the_giving():
+    # Player 2 wins by giving their last card to player 0, who asked for
+    # cards. That is the end of the giving, and player 0 loses their turn to
+    # player 1.
+    seven = Card(CardSuit.HEARTS, CardValue.SEVEN)
+    hands = [ [ Card(CardSuit.SPADES, CardValue.TWO) ],
+              [ Card(CardSuit.SPADES, CardValue.THREE) ],
+              [ seven ] ]
+    engine = SjuanEngine(3, deal = False)
+    engine.set_position([ card_mask(hand) for hand in hands ], 2,
+                        phase = PHASE_GIVE_CARDS, to_give = 2)
+    assert engine.step(seven.id)
+    assert engine.winners == [ 2 ]
+    assert (engine.phase, engine.turn, engine.to_give) == (PHASE_PLAYER_TURN, 1, 0)
+
+    game = SjuanGame(3, [ card for hand in hands for card in hand ], rng = 0)
+    resolve_queue(game)
+    for player, hand in zip(game.state.players, hands):
+        player.set_state(list(hand))
+    game.state.phase = SjuanGameStatePhase.GIVE_CARDS(2, 2)
+    assert game.do([ SjuanEngine.from_state(game.state).to_move(seven.id, game.state) ])
+    resolve_queue(game)
+    assert len(game.state.players) == 2
+    assert game.state.turn_index() == 1
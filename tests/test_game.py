@@ -0,0 +1,57 @@
+import random
+
+from card import *
+from card.games.sjuan import *
+
+
+ALL_CARDS = [ Card(suit, value) for suit in CardSuit for value in CardValue ]
+
+def summary(state: SjuanGameState):
+    return (
+        list(state.queue), state.phase,
+        [ list(player.cards) for player in state.players ],
+        { suit: list(row) for suit, row in state.sjuan_stack.get_state().items() },
+        list(state.source_stack.cards),
+        state.can_skip, state.can_succumb, state.zobrist
+    )
+
+
+def test_listeners_keep_the_state_before_each_move():
+    rng = random.Random(0)
+    game = SjuanGame(2, ALL_CARDS, rng = 0)
+    kept = []
+    game.listen(on_move = lambda moves, old_state: kept.append(old_state))
+
+    before = []
+    while len(game.state.players) > 1:
+        moves = rng.choice(game.suggested_moves())
+        before.append(summary(game.state))
+        assert game.do(moves)
+
+    assert len(kept) == len(before)
+    # Long after being given to the listener, each is still the position the
+    # moves were made in
+    for old_state, expected in zip(kept, before):
+        assert summary(old_state) == expected
+        assert old_state.zobrist == old_state._full_zobrist()
+
+def test_listeners_can_play_on_from_the_old_state():
+    game = SjuanGame(2, ALL_CARDS, rng = 1)
+    kept = []
+    game.listen(on_move = lambda moves, old_state: kept.append((moves, old_state)))
+    while not kept or not game.state.phase.match(
+        do_queue = lambda _: False, player_turn = lambda _: True, give_cards = lambda *_: False
+    ):
+        game.do(game.suggested_moves()[0])
+
+    moves = game.suggested_moves()[0]
+    after = summary(game.state)
+    game.do(moves)
+    _, old_state = kept[-1]
+    assert summary(old_state) == after
+    # Doing the same moves on the snapshot gets to the same position, leaving
+    # the game alone
+    after_moves = summary(game.state)
+    assert SjuanRules.do(moves, old_state)
+    assert summary(old_state) == after_moves
+    assert summary(game.state) == after_moves
@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+import torch
+import torch.nn as nn
+
+from train.inference import InferenceServer
+
+
+def test_batched_like_one_at_a_time():
+    torch.manual_seed(0)
+    models = [ nn.Linear(6, 3), nn.Linear(6, 3) ]
+    states = torch.randn(40, 6)
+    with torch.no_grad():
+        expected = [ models[k % 2](state) for k, state in enumerate(states) ]
+
+    with InferenceServer(max_batch = 16) as server:
+        futures = [ server.submit(models[k % 2], state) for k, state in enumerate(states) ]
+        for future, logits in zip(futures, expected):
+            assert torch.allclose(future.result(timeout = 5), logits, atol = 1e-6)
+    assert server.mean_batch_size > 1
+
+def test_refuses_requests_once_stopped():
+    server = InferenceServer().start()
+    server.stop()
+    with pytest.raises(RuntimeError):
+        server.submit(nn.Linear(2, 2), torch.zeros(2))
+
+def test_stopping_leaves_nobody_waiting():
+    # Whatever was handed in before stopping is answered, the rest refused
+    model = nn.Linear(4, 2)
+    for attempt in range(20):
+        server = InferenceServer(max_batch = 8).start()
+        futures = []
+        refused = []
+        def submitter():
+            for i in range(50):
+                try:
+                    futures.append(server.submit(model, torch.zeros(4)))
+                except RuntimeError:
+                    refused.append(i)
+                    return
+        threads = [ threading.Thread(target = submitter) for k in range(4) ]
+        for thread in threads:
+            thread.start()
+        server.stop()
+        for thread in threads:
+            thread.join()
+        for future in futures:
+            assert future.result(timeout = 5).shape == (2,)
@@ -0,0 +1,64 @@
+import torch
+
+from card import card_mask
+from main_train import get_cards_grouped
+from train.io import SessionFile, SessionSaver
+from train.playerbot import PlayerBot
+from train.replay import replay_session
+from train.selfplay import play_episode
+
+
+def position(state):
+    # The hands and rows, which is all that a queue phase doesn't also have
+    return (
+        [ card_mask(player.cards) for player in state.players ],
+        list(state.sjuan_stack.row_states)
+    )
+
+
+# Games played by (untrained) bots, recorded like `main_train` does, read
+# back and replayed on the engine: every move is the one the bot made,
+# going through the same positions as the game did. Self-play is between two
+# bots, as the bots keep to their seat.
+def test_recorded_games_replay(tmp_path, monkeypatch):
+    num_players = 2
+    monkeypatch.chdir(tmp_path)
+    torch.manual_seed(0)
+    cards_grouped = get_cards_grouped()
+    bots = [ PlayerBot(None, cards_grouped, i, name = f'Bot{i}') for i in range(num_players) ]
+    saver = SessionSaver(bots)
+
+    games = []
+    for seed in range(4):
+        deals, moves = [], []
+        def on_deal(players):
+            deals.append([ list(player.cards) for player in players ])
+            saver.new_iteration(players, list(range(num_players)))
+        def on_move(phase_i, player_i, move_i):
+            saver.register_move(phase_i, player_i, move_i)
+            moves.append(((phase_i, player_i, move_i), position(bots[0]._sjuan.game.state)))
+        play_episode(bots, cards_grouped, on_deal, on_move, rng = seed)
+        games.append((deals[0], moves))
+    saver.close()
+
+    (path,) = saver.directory.glob('games.data.part*')
+    with SessionFile(path) as session:
+        assert len(session) == len(games)
+        for (k, steps), (hands, moves) in zip(replay_session(session), games):
+            deal = session.deal(k)
+            assert deal.hands == hands
+            assert deal.bots == list(range(num_players))
+            assert session.num_moves(k) == len(moves)
+
+            expected = ([ card_mask(hand) for hand in hands ], [ 0, 0, 0, 0 ])
+            num_steps = 0
+            for step, (record, after) in zip(steps, moves):
+                assert tuple(step.record) == record
+                assert (step.engine.hands, step.engine.rows) == expected
+                engine, expected = step.engine, after
+                num_steps += 1
+            assert num_steps == len(moves)
+            # The engine is left before the last move; the game ended with it
+            engine.step(step.move)
+            assert (engine.hands, engine.rows) == expected
+            assert engine.is_terminal()
@@ -0,0 +1,101 @@
+import random
+import threading
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from card import Card
+from main_train import get_cards_grouped
+from train.io import RecordedMove, SessionFile, SessionSaver
+from train.playerbot import PlayerBot
+
+
+def make_bots(n: int = 2):
+    cards_grouped = get_cards_grouped()
+    return [ PlayerBot(None, cards_grouped, i, name = f'Bot{i}') for i in range(n) ]
+
+def play_game(saver):
+    # Checkpoints are named by how many games came before them
+    saver.new_iteration([ SimpleNamespace(cards = []) ] * 2, [ 0, 1 ])
+
+def writer_threads():
+    return [ t for t in threading.enumerate() if t.name.endswith('(_write_chunks)') ]
+
+
+def test_failed_checkpoint_keeps_games_and_writes_bots_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bots = make_bots()
+    saver = SessionSaver(bots)
+    threads = len(writer_threads())
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(torch, 'save', fail)
+    saver.save()
+    with pytest.raises(OSError):
+        saver.wait()
+
+    (checkpoint,) = [ path for path in saver.directory.iterdir() if path.is_dir() ]
+    assert (checkpoint / 'games.data').exists()
+    assert not (checkpoint / 'models.part').exists()
+    assert not (checkpoint / 'models').exists()
+    # The failed checkpoint's writer is closed; the next part file's is open
+    assert len(writer_threads()) == threads
+
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    play_game(saver)
+    saver.save()
+    saver.close()
+    saved = sorted(path.name for path in saver.directory.glob('*/models/*.bot'))
+    assert saved == [ 'Bot0.bot', 'Bot1.bot' ]
+
+def test_keep_best_prunes_by_metric(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bots = make_bots()
+    saver = SessionSaver(bots, keep_last = 1, keep_best = 1)
+    for metric in (5.0, 9.0, 1.0, 2.0):
+        bots[0].updates += 1
+        play_game(saver)
+        saver.save(metric = metric)
+        saver.wait()
+    saver.close()
+    kept = sorted(metric for _, metric in saver._checkpoints)
+    assert kept == [ 2.0, 9.0 ]
+    assert len(list(saver.directory.glob('*/models'))) == 2
+    assert len(list(saver.directory.glob('*/games.data'))) == 4
+
+def test_games_read_back_whatever_their_moves(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    saver = SessionSaver(make_bots())
+    rng = random.Random(0)
+    games = []
+    for k in range(6):
+        deck = [ Card.from_id(i) for i in range(Card.NUM_CARDS) ]
+        rng.shuffle(deck)
+        hands = [ deck[:26], deck[26:] ]
+        # All-zero moves, which the games used to be separated by, at either
+        # end of them; and a game without any moves
+        moves = [ RecordedMove(0, 0, 0) ] + [
+            RecordedMove(rng.randrange(2), rng.randrange(2), rng.randrange(10))
+            for i in range(rng.randrange(40))
+        ] + [ RecordedMove(0, 0, 0) ] if k != 3 else []
+        games.append(([ 1, 0 ], hands, moves))
+
+        saver.new_iteration([ SimpleNamespace(cards = hand) for hand in hands ], [ 1, 0 ])
+        for move in moves:
+            saver.register_move(*move)
+        if k == 2:
+            saver.save()
+    saver.close()
+
+    (games_path,) = saver.directory.glob('*/games.data')
+    (part_path,)  = saver.directory.glob('games.data.part*')
+    read = []
+    for path in (games_path, part_path):
+        with SessionFile(path) as session:
+            for k, (deal, moves) in enumerate(session):
+                assert session.num_moves(k) == len(moves)
+                read.append((deal.bots, deal.hands, moves))
+    assert read == games
@@ -0,0 +1,150 @@
+import random
+
+import pytest
+
+from card import *
+from card.games.sjuan import *
+
+
+def key(engine: SjuanEngine):
+    return (tuple(engine.hands), tuple(engine.rows), engine.phase, engine.turn,
+            engine.to_give, bool(engine.can_skip), engine.can_succumb)
+
+def retrograde(engine: SjuanEngine):
+    # Values for player 0 of every position reachable from `engine`, found by
+    # going back from the ends of the game, so that whatever isn't a forced
+    # win for either player, however long it takes, is a draw
+    found = { key(engine): engine }
+    moves = {}
+    todo = [ engine ]
+    while todo:
+        position = todo.pop()
+        children = []
+        for move in position.legal_moves():
+            child = position.copy()
+            child.step(move)
+            if child.is_terminal():
+                children.append(WIN if child.winners[0] == 0 else LOSS)
+            else:
+                if key(child) not in found:
+                    found[key(child)] = child
+                    todo.append(child)
+                children.append(key(child))
+        moves[key(position)] = children
+
+    values = {}
+    changed = True
+    while changed:
+        changed = False
+        for k, children in moves.items():
+            if k in values:
+                continue
+            known = [ values.get(child, child) if isinstance(child, tuple) else child
+                      for child in children ]
+            best = WIN if found[k].turn == 0 else LOSS
+            if best in known:
+                values[k] = best
+            elif all(value == -best for value in known):
+                values[k] = -best
+            else:
+                continue
+            changed = True
+    return { k: values.get(k, DRAW) for k in moves }
+
+def random_position(rng: random.Random, can_always_skip: bool, max_cards: int):
+    # A few cards each from a few rows, so that the hands get in each other's
+    # way, in any phase
+    rows = [ 0 if rng.random() < 0.25 else row_state(rng.randint(1, 7), rng.randint(7, 13))
+             for s in range(4) ]
+    suits = rng.sample(range(4), rng.randint(1, 3))
+    free = [ i for i in range(52) if i // 13 in suits and not stack_mask(rows) >> i & 1 ]
+    rng.shuffle(free)
+    sizes = [ rng.randint(1, max_cards), rng.randint(1, max_cards) ]
+    if sum(sizes) > len(free):
+        return None
+    hands = [ sum(1 << i for i in free[:sizes[0]]),
+              sum(1 << i for i in free[sizes[0]:sum(sizes)]) ]
+
+    engine = SjuanEngine(2, can_always_skip = can_always_skip, deal = False)
+    turn = rng.randint(0, 1)
+    kind = rng.random()
+    if kind < 0.6:
+        engine.set_position(hands, turn, rows)
+    elif kind < 0.8:
+        # After an ace or a king
+        engine.set_position(hands, turn, rows, can_skip = True, can_succumb = False)
+    else:
+        engine.set_position(hands, turn, rows, PHASE_GIVE_CARDS, rng.randint(1, 3))
+    return engine
+
+
+# The solver against working out every reachable position's value, on
+# seeded positions small enough for that: the values it gives, and the
+# values after the moves it picks. Without `can_always_skip` positions are
+# searched all the way, which is slow enough to keep them smaller.
+@pytest.mark.parametrize('can_always_skip, max_cards', [ (True, 4), (False, 3) ])
+def test_solver_agrees_with_retrograde_analysis(can_always_skip, max_cards):
+    rng = random.Random(0)
+    solved = 0
+    while solved < 150:
+        engine = random_position(rng, can_always_skip, max_cards)
+        if engine is None:
+            continue
+        values = retrograde(engine)
+        expected = values[key(engine)] * (1 if engine.turn == 0 else -1)
+        value, move = SjuanSolver().solve(engine)
+        assert value == expected
+
+        child = engine.copy()
+        assert child.step(move)
+        if child.is_terminal():
+            assert value == (WIN if child.winners[0] == engine.turn else LOSS)
+        else:
+            assert values[key(child)] * (1 if engine.turn == 0 else -1) == value
+        solved += 1
+
+# A race that the player to move would win, were it not for a king that has to
+# wait for a turn of its own
+def test_kings_can_cost_a_turn():
+    hearts, spades = CardSuit.HEARTS.value - 1, CardSuit.SPADES.value - 1
+    rows = [ 0, 0, 0, 0 ]
+    rows[hearts] = row_state(SEVEN_RANK, 10)
+    rows[spades] = row_state(SEVEN_RANK, SEVEN_RANK)
+    engine = SjuanEngine(2, deal = False)
+    engine.set_position([
+        card_mask([ Card(CardSuit.HEARTS, value)
+                    for value in (CardValue.JACK, CardValue.QUEEN, CardValue.KING) ]),
+        card_mask([ Card(CardSuit.SPADES, value) for value in (CardValue.EIGHT, CardValue.NINE) ])
+    ], 0, rows)
+    assert retrograde(engine)[key(engine)] == LOSS
+    assert SjuanSolver().solve(engine).value == LOSS
+
+# Playing the solver's moves for both players wins won games rather than
+# going round in circles
+def test_solver_wins_won_games():
+    won = 0
+    for seed in range(100):
+        rng = random.Random(seed)
+        engine = SjuanEngine(2, rng = seed)
+        while (not engine.is_terminal()
+               and max(bin(hand).count('1') for hand in engine.hands) > 5):
+            moves = engine.legal_moves()
+            engine.step(rng.choice([ move for move in moves if move < MOVE_SKIP ] or moves))
+        if engine.is_terminal():
+            continue
+        solver = SjuanSolver()
+        value, _ = solver.solve(engine)
+        if value == DRAW:
+            continue
+        winner = engine.turn if value == WIN else 1 - engine.turn
+        for ply in range(200):
+            if engine.is_terminal():
+                break
+            assert engine.step(solver.best_move(engine))
+        assert engine.winners == [ winner ]
+        won += 1
+    assert won > 0
+
+def test_only_two_players():
+    with pytest.raises(ValueError):
+        SjuanSolver().solve(SjuanEngine(3, rng = 0))
@@ -0,0 +1,45 @@
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+import train
+
+
+TRAIN_DIR = Path(train.__file__).parent
+
+def defined_names(submodule: str):
+    # The public names a module defines at its top level, as written
+    tree = ast.parse((TRAIN_DIR / f'{submodule}.py').read_text())
+    names = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [ node.target ]
+            for target in targets:
+                names.update(n.id for n in ast.walk(target) if isinstance(n, ast.Name))
+    return { name for name in names if not name.startswith('_') }
+
+
+def test_names_match_the_submodules():
+    for submodule in train._SUBMODULES:
+        listed = { name for name, where in train._NAMES.items() if where == submodule }
+        assert listed == defined_names(submodule), submodule
+
+def test_names_resolve():
+    for name, submodule in train._NAMES.items():
+        module = getattr(train, submodule)
+        assert getattr(train, name) is getattr(module, name)
+
+def test_all_is_the_names():
+    assert sorted(train.__all__) == sorted(train._NAMES)
+
+def test_unknown_names_import_nothing():
+    code = (
+        "import sys, train\n"
+        "assert not hasattr(train, 'no_such_name')\n"
+        "assert not [ m for m in sys.modules if m.startswith('train.') ], sys.modules\n"
+        "assert 'torch' not in sys.modules\n"
+    )
+    subprocess.run([ sys.executable, '-c', code ], check = True, cwd = TRAIN_DIR.parent)
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from card.games.sjuan import SjuanEngine, MOVE_SKIP, MOVE_ASK_FOR_CARDS
+from train.vec_env import (
+    SjuanVecEnv, NUM_GROUPS, ACTION_SKIP, ACTION_ASK_FOR_CARDS, PHASE_GIVE_CARDS
+)
+
+
+def engines_for(env: SjuanVecEnv):
+    engines = []
+    for g in range(env.num_games):
+        engine = SjuanEngine(env.num_players, deal = False)
+        engine.set_position([ int(hand) for hand in env.hands[g] ], int(env.turn[g]))
+        engines.append(engine)
+    return engines
+
+def check_position(env: SjuanVecEnv, g: int, engine: SjuanEngine):
+    # The env keeps every seat, the engine only those still playing
+    seats = engine.seats
+    assert sorted(np.flatnonzero(env.alive[g])) == seats
+    assert [ int(env.hands[g, seat]) for seat in seats ] == engine.hands
+    assert env.rows[g].tolist() == engine.rows
+    assert (env.phase[g], env.turn[g], env.to_give[g]) == (
+        engine.phase, seats[engine.turn], engine.to_give
+    )
+    assert (env.can_skip[g], env.can_succumb[g]) == (engine.can_skip, engine.can_succumb)
+
+def check_legal(env: SjuanVecEnv, g: int, engine: SjuanEngine, cards, legal):
+    engine_legal = set(engine.legal_moves())
+    env_cards = { int(card) for card in cards[g] if card >= 0 }
+    assert env_cards == set(np.asarray(cards[g])[legal[g, :NUM_GROUPS]].tolist())
+    if engine.phase == PHASE_GIVE_CARDS:
+        # Only the lowest and highest card of each suit can be given
+        assert env_cards and env_cards <= engine_legal
+        assert not legal[g, NUM_GROUPS:].any()
+    else:
+        # Every card that can be played is next to a row, so has an action
+        assert env_cards == engine_legal - { MOVE_SKIP, MOVE_ASK_FOR_CARDS }
+        assert legal[g, ACTION_SKIP] == (not env_cards and MOVE_SKIP in engine_legal)
+        assert legal[g, ACTION_ASK_FOR_CARDS] == (
+            not env_cards and MOVE_ASK_FOR_CARDS in engine_legal
+        )
+
+def to_move(cards, g: int, action: int) -> int:
+    if action == ACTION_SKIP:
+        return MOVE_SKIP
+    if action == ACTION_ASK_FOR_CARDS:
+        return MOVE_ASK_FOR_CARDS
+    return int(cards[g, action])
+
+
+# The vectorised games against one engine each: random seeded games, checking
+# that they allow the same moves and get to the same position after every
+# one, and end with the same places
+@pytest.mark.parametrize('num_players', [ 2, 3, 4 ])
+def test_vec_env_plays_like_the_engine(num_players):
+    rng = np.random.default_rng(num_players)
+    env = SjuanVecEnv(16, num_players, ask_for_cards = True)
+    env.reset(seeds = range(16))
+    engines = engines_for(env)
+
+    while not env.done.all():
+        cards = env.action_cards()
+        legal = env.legal_mask()
+        actions = np.zeros(env.num_games, dtype = np.int64)
+        for g, engine in enumerate(engines):
+            assert env.done[g] == engine.is_terminal()
+            if env.done[g]:
+                continue
+            check_position(env, g, engine)
+            check_legal(env, g, engine, cards, legal)
+            actions[g] = rng.choice(np.flatnonzero(legal[g]))
+
+        won, done = env.step(actions)
+        for g, engine in enumerate(engines):
+            if not engine.is_terminal():
+                num_winners = len(engine.winners)
+                assert engine.step(to_move(cards, g, actions[g]))
+                assert won[g] == (len(engine.winners) > num_winners)
+
+    for g, engine in enumerate(engines):
+        assert engine.is_terminal()
+        places = [ engine.winners.index(seat) if seat in engine.winners else len(engine.winners)
+                   for seat in range(num_players) ]
+        assert env.place[g].tolist() == places
+
+def test_seeds_deal_alike():
+    a, b = SjuanVecEnv(4, 3), SjuanVecEnv(4, 3)
+    a.reset(seeds = [ 1, 2, 3, 4 ])
+    b.reset(seeds = [ 5, 2, 6, 4 ])
+    assert (a.hands[[1, 3]] == b.hands[[1, 3]]).all()
+    assert (a.turn[[1, 3]] == b.turn[[1, 3]]).all()
+    # Every card is dealt to exactly one player
+    assert (np.bitwise_or.reduce(a.hands, axis = 1) == np.uint64((1 << 52) - 1)).all()
+    assert sum(bin(int(hand)).count('1') for hand in a.hands[0]) == 52
@@ -1,2 +1,71 @@
-from .io import *
-from .playerbot import *
+import importlib
+
+
+# Names from the submodules are looked up, and their submodule imported, the
+# first time they are used, rather than every submodule being imported with
+# the package. Most of them import torch, which takes seconds, while some
+# (`ismcts`, `league`) need nothing of it.
+
+_SUBMODULES = (
+    'io', 'playerbot', 'vec_env', 'ismcts', 'replay', 'dataset', 'inference',
+    'selfplay', 'actor_learner', 'league', 'evaluate', 'pool'
+)
+
+# Where each of the package's names is defined. They are what
+# `from train import *` binds, which does import their submodules; the
+# submodules themselves aren't bound, so `io` doesn't shadow the standard one.
+_NAMES = {
+    'get_date': 'io', 'bits': 'io', 'num': 'io', 'bits_per_card': 'io',
+    'card_to_bits': 'io', 'num_to_card': 'io', 'BitWriter': 'io', 'BitReader': 'io',
+    'SessionSaver': 'io', 'RecordedDeal': 'io', 'RecordedMove': 'io',
+    'SessionFile': 'io', 'SessionReader': 'io',
+
+    'gamma': 'playerbot', 'PlayerTurnModel': 'playerbot', 'GiveCardsModel': 'playerbot',
+    'StateEncoder': 'playerbot', 'Decision': 'playerbot', 'PlayerBot': 'playerbot',
+
+    'NUM_GROUPS': 'vec_env', 'ACTION_SKIP': 'vec_env', 'ACTION_ASK_FOR_CARDS': 'vec_env',
+    'PHASE_PLAYER_TURN': 'vec_env', 'PHASE_GIVE_CARDS': 'vec_env', 'CARD_BITS': 'vec_env',
+    'SUIT_BITS': 'vec_env', 'ROW_PLAYABLE_NP': 'vec_env', 'ROW_CARDS_NP': 'vec_env',
+    'ROW_AFTER_INSERT_NP': 'vec_env', 'TURN_CARD': 'vec_env', 'SUIT_LOWEST': 'vec_env',
+    'SUIT_HIGHEST': 'vec_env', 'SjuanVecEnv': 'vec_env',
+
+    'determinize': 'ismcts', 'rollout_move': 'ismcts', 'scores': 'ismcts',
+    'search': 'ismcts', 'ISMCTSBot': 'ismcts',
+
+    'action_to_move': 'replay', 'ReplayStep': 'replay', 'replay_game': 'replay',
+    'replay_session': 'replay',
+
+    'COLUMNS': 'dataset', 'shard_paths': 'dataset', 'load_shard': 'dataset',
+    'discounted_returns': 'dataset', 'decision_columns': 'dataset',
+    'concat_columns': 'dataset', 'to_batch': 'dataset', 'TrajectoryWriter': 'dataset',
+    'TrajectoryDataset': 'dataset', 'ShuffledBatchSampler': 'dataset',
+    'trajectory_loader': 'dataset',
+
+    'InferenceServer': 'inference',
+
+    'AFFECT_GAMMA': 'selfplay', 'Episode': 'selfplay', 'play_episode': 'selfplay',
+
+    'GameRecord': 'actor_learner', 'ActorLearner': 'actor_learner',
+
+    'MatchPolicy': 'league', 'League': 'league',
+
+    'PairResult': 'evaluate', 'sprt_llr': 'evaluate', 'sprt_decision': 'evaluate',
+    'wilson_interval': 'evaluate', 'ci_decision': 'evaluate',
+    'checkpoint_names': 'evaluate', 'Evaluation': 'evaluate',
+
+    'PRELOAD': 'pool', 'warm_context': 'pool', 'WarmPool': 'pool'
+}
+
+__all__ = list(_NAMES)
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name in _NAMES:
+        value = getattr(importlib.import_module(f'{__name__}.{_NAMES[name]}'), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES) | set(__all__))
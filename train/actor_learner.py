@@ -0,0 +1,275 @@
+import os
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import torch
+
+from card import Card, CardHand
+from card.seeding import derive_seed, seed_sequence
+from .io import SessionSaver
+from .playerbot import PlayerBot
+from .selfplay import play_episode
+from .dataset import decision_columns, concat_columns, to_batch
+from .inference import InferenceServer
+from .pool import warm_context
+
+
+# Self-play spread over processes: actor processes play games headlessly
+# with the newest weights they have been sent, and stream the decisions to
+# the learner, which trains the bots on batches of them and every so often
+# broadcasts the weights of the bots it trained back to the actors.
+#
+# Broadcasts are numbered, and every game says which version of the weights
+# it was started with. Actors play on with the weights they have until newer
+# ones come; the learner drops games played with weights more than
+# `max_staleness` versions old.
+#
+# Each actor plays `games_at_once` games at the same time, in threads, with
+# the forward passes of all of them batched by an `InferenceServer`.
+
+class GameRecord(NamedTuple):
+    actor:   int
+    version: int
+    # The bots that played, by seat
+    bots:    List[int]
+    # Each seat's decisions, as `train.dataset` columns
+    columns: List[Dict[str, np.ndarray]]
+    winner:  int
+    # The ids of each seat's cards as dealt, and every move as
+    # (phase, player, move index), for `SessionSaver`
+    hands:   List[List[int]]
+    moves:   List[Tuple[int, int, int]]
+
+
+def _to_numpy(state):
+    # Weights go between processes as arrays, as tensors would each be sent
+    # as shared memory of their own
+    return { model: { key: value.detach().cpu().numpy() for key, value in weights.items() }
+             for model, weights in state.items() }
+
+def _from_numpy(state):
+    return { model: { key: torch.from_numpy(value) for key, value in weights.items() }
+             for model, weights in state.items() }
+
+
+def _actor(
+    actor_id: int, names: List[str], cards_grouped, num_players: int, games_at_once: int,
+    weights_queue, games_queue, stop, seed
+):
+    torch.set_num_threads(1)
+    random.seed(seed)
+    torch.manual_seed(seed)
+    bots = [ PlayerBot(None, cards_grouped, i, name = name) for i, name in enumerate(names) ]
+    num_actions = len(cards_grouped) + 2
+    version = None
+
+    def load(update):
+        nonlocal version
+        version, weights = update
+        for i, state in weights.items():
+            bots[i].load_state_dict(_from_numpy(state))
+
+    def play(players, rng, game: int):
+        played_with = version
+        chosen = rng.sample(range(len(players)), num_players)
+        hands, moves = [], []
+        with torch.no_grad():
+            episode = play_episode(
+                [ players[k] for k in chosen ], cards_grouped,
+                on_deal = lambda players: hands.extend(
+                    [ card.id for card in player.cards ] for player in players
+                ),
+                on_move = lambda *move: moves.append(move),
+                rng = derive_seed(seed, game)
+            )
+        game_id = (actor_id << 40) | game
+
+        games_queue.put(GameRecord(actor_id, played_with, chosen, [
+            decision_columns(game_id, episode.decisions[i],
+                             [ t[0] for t in episode.trajectories[i] ], num_actions)
+            for i in range(num_players)
+        ], episode.winner, hands, moves))
+
+    # The first broadcast has every bot's weights
+    load(weights_queue.get())
+    if games_at_once == 1:
+        game = 0
+        while not stop.is_set():
+            while True:
+                try:
+                    load(weights_queue.get_nowait())
+                except queue.Empty:
+                    break
+            play(bots, random, game)
+            game += 1
+        return
+
+    # Otherwise every game is played in a thread of its own, with bots that
+    # share the models and batch their forward passes. New weights are loaded
+    # between batches.
+    server = InferenceServer(max_batch = games_at_once).start()
+    done   = threading.Event()
+    errors = []
+
+    def play_games(k: int):
+        players = [ bot.sharing_models(server) for bot in bots ]
+        rng = random.Random(derive_seed(seed, -1 - k))
+        # Games k, k + games_at_once, ...
+        game = k
+        try:
+            while not (stop.is_set() or done.is_set()):
+                play(players, rng, game)
+                game += games_at_once
+        except BaseException as e:
+            errors.append(e)
+            done.set()
+
+    threads = [ threading.Thread(target = play_games, args = (k,), name = f'game-{k}')
+                for k in range(games_at_once) ]
+    for thread in threads:
+        thread.start()
+    try:
+        while not (stop.is_set() or done.is_set()):
+            try:
+                update = weights_queue.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            with server.lock:
+                load(update)
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+        server.stop()
+    if errors:
+        raise errors[0]
+
+
+class ActorLearner:
+    def __init__(
+        self, bots: List[PlayerBot], cards_grouped, num_actors: Optional[int] = None,
+        num_players: int = 2, batch_size: int = 512, broadcast_every: int = 4,
+        max_staleness: int = 8, games_at_once: int = 1, seed = None
+    ):
+        self.bots          = bots
+        self.cards_grouped = cards_grouped
+        # One core for the learner, the rest for the actors
+        self.num_actors    = num_actors or max(1, (os.cpu_count() or 2) - 1)
+        self.num_players   = num_players
+        self.games_at_once = games_at_once
+        self.batch_size    = batch_size
+        # Training steps between broadcasts
+        self.broadcast_every = broadcast_every
+        self.max_staleness   = max_staleness
+        self._rng = random.Random(seed)
+
+        self.version = 0
+        self.games   = 0
+        self.dropped = 0
+        self.steps   = 0
+        self.records = 0
+        self._pending = [ [] for bot in bots ]
+        self._pending_size = [ 0 for bot in bots ]
+        self._trained = set()
+
+    def _broadcast(self, weights_queues, which):
+        weights = { i: _to_numpy(self.bots[i].state_dict()) for i in which }
+        for weights_queue in weights_queues:
+            weights_queue.put((self.version, weights))
+
+    def _learn(self, record: GameRecord):
+        for bot_i, columns in zip(record.bots, record.columns):
+            n = len(columns['action'])
+            if n == 0:
+                continue
+            self._pending[bot_i].append(columns)
+            self._pending_size[bot_i] += n
+            if self._pending_size[bot_i] >= self.batch_size:
+                batch = to_batch(concat_columns(self._pending[bot_i]))
+                self._pending[bot_i] = []
+                self._pending_size[bot_i] = 0
+                self.bots[bot_i].train_on_batch(batch)
+                self._trained.add(bot_i)
+                self.steps += 1
+                self.records += len(batch['action'])
+
+    def _record(self, saver: SessionSaver, record: GameRecord):
+        saver.new_iteration(
+            [ CardHand([ Card.from_id(i) for i in hand ]) for hand in record.hands ],
+            record.bots
+        )
+        for move in record.moves:
+            saver.register_move(*move)
+
+    def run(self, num_games: Optional[int] = None, on_game: Optional[Callable] = None,
+            log_every: int = 100, saver: Optional[SessionSaver] = None,
+            save_every: int = 1000):
+        # Trains until `num_games` games have been learned from (or forever);
+        # `on_game(record)` is called for each of them. With a `saver`, they
+        # are recorded with it, and the bots are saved every `save_every`
+        # games and once more when training stops, however it does.
+        # Actors are forked from a process that has done the imports already
+        ctx = warm_context()
+        stop = ctx.Event()
+        games_queue = ctx.Queue()
+        weights_queues = [ ctx.Queue() for i in range(self.num_actors) ]
+        names = [ bot.name for bot in self.bots ]
+        # Every actor deals from a stream of its own
+        seeds = seed_sequence(self._rng.getrandbits(64), self.num_actors)
+        actors = [
+            ctx.Process(target = _actor, name = f'actor-{k}', daemon = True, args = (
+                k, names, self.cards_grouped, self.num_players, self.games_at_once,
+                weights_queues[k], games_queue, stop, seeds[k]
+            ))
+            for k in range(self.num_actors)
+        ]
+        for actor in actors:
+            actor.start()
+        self._broadcast(weights_queues, range(len(self.bots)))
+
+        t0 = time.time()
+        try:
+            while num_games is None or self.games < num_games:
+                record = games_queue.get()
+                if record.version < self.version - self.max_staleness:
+                    self.dropped += 1
+                    continue
+                self.games += 1
+                self._learn(record)
+                if saver is not None:
+                    self._record(saver, record)
+                    if self.games % save_every == 0:
+                        saver.save()
+                if on_game is not None:
+                    on_game(record)
+
+                if self.steps >= self.broadcast_every * (self.version + 1) and self._trained:
+                    self.version += 1
+                    self._broadcast(weights_queues, sorted(self._trained))
+                    self._trained.clear()
+
+                if log_every and self.games % log_every == 0:
+                    elapsed = time.time() - t0
+                    print(f'[actor-learner] {self.games} games ({self.games / elapsed:.1f}/s), '
+                          f'{self.steps} steps, version {self.version}, {self.dropped} dropped')
+        finally:
+            stop.set()
+            # Actors may be waiting to hand in a game
+            while any(actor.is_alive() for actor in actors):
+                try:
+                    games_queue.get(timeout = 0.1)
+                except queue.Empty:
+                    pass
+            for actor in actors:
+                actor.join()
+            # Broadcasts nobody read anymore mustn't hold up exiting
+            for weights_queue in weights_queues:
+                weights_queue.cancel_join_thread()
+                weights_queue.close()
+            if saver is not None and self.games % save_every != 0:
+                saver.save()
+        return self
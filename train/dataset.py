@@ -0,0 +1,245 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from .playerbot import Decision, gamma
+
+
+# Self-play decisions as a dataset of columns, written in shards of a fixed
+# number of records. Every shard is a directory with one `.npy` file per
+# column, so they can be memory-mapped and sliced without copying:
+#
+#   state   (N, state size)  uint8    the bot's state encoding
+#   legal   (N, actions)     bool     which of the model's outputs were legal
+#   action  (N,)             int16    the chosen output
+#   phase   (N,)             int8     0 for a player turn, 1 for giving cards
+#   ret     (N,)             float32  the discounted return from the move on
+#   game    (N,)             int64    which game the move was made in
+#
+# The give cards model has fewer outputs than the player turn model; the
+# legal mask is padded with False up to the width of the dataset.
+
+COLUMNS = ('state', 'legal', 'action', 'phase', 'ret', 'game')
+
+def shard_paths(directory) -> List[Path]:
+    # Finished shards only, in the order they were written
+    return sorted(
+        path for path in Path(directory).glob('shard-*')
+        if path.is_dir() and not path.name.endswith('.part')
+    )
+
+def load_shard(path, mmap: bool = True) -> Dict[str, np.ndarray]:
+    mode = 'r' if mmap else None
+    return { name: np.load(Path(path) / f'{name}.npy', mmap_mode = mode) for name in COLUMNS }
+
+
+def discounted_returns(rewards: Sequence[float], gamma: float = gamma) -> List[float]:
+    rets = [ 0.0 ] * len(rewards)
+    ret = 0.0
+    for t in reversed(range(len(rewards))):
+        ret = rewards[t] + gamma * ret
+        rets[t] = ret
+    return rets
+
+def decision_columns(
+    game_id: int, decisions: Sequence[Decision], rewards: Sequence[float],
+    num_actions: int, gamma: float = gamma
+) -> Dict[str, np.ndarray]:
+    # One player's decisions in a game as columns
+    if len(decisions) != len(rewards):
+        raise ValueError(f"Got {len(decisions)} decisions but {len(rewards)} rewards")
+    T = len(decisions)
+    legal = np.zeros((T, num_actions), dtype = bool)
+    for t, decision in enumerate(decisions):
+        legal[t, :len(decision.legal)] = decision.legal.numpy()
+    return {
+        'state':  (np.stack([ decision.state.numpy() for decision in decisions ]).astype(np.uint8)
+                   if T else np.zeros((0, 0), dtype = np.uint8)),
+        'legal':  legal,
+        'action': np.array([ decision.action for decision in decisions ], dtype = np.int16),
+        'phase':  np.array([ decision.phase for decision in decisions ], dtype = np.int8),
+        'ret':    np.array(discounted_returns(rewards, gamma), dtype = np.float32),
+        'game':   np.full(T, game_id, dtype = np.int64)
+    }
+
+def concat_columns(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    # Games without decisions don't know the width of the states, so leave
+    # them out
+    parts = [ part for part in parts if len(part['action']) > 0 ] or parts[:1]
+    return { name: np.concatenate([ part[name] for part in parts ]) for name in COLUMNS }
+
+def to_batch(columns: Dict[str, np.ndarray]) -> Dict[str, torch.Tensor]:
+    # Tensors for `train_on_batch`, sharing memory with the columns where
+    # they can
+    batch = { name: torch.from_numpy(np.ascontiguousarray(data)) for name, data in columns.items() }
+    batch['state']  = batch['state'].float()
+    batch['action'] = batch['action'].long()
+    return batch
+
+
+class TrajectoryWriter:
+    def __init__(
+        self, directory, state_size: int, num_actions: int,
+        shard_size: int = 1 << 16, gamma: float = gamma
+    ):
+        self._dir = Path(directory)
+        os.makedirs(self._dir, exist_ok = True)
+        self.gamma      = gamma
+        self.shard_size = shard_size
+
+        self._columns = {
+            'state':  np.zeros((shard_size, state_size),  dtype = np.uint8),
+            'legal':  np.zeros((shard_size, num_actions), dtype = bool),
+            'action': np.zeros(shard_size, dtype = np.int16),
+            'phase':  np.zeros(shard_size, dtype = np.int8),
+            'ret':    np.zeros(shard_size, dtype = np.float32),
+            'game':   np.zeros(shard_size, dtype = np.int64)
+        }
+        self._size   = 0
+        self._shards = len(shard_paths(self._dir))
+
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
+    def __len__(self):
+        # Records not yet written to a shard
+        return self._size
+
+
+    def add_game(self, game_id: int, decisions: Sequence[Decision], rewards: Sequence[float]):
+        # One player's decisions in a game, with the reward given for each,
+        # as in the trajectories passed to `PlayerBot.do_training`
+        self.add_columns(decision_columns(
+            game_id, decisions, rewards, self._columns['legal'].shape[1], self.gamma
+        ))
+
+    def add_columns(self, columns: Dict[str, np.ndarray]):
+        start = 0
+        total = len(columns['action'])
+        while start < total:
+            n = min(total - start, self.shard_size - self._size)
+            for name, data in self._columns.items():
+                data[self._size:self._size + n] = columns[name][start:start + n]
+            self._size += n
+            start += n
+            if self._size == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        # Write what there is as a shard, which can be smaller than the others
+        if self._size == 0:
+            return
+
+        name = f'shard-{self._shards:05}'
+        part = self._dir / f'{name}.part'
+        if part.exists():
+            shutil.rmtree(part)
+        os.makedirs(part)
+        for column, data in self._columns.items():
+            np.save(part / f'{column}.npy', data[:self._size])
+        # Readers never see a shard that is only partly written
+        os.replace(part, self._dir / name)
+
+        self._shards += 1
+        self._size = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryDataset(Dataset):
+    # The records of a directory of shards, read through memory maps. Items
+    # are whole batches: indexing with an array of record indices gives a
+    # dict of tensors, gathered straight from the maps with NumPy, so use it
+    # with `batch_size = None` and a sampler of index arrays, like
+    # `ShuffledBatchSampler`. `phase` keeps only the records of that phase.
+    def __init__(self, directory, phase: Optional[int] = None):
+        self._paths = shard_paths(directory)
+        self._shards = None
+
+        phases = [ np.load(path / 'phase.npy', mmap_mode = 'r') for path in self._paths ]
+        self._starts = np.cumsum([ 0 ] + [ len(column) for column in phases ])
+        if phase is None:
+            self._records = None
+        else:
+            # Where the records of the phase are in all the shards
+            found = [ start + np.flatnonzero(column == phase)
+                      for start, column in zip(self._starts, phases) ]
+            self._records = np.concatenate(found) if found else np.zeros(0, dtype = np.int64)
+
+    def __len__(self):
+        return int(self._starts[-1]) if self._records is None else len(self._records)
+
+    def __getstate__(self):
+        # Every worker process maps the shards for itself
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def _open(self):
+        if self._shards is None:
+            self._shards = [ load_shard(path) for path in self._paths ]
+        return self._shards
+
+    def __getitem__(self, indices) -> Dict[str, torch.Tensor]:
+        indices = np.asarray(indices, dtype = np.int64)
+        if self._records is not None:
+            indices = self._records[indices]
+        # Reading in order is kinder to the page cache
+        indices = np.sort(indices)
+
+        shards = self._open()
+        cuts = np.searchsorted(indices, self._starts)
+        parts = { name: [] for name in COLUMNS }
+        for k, shard in enumerate(shards):
+            if cuts[k] == cuts[k + 1]:
+                continue
+            local = indices[cuts[k]:cuts[k + 1]] - self._starts[k]
+            for name in COLUMNS:
+                parts[name].append(shard[name][local])
+
+        return to_batch({ name: np.concatenate(arrays) for name, arrays in parts.items() })
+
+
+class ShuffledBatchSampler(Sampler):
+    # Batches of record indices, shuffled across all the shards, with a new
+    # order every epoch
+    def __init__(self, num_records: int, batch_size: int, drop_last: bool = False, seed = None):
+        self.num_records = num_records
+        self.batch_size  = batch_size
+        self.drop_last   = drop_last
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_records // self.batch_size
+        return -(-self.num_records // self.batch_size)
+
+    def __iter__(self):
+        order = self._rng.permutation(self.num_records)
+        for k in range(len(self)):
+            yield order[k * self.batch_size:(k + 1) * self.batch_size]
+
+
+def trajectory_loader(
+    directory, batch_size: int = 512, phase: Optional[int] = None,
+    num_workers: int = 0, drop_last: bool = False, seed = None
+) -> DataLoader:
+    dataset = TrajectoryDataset(directory, phase)
+    sampler = ShuffledBatchSampler(len(dataset), batch_size, drop_last, seed)
+    return DataLoader(
+        dataset, batch_size = None, sampler = sampler, num_workers = num_workers,
+        persistent_workers = num_workers > 0
+    )
@@ -0,0 +1,213 @@
+import math
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from card.seeding import derive_seed
+from .playerbot import PlayerBot
+from .selfplay import play_episode
+from .pool import WarmPool
+
+
+# Head-to-head evaluation of bot checkpoints, the files `Sjuan` loads for
+# 'robot' players. Every pair of bots plays rounds of two games with the same
+# deal, one with each bot in each seat, so neither gets the better cards or
+# goes first more often. Rounds are handed to a process pool in batches, a
+# few rounds of every undecided pair at a time, and a pair stops as soon as
+# its result is decisive:
+#
+#   'sprt'  a sequential probability ratio test of the first bot winning
+#           with probability `p1` against `p0`, which has to be `1 - p1` so
+#           that the test treats both bots alike
+#   'ci'    the Wilson confidence interval of its win rate no longer
+#           containing one half
+#
+# Bots play greedily, as they do against people.
+
+class PairResult(NamedTuple):
+    wins:     int
+    games:    int
+    # 1 if the first bot is better, -1 if it isn't (with 'sprt', it doesn't
+    # win as often as `p1`; with 'ci', the second bot is better), 0 if
+    # undecided
+    decision: int
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.5
+
+
+def sprt_llr(wins: int, losses: int, p0: float, p1: float) -> float:
+    return wins * math.log(p1 / p0) + losses * math.log((1 - p1) / (1 - p0))
+
+def sprt_decision(wins: int, losses: int, p0: float = 0.45, p1: float = 0.55,
+                  alpha: float = 0.05, beta: float = 0.05) -> int:
+    llr = sprt_llr(wins, losses, p0, p1)
+    if llr >= math.log((1 - beta) / alpha):
+        return 1
+    if llr <= math.log(beta / (1 - alpha)):
+        return -1
+    return 0
+
+def wilson_interval(wins: int, games: int, z: float = 1.96) -> Tuple[float, float]:
+    if games == 0:
+        return 0.0, 1.0
+    p = wins / games
+    centre = (p + z * z / (2 * games)) / (1 + z * z / games)
+    half = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return centre - half, centre + half
+
+def ci_decision(wins: int, games: int, z: float = 1.96) -> int:
+    low, high = wilson_interval(wins, games, z)
+    return 1 if low > 0.5 else -1 if high < 0.5 else 0
+
+
+def checkpoint_names(paths: Sequence[str]) -> List[str]:
+    # Bots are saved as '<name>.bot' in a directory per checkpoint, so the
+    # same name can come from several of them
+    stems = [ Path(path).stem for path in paths ]
+    return [
+        f'{Path(path).parent.parent.name}/{stem}' if stems.count(stem) > 1 else stem
+        for path, stem in zip(paths, stems)
+    ]
+
+
+# In the pool's processes
+_bots: List[PlayerBot] = []
+_cards_grouped = None
+
+def _init_worker(paths: Sequence[str], names: Sequence[str], cards_grouped):
+    global _bots, _cards_grouped
+    torch.set_num_threads(1)
+    _cards_grouped = cards_grouped
+    _bots = []
+    for i, (path, name) in enumerate(zip(paths, names)):
+        bot = PlayerBot(None, cards_grouped, i, name = name)
+        bot.load_checkpoint(path)
+        _bots.append(bot)
+
+def _play_round(task: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    # (i, j, seed) -> (i, j, how many of the two games bot i won)
+    i, j, seed = task
+    wins = 0
+    for seats in ((i, j), (j, i)):
+        torch.manual_seed(seed)
+        with torch.no_grad():
+            episode = play_episode([ _bots[k] for k in seats ], _cards_grouped,
+                                   greedy = True, rng = seed)
+        wins += seats[episode.winner] == i
+    return i, j, wins
+
+
+class Evaluation:
+    def __init__(
+        self, paths: Sequence[str], cards_grouped, processes: int = 1,
+        test: str = 'sprt', max_games: int = 1000, min_games: int = 20,
+        seed: int = 0, **test_args
+    ):
+        if len(paths) < 2:
+            raise ValueError("Need at least two checkpoints to compare")
+        if test not in ('sprt', 'ci'):
+            raise ValueError(f"Unknown test {test!r}")
+        if test == 'sprt':
+            p0, p1 = test_args.get('p0', 0.45), test_args.get('p1', 0.55)
+            if not (p0 < 0.5 < p1 and math.isclose(p0, 1 - p1)):
+                raise ValueError(f"SPRT win rates must be p0 = 1 - p1 < 0.5, got p0 = {p0}, p1 = {p1}")
+        self.paths         = [ str(path) for path in paths ]
+        self.names         = checkpoint_names(self.paths)
+        self.cards_grouped = cards_grouped
+        self.processes     = processes
+        self.test          = test
+        self.test_args     = test_args
+        # Per pair, counted in games (two per round)
+        self.max_games     = max_games
+        self.min_games     = min_games
+        self.seed          = seed
+
+        n = len(self.paths)
+        self.pairs = [ (i, j) for i in range(n) for j in range(i + 1, n) ]
+        self.results: Dict[Tuple[int, int], PairResult] = {
+            pair: PairResult(0, 0, 0) for pair in self.pairs
+        }
+
+    def _decide(self, wins: int, games: int) -> int:
+        if games < self.min_games:
+            return 0
+        if self.test == 'sprt':
+            return sprt_decision(wins, games - wins, **self.test_args)
+        return ci_decision(wins, games, **self.test_args)
+
+    def _done(self, pair) -> bool:
+        result = self.results[pair]
+        return result.decision != 0 or result.games >= self.max_games
+
+    def run(self, on_result = None):
+        # Plays until every pair is decided or has played `max_games`;
+        # `on_result(pair, result)` is called after every round. Each wave
+        # gives every undecided pair up to `min_games` more games, so a pair
+        # can play that many more than it needed to be decided.
+        rounds = { pair: 0 for pair in self.pairs }
+        wave_rounds = max(1, self.min_games // 2)
+
+        with WarmPool(
+            self.processes, _init_worker, (self.paths, self.names, self.cards_grouped)
+        ) as pool:
+            while True:
+                per_pair = {
+                    pair: min(wave_rounds, (self.max_games - self.results[pair].games) // 2)
+                    for pair in self.pairs if not self._done(pair)
+                }
+                if not any(per_pair.values()):
+                    break
+                # Round-robin over the pairs, so each batch mixes them
+                wave = [
+                    (i, j, derive_seed(self.seed, self.pairs.index((i, j)), rounds[(i, j)] + k))
+                    for k in range(max(per_pair.values()))
+                    for (i, j), n in per_pair.items() if k < n
+                ]
+                for pair, n in per_pair.items():
+                    rounds[pair] += n
+
+                for i, j, wins in pool.imap_unordered(_play_round, wave):
+                    if self._done((i, j)):
+                        continue
+                    old = self.results[(i, j)]
+                    w, g = old.wins + wins, old.games + 2
+                    self.results[(i, j)] = PairResult(w, g, self._decide(w, g))
+                    if on_result is not None:
+                        on_result((i, j), self.results[(i, j)])
+        return self
+
+    def win_rate_matrix(self) -> np.ndarray:
+        # [i, j]: how often bot i beat bot j, NaN on the diagonal
+        n = len(self.paths)
+        matrix = np.full((n, n), np.nan)
+        for (i, j), result in self.results.items():
+            matrix[i, j] = result.win_rate
+            matrix[j, i] = 1 - result.win_rate
+        return matrix
+
+    def table(self) -> str:
+        # Rows and columns by index, as names can be long
+        n = len(self.names)
+        matrix = self.win_rate_matrix()
+        lines = [ '     ' + ''.join(f' {f"[{j}]":>6}' for j in range(n)) ]
+        for i, name in enumerate(self.names):
+            cells = ''.join(
+                f' {"-":>6}' if i == j else f' {matrix[i, j]:>6.3f}' for j in range(n)
+            )
+            lines.append(f'{f"[{i}]":<5}' + cells + f'  {name}')
+        return '\n'.join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            'paths':    self.paths,
+            'names':    self.names,
+            'test':     self.test,
+            'win_rate': [ [ None if math.isnan(x) else x for x in row ]
+                          for row in self.win_rate_matrix().tolist() ],
+            'pairs':    [ { 'first': i, 'second': j, **result._asdict() }
+                          for (i, j), result in self.results.items() ]
+        }
@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+
+# Batched forward passes for bots playing many games at once. Games, each in
+# a thread of its own, hand in a state encoding and the model to run it
+# through, and wait; a server thread collects what comes in until it has
+# `max_batch` states or `max_wait` seconds have gone by since the first one,
+# then runs one forward pass per model and hands every game its row of the
+# logits. Games don't run any faster for the threads, but the forward
+# passes, which are mostly overhead for a single state, are shared.
+#
+# Each bot's player turn and give cards models are just different models
+# here, as are the models of different bots. Forward passes are made without
+# gradients, so bots that use a server are for playing; they can be trained
+# on their stored decisions with `train_on_batch`.
+
+_STOP = None
+
+class InferenceServer:
+    def __init__(self, max_batch: int = 256, max_wait: float = 0.002):
+        self.max_batch = max_batch
+        self.max_wait  = max_wait
+        # Held during forward passes, so that weights can be swapped safely
+        self.lock = threading.Lock()
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        # Held while checking that the server is running and handing in a
+        # request, so that none come in after it has been told to stop
+        self._running = threading.Lock()
+
+        self.batches  = 0
+        self.requests = 0
+
+    def start(self):
+        with self._running:
+            if self._thread is None:
+                self._thread = threading.Thread(target = self._run, name = 'inference', daemon = True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        # Answers everything handed in so far; anything after is refused
+        with self._running:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+
+    def submit(self, model: nn.Module, state: torch.Tensor) -> Future:
+        future = Future()
+        with self._running:
+            if self._thread is None:
+                raise RuntimeError("The inference server isn't running")
+            self._queue.put((model, state, future))
+        return future
+
+    def infer(self, model: nn.Module, state: torch.Tensor) -> torch.Tensor:
+        return self.submit(model, state).result()
+
+
+    def _collect(self) -> Tuple[List, bool]:
+        # The next batch of requests, and whether to stop after it
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        pending = [ first ]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout = timeout)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                return pending, True
+            pending.append(item)
+        return pending, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            pending, stop = self._collect()
+            if not pending:
+                continue
+
+            by_model: Dict[int, Tuple[nn.Module, List]] = {}
+            for model, state, future in pending:
+                by_model.setdefault(id(model), (model, []))[1].append((state, future))
+
+            for model, items in by_model.values():
+                try:
+                    with self.lock, torch.no_grad():
+                        logits = model(torch.stack([ state for state, _ in items ]))
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                for k, (_, future) in enumerate(items):
+                    future.set_result(logits[k])
+                self.batches  += 1
+                self.requests += len(items)
@@ -1,9 +1,15 @@
 import os
 import math
+import mmap
+import queue
 import re
+import shutil
+import threading
 from datetime import datetime
 from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
 
+import numpy as np
 import torch
 from bitarray import bitarray
 
@@ -27,130 +33,500 @@ def num(bits):
 bits_per_card = math.ceil(math.log2(52))
 
 def card_to_bits(card):
-    return bits(1 + (card.suit.value - 1) * 13 + (card.value.value - 2), bits_per_card)
+    return bits(1 + card.id, bits_per_card)
 
 def num_to_card(n):
-    n -= 1
-    return Card(CardSuit(1 + n // 13), CardValue(2 + n % 13))
+    return Card.from_id(n - 1)
+
+
+class BitWriter:
+    # Packs fixed-width big-endian fields into a byte buffer, which a
+    # background thread appends to the file whenever it fills up
+    def __init__(self, path, chunk_size: int = 1 << 20):
+        self._file       = open(path, 'wb')
+        self._chunk_size = chunk_size
+        self._buffer     = bytearray(chunk_size + 1024)
+        self._pos        = 0
+        # Bits not making up a whole byte yet
+        self._acc      = 0
+        self._acc_bits = 0
+
+        self._chunks = queue.Queue(maxsize = 8)
+        self._error  = None
+        self._thread = threading.Thread(target = self._write_chunks, daemon = True)
+        self._thread.start()
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            if self._error is None:
+                try:
+                    self._file.write(chunk)
+                except OSError as e:
+                    self._error = e
+
+    def write(self, value: int, width: int):
+        if value >> width:
+            raise OverflowError(f'Value {value} does not fit in {width} bits')
+        acc_bits = self._acc_bits + width
+        acc = (self._acc << width) | value
+        if acc_bits >= 64:
+            n   = acc_bits >> 3
+            rem = acc_bits & 7
+            pos = self._pos
+            self._buffer[pos:pos + n] = (acc >> rem).to_bytes(n, 'big')
+            self._pos = pos + n
+            acc &= (1 << rem) - 1
+            acc_bits = rem
+        self._acc, self._acc_bits = acc, acc_bits
+        if self._pos >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        # Hands every whole byte written so far to the background thread
+        if self._error is not None:
+            raise self._error
+        n = self._acc_bits >> 3
+        if n:
+            rem = self._acc_bits & 7
+            self._buffer[self._pos:self._pos + n] = (self._acc >> rem).to_bytes(n, 'big')
+            self._pos += n
+            self._acc &= (1 << rem) - 1
+            self._acc_bits = rem
+        if self._pos:
+            self._chunks.put(bytes(memoryview(self._buffer)[:self._pos]))
+            self._pos = 0
+
+    def close(self):
+        # Pads the last byte with zeros, like `bitarray.tofile`
+        if self._acc_bits & 7:
+            self.write(0, 8 - (self._acc_bits & 7))
+        self.flush()
+        self._chunks.put(None)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
 
 
 class SessionSaver:
-    def __init__(self, bots, extraname = None):
+    # Checkpoints are written from a background thread, so `save` only takes
+    # a copy of the weights. Bots whose weights haven't changed since the
+    # last checkpoint are linked to from there rather than written again.
+    #
+    # With `keep_last`, the models of all but the last `keep_last`
+    # checkpoints are deleted, except for the `keep_best` ones with the best
+    # metric passed to `save`. The games are always kept.
+    def __init__(
+        self, bots, extraname = None, keep_last: Optional[int] = None,
+        keep_best: int = 0, higher_is_better: bool = True
+    ):
         self._bots = bots
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.higher_is_better = higher_is_better
 
         self._bits_per_phase  = 1
         self._bits_per_player = math.ceil(math.log2(1 + len(bots)))
         self._bits_per_move   = math.ceil(math.log2(10))
+        self._bits_per_record = self._bits_per_phase + self._bits_per_player + self._bits_per_move
 
         self._foldername = f'Session{(" " + extraname if extraname else "")} {get_date()}'
         self._root = Path.cwd() / 'saved_models'
         self._dir  = (self._root / self._foldername).resolve()
         os.makedirs(self._dir)
 
+        # Games are written to a new part file after every save, which is
+        # moved into place once the checkpoint is written
+        self._segment   = 0
+        self._part_path = None
+        self._writer    = None
+        # Whether the last deal's game still has to be ended
+        self._in_game   = False
+
+        # `bot.updates` when each bot was last saved, and where to
+        self._saved_updates = [ None for bot in bots ]
+        self._saved_paths   = [ None for bot in bots ]
+        # (models directory, metric) of each checkpoint still there
+        self._checkpoints = []
+
+        self._jobs   = queue.Queue()
+        self._error  = None
+        self._thread = threading.Thread(target = self._do_jobs, daemon = True)
+        self._thread.start()
+
         self._its = 0
         self.reset_bits()
 
 
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
     def write_bits(self, x):
-        self._bits.extend(x)
+        self._writer.write(num(x), len(x))
 
     def reset_bits(self):
-        self._bits = bitarray([])
-        self.write_bits(bits(self._bits_per_player, 8))
-        self.write_bits(bits(self._bits_per_move,   8))
+        if self._writer is not None:
+            self._writer.close()
+        self._segment  += 1
+        self._part_path = self._dir / f'games.data.part{self._segment}'
+        self._writer = BitWriter(self._part_path)
+        self._writer.write(self._bits_per_player, 8)
+        self._writer.write(self._bits_per_move,   8)
 
 
     def new_iteration(self, players, indices):
+        self._end_game()
         self._its += 1
-        if self._its > 1:
-            self.write_bits(bits(0, self._bits_per_phase + self._bits_per_player + self._bits_per_move))
+        self._in_game = True
+
+        # The whole deal as one number
+        p_width = self._bits_per_player
+        value = width = 0
         for i, player in enumerate(players):
-            self.write_bits(bits(1 + indices[i], self._bits_per_player))
+            if (1 + indices[i]) >> p_width:
+                raise OverflowError(f'Bot index {indices[i]} does not fit in {p_width} bits')
+            value = (value << p_width) | (1 + indices[i])
             for card in player.cards:
-                self.write_bits(card_to_bits(card))
-            self.write_bits(bits(0, bits_per_card))
-        self.write_bits(bits(0, self._bits_per_player))
+                value = (value << bits_per_card) | (1 + card.id)
+            value <<= bits_per_card
+            width += p_width + bits_per_card * (len(player.cards) + 1)
+        self._writer.write(value << p_width, width + p_width)
 
     def register_move(self, phase_i, player_i, move_i):
-        self.write_bits(bits(phase_i,  self._bits_per_phase))
-        self.write_bits(bits(player_i, self._bits_per_player))
-        self.write_bits(bits(move_i,   self._bits_per_move))
-
-
-    def save(self):
+        if phase_i >> self._bits_per_phase or player_i >> self._bits_per_player \
+                or move_i >> self._bits_per_move:
+            raise OverflowError(f'Move {(phase_i, player_i, move_i)} does not fit')
+        # Each move is flagged, so that a clear flag can end the game
+        self._writer.write(
+            (((((1 << self._bits_per_phase) | phase_i) << self._bits_per_player) | player_i)
+                << self._bits_per_move) | move_i,
+            1 + self._bits_per_record
+        )
+
+    def _end_game(self):
+        if self._in_game:
+            self._writer.write(0, 1)
+            self._in_game = False
+
+
+    def save(self, metric: Optional[float] = None):
+        # Raises any error from writing the last checkpoint
+        self._raise_error()
         localname = f'{self._its} iterations ({get_date()})'
         localpath = self._dir / localname
-        os.makedirs(localpath)
 
-        models_path = (localpath / 'models').resolve()
-        os.makedirs(models_path)
+        snapshots = {}
         for i, bot in enumerate(self._bots):
-            torch.save({
-                'player_turn_model': bot._player_turn_model.model.state_dict(),
-                'give_cards_model':  bot._give_cards_model.model.state_dict()
-            }, models_path / f'{bot.name}.bot')
-
-        file_path = (localpath / 'games.data').resolve()
-        with open(file_path, 'wb') as file:
-            self._bits.tofile(file)
+            if bot.updates != self._saved_updates[i]:
+                snapshots[i] = { model: _clone(weights) for model, weights in bot.state_dict().items() }
+                self._saved_updates[i] = bot.updates
+
+        # The games so far are finished off in the background too
+        self._end_game()
+        writer, part_path = self._writer, self._part_path
+        self._writer = None
         self.reset_bits()
+        self._jobs.put((localpath, snapshots, writer, part_path, metric))
+
+    def wait(self):
+        # Until every checkpoint so far is written
+        self._jobs.join()
+        self._raise_error()
+
+    def close(self):
+        # The games played since the last checkpoint stay in their part file
+        self.wait()
+        self._jobs.put(None)
+        self._thread.join()
+        if self._writer is not None:
+            self._end_game()
+            self._writer.close()
+            self._writer = None
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _do_jobs(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                self._write_checkpoint(*job)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._jobs.task_done()
+
+    def _write_checkpoint(self, localpath, snapshots, writer, part_path, metric):
+        os.makedirs(localpath)
+        # Written next to where they go, then renamed, so that the models
+        # directory is only ever there whole
+        models_part = localpath / 'models.part'
+        try:
+            os.makedirs(models_part)
+            for i, bot in enumerate(self._bots):
+                path = models_part / f'{bot.name}.bot'
+                if i in snapshots:
+                    torch.save(snapshots[i], path)
+                else:
+                    _link_or_copy(self._saved_paths[i], path)
+            models_path = localpath / 'models'
+            os.replace(models_part, models_path)
+        except BaseException:
+            # The next checkpoint writes these bots again rather than linking
+            # to models that aren't there
+            shutil.rmtree(models_part, ignore_errors = True)
+            for i in snapshots:
+                self._saved_updates[i] = None
+            raise
+        finally:
+            # The games are kept whatever happens to the models, and only
+            # moved into place once they're all written
+            writer.close()
+            os.replace(part_path, localpath / 'games.data')
+
+        for i, bot in enumerate(self._bots):
+            self._saved_paths[i] = models_path / f'{bot.name}.bot'
+        self._checkpoints.append((models_path, metric))
+        self._prune()
+
+    def _prune(self):
+        if self.keep_last is None:
+            return
+        # The last checkpoint is always kept, as the next one links to it
+        keep = { path for path, _ in self._checkpoints[-max(1, self.keep_last):] }
+        scored = sorted(
+            (c for c in self._checkpoints if c[1] is not None),
+            key = lambda c: c[1], reverse = self.higher_is_better
+        )
+        keep.update(path for path, _ in scored[:self.keep_best])
+
+        for path, metric in list(self._checkpoints):
+            if path not in keep:
+                shutil.rmtree(path, ignore_errors = True)
+                self._checkpoints.remove((path, metric))
+
+
+def _clone(state):
+    return { key: value.detach().clone() for key, value in state.items() }
+
+def _link_or_copy(source: Path, path: Path):
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+
+
+# Reading back what `SessionSaver` wrote. A games.data file holds:
+#
+#   header: bits per player, bits per move (8 bits each)
+#   for each iteration:
+#     for each player: 1 + bot index, then 1 + id of each card, then 0
+#     0 (in bits per player)
+#     for each move: 1 (1 bit), phase (1 bit), player, move index
+#     0 (1 bit)
+#
+# So the end of an iteration's moves is found from the flag bits alone, at
+# a fixed stride from where they start, whatever the moves are.
+
+class BitReader:
+    # Reads fixed-width big-endian fields by bit offset, without copying or
+    # changing anything
+    def __init__(self, buffer):
+        self._buffer  = buffer
+        self.num_bits = 8 * len(buffer)
+
+    def read(self, offset: int, width: int) -> int:
+        start = offset >> 3
+        end   = (offset + width + 7) >> 3
+        if end > len(self._buffer):
+            raise EOFError(f"Reading {width} bits at bit {offset} of {self.num_bits}")
+        word = int.from_bytes(self._buffer[start:end], 'big')
+        return (word >> (8 * (end - start) - (offset & 7) - width)) & ((1 << width) - 1)
+
+
+class RecordedDeal(NamedTuple):
+    # Index of each player's bot
+    bots:  List[int]
+    hands: List[List[Card]]
+    # Bit offset of the first move
+    moves_offset: int
+
+class RecordedMove(NamedTuple):
+    # 0 for a player's turn, 1 for giving cards
+    phase:  int
+    player: int
+    move:   int
+
+
+class SessionFile:
+    HEADER_BITS = 16
+
+    def __init__(self, path, rebuild_index: bool = False):
+        self._path = Path(path)
+        self._file = open(self._path, 'rb')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._mmap = b''
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        self._reader = BitReader(self._mmap)
+
+        self.bits_per_phase  = 1
+        self.bits_per_player = self._reader.read(0, 8)
+        self.bits_per_move   = self._reader.read(8, 8)
+        self.bits_per_record = self.bits_per_phase + self.bits_per_player + self.bits_per_move
+
+        # Where each iteration's deal starts and where its moves end, as bit
+        # offsets; kept next to the data so it's only worked out once
+        index_path = self._path.with_name(self._path.name + '.index.npy')
+        if (not rebuild_index and index_path.exists()
+                and index_path.stat().st_mtime >= self._path.stat().st_mtime):
+            self._index = np.load(index_path)
+        else:
+            self._index = self._build_index()
+            try:
+                np.save(index_path, self._index)
+            except OSError:
+                pass
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def read_deal(self, offset: int) -> RecordedDeal:
+        # The whole deal is read at once as one (big) int
+        p_width = self.bits_per_player
+        c_width = bits_per_card
+        max_bits = 2 * Card.NUM_CARDS * c_width + (Card.NUM_CARDS + 1) * p_width
+        num_bits = min(max_bits, self._reader.num_bits - offset)
+        word = self._reader.read(offset, num_bits) if num_bits > 0 else 0
+        pos = num_bits
+        p_mask, c_mask = (1 << p_width) - 1, (1 << c_width) - 1
+
+        def no_deal():
+            return ValueError(f"No deal at bit {offset} of {self._path}")
+
+        seen  = 0
+        bots  = []
+        hands = []
+        while True:
+            pos -= p_width
+            if pos < 0:
+                raise no_deal()
+            bot = (word >> pos) & p_mask
+            if bot == 0:
+                return RecordedDeal(bots, hands, offset + num_bits - pos)
+            bots.append(bot - 1)
+            hand = []
+            while True:
+                pos -= c_width
+                if pos < 0:
+                    raise no_deal()
+                card_num = (word >> pos) & c_mask
+                if card_num == 0:
+                    break
+                if card_num > Card.NUM_CARDS or (seen >> card_num) & 1:
+                    raise no_deal()
+                seen |= 1 << card_num
+                hand.append(num_to_card(card_num))
+            hands.append(hand)
+
+    def _moves_end(self, offset: int) -> int:
+        # Where the moves from the offset end: at the first clear flag bit,
+        # or the end of the file if the session was cut off
+        stride = 1 + self.bits_per_record
+        data = np.frombuffer(self._mmap, dtype = np.uint8)
+        while offset < self._reader.num_bits:
+            count = min(256, (self._reader.num_bits - 1 - offset) // stride + 1)
+            lo = offset >> 3
+            hi = ((offset + (count - 1) * stride) >> 3) + 1
+            flags = np.unpackbits(data[lo:hi])[offset - 8 * lo::stride][:count]
+            ends = np.flatnonzero(flags == 0)
+            if len(ends):
+                return offset + int(ends[0]) * stride
+            offset += count * stride
+        return self._reader.num_bits
+
+    def _build_index(self) -> np.ndarray:
+        # One row of (deal offset, end of moves offset) per iteration
+        rows = []
+        offset = self.HEADER_BITS
+        # Fewer than 8 bits after the last iteration are just padding to a
+        # whole byte
+        while self._reader.num_bits - offset >= 8:
+            moves_end = self._moves_end(self.read_deal(offset).moves_offset)
+            rows.append((offset, moves_end))
+            offset = moves_end + 1
+        return np.array(rows, dtype = np.int64).reshape(-1, 2)
+
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def deal(self, k: int) -> RecordedDeal:
+        return self.read_deal(int(self._index[k, 0]))
+
+    def moves(self, k: int) -> Iterator[RecordedMove]:
+        read = self._reader.read
+        offset = self.deal(k).moves_offset
+        end = int(self._index[k, 1])
+        p_width, m_width = self.bits_per_player, self.bits_per_move
+        # Past each move's flag bit; a move cut off at the end isn't read
+        offset += 1
+        while offset + self.bits_per_record <= end:
+            yield RecordedMove(
+                read(offset, 1),
+                read(offset + 1, p_width),
+                read(offset + 1 + p_width, m_width)
+            )
+            offset += 1 + self.bits_per_record
+
+    def num_moves(self, k: int) -> int:
+        return (int(self._index[k, 1]) - self.deal(k).moves_offset) // (1 + self.bits_per_record)
+
+    def __getitem__(self, k: int) -> Tuple[RecordedDeal, List[RecordedMove]]:
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(f"Iteration {k} out of range")
+        return self.deal(k), list(self.moves(k))
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
 
 
 class SessionReader:
     def __init__(self, dirpath, names):
         self._dirpath = dirpath
-        self._bits    = bitarray([])
         self._names   = names
+        self._file    = SessionFile((dirpath / 'games.data').resolve())
+        self._its     = 0
 
-        file_path = (dirpath / 'games.data').resolve()
-        with open(file_path, 'rb') as file:
-            self._bits.fromfile(file)
-
-        self._bits_per_phase  = 1
-        self._bits_per_player = num(self.read_bits(8))
-        self._bits_per_move   = num(self.read_bits(8))
-
-    def read_bits(self, n):
-        bits = []
-        i = n
-        while i > 0:
-            bits.append(self._bits.pop(0))
-            i -= 1
-        return bits
+        self._bits_per_phase  = self._file.bits_per_phase
+        self._bits_per_player = self._file.bits_per_player
+        self._bits_per_move   = self._file.bits_per_move
 
+    def __len__(self):
+        return len(self._file)
 
     def read_iteration(self):
-        # Read player hands
-        player_names = []
-        player_hands = []
-        all_cards    = []
-        new = True
-        while True:
-            if new:
-                player_i = num(self.read_bits(self._bits_per_player))
-                if player_i == 0:
-                    break
-                else:
-                    player_hands.append([])
-                    player_names.append(self._names[player_i - 1])
-                new = False
-            else:
-                card_num = num(self.read_bits(bits_per_card))
-                if card_num == 0:
-                    new = True
-                else:
-                    card = num_to_card(card_num)
-                    player_hands[-1].append(card)
-                    all_cards.append(card)
-        player_hands_original = deepcopy(player_hands)
-
-        # Initialise game
-        game = SjuanGame(num_players = len(player_hands),
-                         cards       = all_cards,
-                         hands       = player_hands
-                         )
-
-        # Read player hands
-        stack = {}
-
-        return player_hands
+        # The next iteration's starting hands
+        deal = self._file.deal(self._its)
+        self._its += 1
+        return deal.hands
@@ -0,0 +1,269 @@
+import math
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+from card import mask_ids
+from card.games.sjuan import SjuanEngine, MOVE_SKIP, PHASE_GIVE_CARDS
+from .pool import WarmPool
+
+
+# Information set Monte Carlo tree search (single observer): every iteration
+# deals the cards the bot can't see at random among the other players, in the
+# numbers they hold, and walks one tree shared by all those deals, only
+# choosing between the moves that are legal in the current one. Moves are
+# `SjuanEngine` moves.
+#
+# Several trees can be searched at once in a process pool, one per process,
+# with their root visit counts added up at the end (root parallelisation).
+#
+# The cards the bot has given someone who asked for them aren't hidden from
+# it: they stay in that player's hand in every deal, until they're played or
+# the player gives cards to someone else.
+
+class _Node:
+    __slots__ = ('parent', 'move', 'seat', 'children', 'visits', 'avail', 'reward')
+
+    def __init__(self, parent: Optional['_Node'] = None, move: Optional[int] = None,
+                 seat: Optional[int] = None):
+        self.parent   = parent
+        self.move     = move
+        # Who made the move leading here
+        self.seat     = seat
+        self.children: Dict[int, _Node] = {}
+        self.visits   = 0
+        # How many times the node could have been chosen
+        self.avail    = 1
+        self.reward   = 0.0
+
+    def ucb(self, exploration: float) -> float:
+        return (self.reward / self.visits
+                + exploration * math.sqrt(math.log(self.avail) / self.visits))
+
+
+def determinize(
+    engine: SjuanEngine, observer: int, rng: random.Random,
+    known: Optional[Sequence[int]] = None
+) -> SjuanEngine:
+    # A copy of the engine where everyone but `observer` has been dealt new
+    # hands from the cards the observer can't see. `known[i]` is a mask of
+    # cards the observer knows player i has, which they keep.
+    hidden = [ i for i in range(engine.num_players) if i != observer ]
+    known  = [ 0 ] * engine.num_players if known is None else list(known)
+    pool = mask_ids(sum(engine.hands[i] & ~known[i] for i in hidden))
+    rng.shuffle(pool)
+
+    hands = list(engine.hands)
+    start = 0
+    for i in hidden:
+        size = bin(hands[i]).count('1') - bin(known[i]).count('1')
+        hands[i] = known[i] | sum(1 << card_id for card_id in pool[start:start + size])
+        start += size
+
+    other = engine.copy()
+    other.set_hands(hands)
+    return other
+
+def rollout_move(engine: SjuanEngine, rng: random.Random) -> int:
+    # Play a random card if there is one, skipping before asking for cards
+    moves = engine.legal_moves()
+    cards = [ move for move in moves if move < MOVE_SKIP ]
+    if cards:
+        return rng.choice(cards)
+    return MOVE_SKIP if MOVE_SKIP in moves else moves[0]
+
+def scores(engine: SjuanEngine, num_seats: int) -> List[float]:
+    # 1 for winning first, 0 for coming last. Players still in the game are
+    # ranked by how many cards they have left.
+    order = list(engine.winners) + [
+        seat for _, seat in sorted(
+            (bin(hand).count('1'), seat)
+            for hand, seat in zip(engine.hands, engine.seats)
+        )
+    ]
+    res = [ 0.0 ] * num_seats
+    for place, seat in enumerate(order):
+        res[seat] = 1 - place / (num_seats - 1)
+    return res
+
+
+def search(
+    engine: SjuanEngine, observer: int, playouts: Optional[int] = None,
+    time_budget: Optional[float] = None, exploration: float = 0.7,
+    max_rollout: int = 500, seed = None, known: Optional[Sequence[int]] = None
+) -> Dict[int, int]:
+    # Visit counts of the root's moves after searching until either budget
+    # runs out (at least one is needed). `known` is as for `determinize`.
+    if playouts is None and time_budget is None:
+        raise ValueError("Need a playout or time budget")
+    rng = random.Random(seed)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    num_seats = engine.num_players
+    root = _Node()
+
+    n = 0
+    while ((playouts is None or n < playouts)
+           and (deadline is None or time.perf_counter() < deadline)):
+        n += 1
+        position = determinize(engine, observer, rng, known)
+        node = root
+
+        # Selection and expansion
+        while not position.is_terminal():
+            moves = position.legal_moves()
+            untried = [ move for move in moves if move not in node.children ]
+            seat = position.seats[position.turn]
+            if untried:
+                move = rng.choice(untried)
+                child = _Node(node, move, seat)
+                node.children[move] = child
+                for other in moves:
+                    if other != move and other in node.children:
+                        node.children[other].avail += 1
+                position.step(move)
+                node = child
+                break
+
+            children = [ node.children[move] for move in moves ]
+            node = max(children, key = lambda child: child.ucb(exploration))
+            for child in children:
+                child.avail += 1
+            position.step(node.move)
+
+        # Simulation
+        steps = 0
+        while not position.is_terminal() and steps < max_rollout:
+            position.step(rollout_move(position, rng))
+            steps += 1
+
+        # Backpropagation
+        result = scores(position, num_seats)
+        while node.parent is not None:
+            node.visits += 1
+            node.reward += result[node.seat]
+            node = node.parent
+
+    return { move: child.visits for move, child in root.children.items() }
+
+def _search_worker(args):
+    return search(*args)
+
+
+class ISMCTSBot:
+    def __init__(
+        self, sjuan, i: int, name: str = "unnamed", playouts: Optional[int] = 1000,
+        time_budget: Optional[float] = None, processes: int = 1,
+        exploration: float = 0.7, seed = None
+    ):
+        self._sjuan = sjuan
+        self._index = i
+        self._name  = name
+
+        # The budgets are per tree, so more processes search more in total
+        self.playouts    = playouts
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self._processes  = processes
+        self._pool       = None
+        self._rng        = random.Random(seed)
+
+        # Per hand (`CardHand`), the cards this bot has given it and knows it
+        # still has
+        self._given = {}
+        sjuan.game.state.listen(on_turn_change = self._turn_change)
+
+
+    @property
+    def sjuan(self):
+        return self._sjuan
+
+    @sjuan.setter
+    def sjuan(self, sjuan):
+        self._sjuan = sjuan
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def name(self):
+        return self._name
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _turn_change(self, old_phase, new_phase, players_changed):
+        # Someone giving cards to anyone but this bot may give away the ones
+        # it gave them, and it can't see which they give
+        def giving(i, _):
+            players = self._sjuan.game.state.players
+            if (i + 1) % len(players) != self._index:
+                self._given.pop(players[i], None)
+        new_phase.match(do_queue = lambda _: None, player_turn = lambda _: None,
+                        give_cards = giving)
+
+    def _known(self, engine: SjuanEngine) -> List[int]:
+        # What it gave that has since been played, or given back to it, is
+        # no longer in the other player's hand
+        players = self._sjuan.game.state.players
+        gone    = engine.stack_mask() | engine.hands[self._index]
+        self._given = {
+            player: self._given[player] & ~gone
+            for player in players if self._given.get(player, 0) & ~gone
+        }
+        return [ self._given.get(player, 0) for player in players ]
+
+
+    def visit_counts(self) -> Dict[int, int]:
+        state  = self._sjuan.game.state
+        engine = SjuanEngine.from_state(state)
+        legal  = engine.legal_moves()
+        if len(legal) == 1:
+            return { legal[0]: 1 }
+
+        known = self._known(engine)
+        jobs = [
+            (engine, self._index, self.playouts, self.time_budget,
+             self.exploration, 500, self._rng.getrandbits(64), known)
+            for i in range(self._processes)
+        ]
+        if self._processes == 1:
+            results = [ search(*jobs[0]) ]
+        else:
+            if self._pool is None:
+                # Not forked from this process, which may have a window open
+                self._pool = WarmPool(self._processes, preload = ('train.ismcts',))
+            results = self._pool.map(_search_worker, jobs, batch_size = 1)
+
+        counts = { move: 0 for move in legal }
+        for result in results:
+            for move, visits in result.items():
+                counts[move] += visits
+        return counts
+
+    def _pick(self, counts: Dict[int, int], sample: bool):
+        state  = self._sjuan.game.state
+        engine = SjuanEngine.from_state(state)
+        total  = sum(counts.values())
+        moves  = list(counts)
+        if sample:
+            chosen = self._rng.choices(moves, weights = [ counts[m] for m in moves ])[0]
+        else:
+            chosen = max(moves, key = lambda move: counts[move])
+
+        if engine.phase == PHASE_GIVE_CARDS:
+            receiver = state.players[(engine.turn + 1) % engine.num_players]
+            self._given[receiver] = self._given.get(receiver, 0) | (1 << chosen)
+
+        legal_moves = [ (engine.to_move(move, state), move) for move in moves ]
+        return engine.to_move(chosen, state), counts[chosen] / total, chosen, legal_moves
+
+    # Same results as `PlayerBot`'s: (move, probability, engine move, legal
+    # moves as (move, engine move) pairs)
+    def pick_move(self):
+        return self._pick(self.visit_counts(), sample = True)
+
+    def pick_most_likely_move(self):
+        return self._pick(self.visit_counts(), sample = False)
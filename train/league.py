@@ -0,0 +1,186 @@
+import math
+import random
+from enum import Enum
+from typing import List, Optional, Sequence
+
+
+# Choosing who plays whom out of a growing league of bots, with Elo ratings
+# and game counts kept up to date as games are recorded. Matchups are drawn
+# one seat at a time, so it takes O(players log bots) however many bots
+# there are:
+#
+#   BALANCED      every seat in proportion to 1 / (games played + 1), so
+#                 that bots which have played less catch up
+#   PFSP          prioritised fictitious self-play: the first seat as in
+#                 BALANCED, opponents the more likely the more likely they
+#                 are to beat it
+#   RATING_CLOSE  the first seat as in BALANCED, opponents the more likely
+#                 the closer their rating is to its
+#
+# The last two draw opponents uniformly and accept them with that
+# likelihood, giving up after a number of tries on the best one seen.
+
+class MatchPolicy(Enum):
+    BALANCED     = 0
+    PFSP         = 1
+    RATING_CLOSE = 2
+
+
+class _SumTree:
+    # Weights that can be changed and sampled from in O(log n) (a Fenwick
+    # tree over them)
+    def __init__(self):
+        self._weights = []
+        self._tree    = [ 0.0 ]
+        self.total    = 0.0
+
+    def __len__(self):
+        return len(self._weights)
+
+    def append(self, weight: float):
+        # The new node covers a range of the ones before it
+        i = len(self._weights) + 1
+        covered = 0.0
+        j = i - 1
+        low = i - (i & -i)
+        while j > low:
+            covered += self._tree[j]
+            j -= j & -j
+        self._weights.append(weight)
+        self._tree.append(covered + weight)
+        self.total += weight
+
+    def __getitem__(self, i: int) -> float:
+        return self._weights[i]
+
+    def __setitem__(self, i: int, weight: float):
+        delta = weight - self._weights[i]
+        self._weights[i] = weight
+        self.total += delta
+        j = i + 1
+        while j < len(self._tree):
+            self._tree[j] += delta
+            j += j & -j
+
+    def find(self, u: float) -> int:
+        # The index whose range of the cumulative weights holds u
+        i = 0
+        step = 1 << (len(self._weights).bit_length())
+        while step:
+            j = i + step
+            if j < len(self._tree) and self._tree[j] <= u:
+                i = j
+                u -= self._tree[j]
+            step >>= 1
+        return min(i, len(self._weights) - 1)
+
+
+class League:
+    def __init__(
+        self, num_players: int = 2, policy: MatchPolicy = MatchPolicy.BALANCED,
+        k: float = 24, initial_rating: float = 1500, rating_width: float = 200,
+        max_tries: int = 64, seed = None
+    ):
+        self.num_players    = num_players
+        self.policy         = policy
+        # Elo K-factor, shared out over the other players in a game
+        self.k              = k
+        self.initial_rating = initial_rating
+        # How far apart ratings can be for RATING_CLOSE before matchups get
+        # unlikely
+        self.rating_width   = rating_width
+        self.max_tries      = max_tries
+        self._rng = random.Random(seed)
+
+        self.names:   List[Optional[str]] = []
+        self.ratings: List[float] = []
+        self.games:   List[int]   = []
+        self._weights = _SumTree()
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def add(self, name: Optional[str] = None, rating: Optional[float] = None) -> int:
+        # A new bot, or a snapshot of one; returns its index
+        self.names.append(name)
+        self.ratings.append(self.initial_rating if rating is None else rating)
+        self.games.append(0)
+        self._weights.append(1.0)
+        return len(self.ratings) - 1
+
+    def expected_score(self, i: int, j: int) -> float:
+        return 1 / (1 + 10 ** ((self.ratings[j] - self.ratings[i]) / 400))
+
+
+    def sample(self) -> List[int]:
+        if len(self) < self.num_players:
+            raise ValueError(f"Need {self.num_players} bots for a game, have {len(self)}")
+
+        chosen = []
+        try:
+            first = self._draw_balanced()
+            chosen.append(first)
+            self._weights[first] = 0.0
+            while len(chosen) < self.num_players:
+                if self.policy == MatchPolicy.BALANCED:
+                    other = self._draw_balanced()
+                    self._weights[other] = 0.0
+                else:
+                    other = self._draw_opponent(first, chosen)
+                chosen.append(other)
+        finally:
+            for i in chosen:
+                self._weights[i] = self._balanced_weight(i)
+
+        self._rng.shuffle(chosen)
+        return chosen
+
+    def _balanced_weight(self, i: int) -> float:
+        return 1 / (self.games[i] + 1)
+
+    def _draw_balanced(self) -> int:
+        return self._weights.find(self._rng.random() * self._weights.total)
+
+    def _acceptance(self, first: int, other: int) -> float:
+        if self.policy == MatchPolicy.PFSP:
+            return (1 - self.expected_score(first, other)) ** 2
+        diff = (self.ratings[other] - self.ratings[first]) / self.rating_width
+        return math.exp(-diff * diff)
+
+    def _draw_opponent(self, first: int, chosen: List[int]) -> int:
+        best, best_p = None, -1.0
+        for t in range(self.max_tries):
+            other = self._rng.randrange(len(self))
+            if other in chosen:
+                continue
+            p = self._acceptance(first, other)
+            if self._rng.random() < p:
+                return other
+            if p > best_p:
+                best, best_p = other, p
+        if best is None:
+            best = self._rng.choice([ i for i in range(len(self)) if i not in chosen ])
+        return best
+
+
+    def record(self, players: Sequence[int], scores: Sequence[float]):
+        # The result of a game: lower scores place higher (like cards left
+        # at the end), and equal scores draw
+        n = len(players)
+        k = self.k / max(1, n - 1)
+        deltas = [ 0.0 ] * n
+        for a in range(n):
+            for b in range(a + 1, n):
+                i, j = players[a], players[b]
+                actual = 1.0 if scores[a] < scores[b] else 0.0 if scores[a] > scores[b] else 0.5
+                change = k * (actual - self.expected_score(i, j))
+                deltas[a] += change
+                deltas[b] -= change
+
+        for a, i in enumerate(players):
+            self.ratings[i] += deltas[a]
+            self.games[i] += 1
+            self._weights[i] = self._balanced_weight(i)
+
+    def ranking(self) -> List[int]:
+        return sorted(range(len(self)), key = lambda i: -self.ratings[i])
@@ -2,7 +2,7 @@ import copy as deepcopy
 import random
 import math
 import time
-from yaml import load, Loader
+from typing import NamedTuple, Optional
 
 import numpy as np
 import torch
@@ -10,18 +10,25 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.distributions import Categorical
 
-from card import *
-from card.game import *
-from card.games.sjuan import *
+from card import Card, CardSuit, CardValue, CardHandInsert, CardHandTake, card_mask
+from card.games.sjuan import (
+    SjuanRules, SjuanAction, SjuanInsert, SjuanTake, SjuanCardStackInsert, playable_mask
+)
 
-from draw.draw import *
-from draw.manage import *
-from draw.games.sjuan import *
 from lib import const, do_nothing
+from .vec_env import TURN_CARD, SUIT_LOWEST, SUIT_HIGHEST
 
 
 gamma = 0.9948
 
+# Tables from `train.vec_env` as lists, which are quicker to index one value
+# at a time
+_TURN_CARD    = TURN_CARD.tolist()
+_SUIT_LOWEST  = SUIT_LOWEST.tolist()
+_SUIT_HIGHEST = SUIT_HIGHEST.tolist()
+
+_CARD_SHIFTS = np.arange(Card.NUM_CARDS, dtype = np.uint64)
+
 class PlayerTurnModel(nn.Module):
     def __init__(self, input_shape, num_groups, name):
         super().__init__()
@@ -48,11 +55,9 @@ class PlayerTurnModel(nn.Module):
             try:
                 cards = stack_cards[suit]
                 if real_item_i % 2 == 0:
-                    card = deepcopy(cards[0])
-                    card.value -= 1
+                    card = Card(suit, cards[0].value - 1)
                 else:
-                    card = deepcopy(cards[len(cards) - 1])
-                    card.value += 1
+                    card = Card(suit, cards[len(cards) - 1].value + 1)
             except (IndexError, KeyError):
                 card = None
 
@@ -96,6 +101,16 @@ class PlayerTurnModel(nn.Module):
         torch.nn.utils.clip_grad_norm_(self.model.parameters(), 0.8)
         self.optimiser.step()
 
+    def train_on_batch(self, batch):
+        # A batch of stored decisions from `train.dataset`, weighted by their
+        # returns like in `PlayerBot.do_training`
+        log_probs = torch.log_softmax(self.model(batch['state']), dim = 1)
+        log_probs = log_probs.gather(1, batch['action'][:, None]).squeeze(1)
+        rets = batch['ret']
+        loss = torch.sum(-log_probs * (rets - rets.mean()))
+        self.do_training(loss)
+        return loss.item()
+
 class GiveCardsModel(nn.Module):
     def __init__(self, input_shape, num_groups, name):
         super().__init__()
@@ -140,19 +155,148 @@ class GiveCardsModel(nn.Module):
         torch.nn.utils.clip_grad_norm_(self.model.parameters(), 0.8)
         self.optimiser.step()
 
+    def train_on_batch(self, batch):
+        # A batch of stored decisions from `train.dataset`, weighted by their
+        # returns like in `PlayerBot.do_training`
+        log_probs = torch.log_softmax(self.model(batch['state']), dim = 1)
+        log_probs = log_probs.gather(1, batch['action'][:, None]).squeeze(1)
+        rets = batch['ret']
+        loss = torch.sum(-log_probs * (rets - rets.mean()))
+        self.do_training(loss)
+        return loss.item()
+
+
+class StateEncoder:
+    # The bots' state encoding, from bitmasks of cards: three blocks of
+    # `num_cards` 0/1 values for the cards in our hand, on the stack and
+    # with the other players, with the groups in canonical order. Groups
+    # are sorted by which of their cards we hold (those where we own the
+    # last card are first, then those where we own the second, etc.), so
+    # that symmetries are preserved.
+    def __init__(self, all_cards, cache_size: int = 1 << 14):
+        self.num_groups = len(all_cards)
+        self.num_cards  = sum(len(group) for group in all_cards)
+        self._group_ids = [ [ card.id for card in group ] for group in all_cards ]
+
+        # A group's sort key is made of the hand's bits at its cards; runs
+        # of consecutive ids are moved in one go as
+        # (first id, mask of the run, where it goes in the key)
+        self._key_runs = []
+        for ids in self._group_ids:
+            runs = []
+            for i, card_id in enumerate(ids):
+                if runs and card_id == runs[-1][0] + runs[-1][1]:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([ card_id, 1, i ])
+            self._key_runs.append([ (start, (1 << n) - 1, to) for start, n, to in runs ])
+
+        # For the batch encoder
+        self._group_ids_np = [ np.array(ids, dtype = np.int64) for ids in self._group_ids ]
+        self._group_sizes  = np.array([ len(ids) for ids in self._group_ids ], dtype = np.int64)
+        self._key_weights  = [ np.int64(1) << np.arange(len(ids), dtype = np.int64)
+                               for ids in self._group_ids ]
+
+        # Permutations by hand, as the hand often stays the same between
+        # decisions
+        self._cache      = {}
+        self._cache_size = cache_size
+
+    def group_key(self, hand: int, group: int) -> int:
+        key = 0
+        for start, mask, to in self._key_runs[group]:
+            key |= ((hand >> start) & mask) << to
+        return key
+
+    def permutation(self, hand: int):
+        # (group indices in canonical order, the card ids in that order)
+        found = self._cache.get(hand)
+        if found is None:
+            indices = tuple(sorted(range(self.num_groups), key = lambda g: self.group_key(hand, g)))
+            flat = np.array([ card_id for g in indices for card_id in self._group_ids[g] ], dtype = np.int64)
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            found = self._cache[hand] = (indices, flat)
+        return found
+
+    def encode(self, hand: int, stack: int, out: Optional[torch.Tensor] = None):
+        # Into `out` if it is given, and otherwise a new tensor. The bots
+        # take a new one each time, as the models' graphs and `Decision`s
+        # keep hold of it; copying a reused buffer out for them costs more
+        # than allocating (see the `state_encoding` benchmark).
+        indices, flat = self.permutation(hand)
+        n = self.num_cards
+        bits = (np.array([ hand, stack ], dtype = np.uint64)[:, None] >> _CARD_SHIFTS) & np.uint64(1)
+        if out is None:
+            out = torch.empty(3 * n)
+        values = out.numpy()
+        values[:n]      = bits[0, flat]
+        values[n:2 * n] = bits[1, flat]
+        values[2 * n:]  = 1 - values[:n] - values[n:2 * n]
+        return out, indices
+
+    def encode_batch(self, hands, stacks, out: Optional[torch.Tensor] = None):
+        # Encodes many states into the rows of a (B, 3 * num_cards) tensor,
+        # which can be passed in to be reused, and gives the group indices
+        # of each as a (B, num_groups) array
+        hands  = np.asarray(hands,  dtype = np.uint64)
+        stacks = np.asarray(stacks, dtype = np.uint64)
+        B, n = len(hands), self.num_cards
+        mine  = ((hands[:, None]  >> _CARD_SHIFTS) & np.uint64(1)).astype(np.int64)
+        stack = ((stacks[:, None] >> _CARD_SHIFTS) & np.uint64(1)).astype(np.int64)
+
+        keys = np.stack([ mine[:, ids] @ weights
+                          for ids, weights in zip(self._group_ids_np, self._key_weights) ], axis = 1)
+        indices = np.argsort(keys, axis = 1, kind = 'stable')
+
+        # Where each group's cards start once the groups are in order
+        starts = np.cumsum(self._group_sizes[indices], axis = 1) - self._group_sizes[indices]
+        at = np.empty_like(starts)
+        np.put_along_axis(at, indices, starts, axis = 1)
+        flat = np.empty((B, n), dtype = np.int64)
+        for g, ids in enumerate(self._group_ids_np):
+            np.put_along_axis(flat, at[:, g:g + 1] + np.arange(len(ids)), ids[None, :], axis = 1)
+
+        if out is None:
+            out = torch.empty((B, 3 * n))
+        values = out.numpy()
+        values[:, :n]      = np.take_along_axis(mine,  flat, axis = 1)
+        values[:, n:2 * n] = np.take_along_axis(stack, flat, axis = 1)
+        values[:, 2 * n:]  = 1 - values[:, :n] - values[:, n:2 * n]
+        return out, indices
+
+
+class Decision(NamedTuple):
+    # What a bot saw and chose on a move, with the state encoding and the
+    # action in the bot's canonical group order
+    state:  torch.Tensor
+    legal:  torch.Tensor
+    action: int
+    phase:  int
+
 
 class PlayerBot():
-    def __init__(self, sjuan, all_cards, i: int, name: str = "unnamed"):
+    def __init__(self, sjuan, all_cards, i: int, name: str = "unnamed", server = None):
         self._sjuan = sjuan
         self._all_cards = all_cards
         self._index = i
         self._name = name
+        # An `InferenceServer` to batch the forward passes with other games'
+        self.server = server
 
         self._num_cards   = sum(len(group) for group in all_cards)
         self._num_groups  = len(all_cards)
         self._input_shape = 3 * self._num_cards
         self._player_turn_model = PlayerTurnModel(self._input_shape, self._num_groups, name)
         self._give_cards_model  = GiveCardsModel(self._input_shape, self._num_groups, name)
+        self._encoder = StateEncoder(all_cards)
+
+        # Set by `pick_move` and `pick_most_likely_move`
+        self.last_decision = None
+        self._last_inputs  = None
+        # How many times the weights have changed, so that savers can tell
+        # whether they need saving again
+        self.updates = 0
 
 
     @property
@@ -176,29 +320,39 @@ class PlayerBot():
         return self._name
 
 
-    def get_state_representation(self):
-        state = self._sjuan.game.state
-        me    = state.players[self._index]
+    def state_dict(self):
+        # The weights of both models, as `SessionSaver` saves them in .bot
+        # files
+        return {
+            'player_turn_model': self._player_turn_model.model.state_dict(),
+            'give_cards_model':  self._give_cards_model.model.state_dict()
+        }
+
+    def load_checkpoint(self, path):
+        # A file written by `SessionSaver`, for playing with
+        self.load_state_dict(torch.load(path))
+        self._player_turn_model.model.eval()
+        self._give_cards_model.model.eval()
+
+    def load_state_dict(self, state):
+        self._player_turn_model.model.load_state_dict(state['player_turn_model'])
+        self._give_cards_model.model.load_state_dict(state['give_cards_model'])
+        self.updates += 1
 
-        # Canonical sorting so that symmetries are preserved
-        # (groups where we own the last card are first, then those where we own the second, etc.)
-        def key(x):
-            j, group = x
-            return sum(c << i for i, c in enumerate((card in me.cards) for card in group))
-        indices, groups = zip(*sorted(enumerate(self.all_cards), key = key))
-        cards_flat = [ c for group in groups for c in group ]
+    def sharing_models(self, server = None):
+        # The same bot, models and all, to play another game at the same time
+        # with, e.g. with its forward passes batched through `server`
+        other = deepcopy.copy(self)
+        other.server = server
+        other.last_decision = None
+        other._last_inputs  = None
+        return other
 
-        fmine = torch.tensor([
-            (card in me.cards) for card in cards_flat
-        ], dtype = torch.float)
-        fstack = torch.tensor([
-            (card in [card for cards in state.sjuan_stack.cards.values() for card in cards]) for card in cards_flat
-        ], dtype = torch.float)
-        ftheirs = torch.tensor([
-            not (fmine[i] or fstack[i]) for i in range(len(cards_flat))
-        ], dtype = torch.float)
 
-        return torch.cat((fmine, fstack, ftheirs)), indices
+    def get_state_representation(self):
+        state = self._sjuan.game.state
+        hand  = card_mask(state.players[self._index].cards)
+        return self._encoder.encode(hand, state.sjuan_stack.stack_mask())
 
 
     def real_move_i(self, action_item, indices):
@@ -207,36 +361,89 @@ class PlayerBot():
         else:
             return action_item
 
+    def action_cards(self):
+        # The id of the card each group's action would move right now, or -1
+        # if it can't, at index `2 * suit + above` (the card below the row,
+        # or the lowest when giving cards, first). Follows the models'
+        # `choice_to_move` and the rules, like `SjuanVecEnv.action_cards`
+        # does for one game.
+        state = self._sjuan.game.state
+        hand  = card_mask(state.players[self._index].cards)
+        giving = state.phase.match(
+            player_turn = const(False), give_cards = const(True), do_queue = const(False)
+        )
+
+        if giving:
+            cards = []
+            for s in range(len(CardSuit)):
+                suit_bits = (hand >> (13 * s)) & 0x1FFF
+                for table in (_SUIT_LOWEST, _SUIT_HIGHEST):
+                    bit = table[suit_bits]
+                    cards.append(-1 if bit < 0 else 13 * s + bit)
+            return cards
+
+        rows = state.sjuan_stack.row_states
+        playable = hand & playable_mask(rows)
+        return [
+            card if (playable >> card) & 1 else -1
+            for s in range(len(CardSuit)) for card in _TURN_CARD[s][rows[s]]
+        ]
+
+    def _action_move(self, real_i, card_id):
+        # The move for a legal action
+        state = self._sjuan.game.state
+        if real_i == self._num_groups:
+            return SjuanRules.Move.THE_ACTION(SjuanAction.SKIP())
+
+        take = SjuanTake.MYSELF(CardHandTake.HAND_TAKE(
+            state.players[self._index].cards.index(Card.from_id(card_id))
+        ))
+        insert = state.phase.match(
+            player_turn = const(SjuanInsert.SJUAN_STACK(SjuanCardStackInsert.SJUAN_INSERT())),
+            give_cards  = const(SjuanInsert.PLAYER(
+                state.turn_incr(self._index, 1), CardHandInsert.HAND_INSERT(0)
+            )),
+            do_queue    = const(None)
+        )
+        return SjuanRules.Move.FROM_TO(take, insert)
+
     def get_probability_distribution(self):
         state = self._sjuan.game.state
-        me    = state.players[self._index]
         state_repr, indices = self.get_state_representation()
-
-        def player_turn(item_i):
-            return self._player_turn_model.choice_to_move(item_i, me.cards, state.sjuan_stack.cards)
-        def give_cards(item_i):
-            return self._give_cards_model.choice_to_move(item_i, me.cards, state.turn_incr(self._index, 1))
-        f, model = state.phase.match(
-            player_turn = const((player_turn, self._player_turn_model)),
-            give_cards  = const((give_cards, self._give_cards_model)),
+        model, phase = state.phase.match(
+            player_turn = const((self._player_turn_model, 0)),
+            give_cards  = const((self._give_cards_model, 1)),
             do_queue    = const(None)
         )
 
-        logits = model.model(state_repr)
-        legal_logits = torch.empty(len(logits))
-        moves        = []
-        legal_moves  = []
-        for i, logit in enumerate(logits):
+        # The legality of every output at once: card actions from the
+        # bitmasks, and skipping only when no card can be played
+        real_cards = self.action_cards()
+        cards = [ real_cards[indices[i]] for i in range(self._num_groups) ]
+        legal = [ card >= 0 for card in cards ]
+        if phase == 0:
+            cards.append(-1)
+            legal.append(bool(state.can_skip) and not any(legal))
+        legal = torch.tensor(legal)
+
+        if self.server is None:
+            logits = model.model(state_repr)
+        else:
+            logits = self.server.infer(model.model, state_repr)
+        legal_logits = torch.where(legal, logits, -math.inf)
+
+        # Moves are only made for the legal outputs
+        moves       = []
+        legal_moves = []
+        for i, card in enumerate(cards):
             real_i = self.real_move_i(i, indices)
-            move = f(real_i)
-            legal = move is not None and self._sjuan.game.is_valid([ move ])
-            # Only allow skips/card takes when no moves are legal
-            legal = legal and move.match(the_action = const(len(legal_moves) == 0), from_to = const(True))
-            legal_logits[i] = logit if legal else -math.inf
+            move = self._action_move(real_i, card) if legal[i] else None
             moves.append((move, real_i))
-            if legal:
+            if move is not None:
                 legal_moves.append((move, real_i))
 
+        self._last_inputs = (state_repr, legal, phase)
+
         cat_legal = Categorical(logits = legal_logits)
         cat0 = Categorical(logits = logits)
 
@@ -253,16 +460,22 @@ class PlayerBot():
         return cat_legal, cat0, moves, legal_moves
 
 
+    def _decision(self, action_item):
+        state_repr, legal, phase = self._last_inputs
+        return Decision(state_repr, legal, action_item, phase)
+
     def pick_move(self):
         pd, pd0, moves, legal_moves = self.get_probability_distribution()
         action = pd.sample()
         move, item_i = moves[action.item()]
+        self.last_decision = self._decision(action.item())
         return move, pd0.log_prob(action), item_i, legal_moves
 
     def pick_most_likely_move(self):
         pd, pd0, moves, legal_moves = self.get_probability_distribution()
         action_item, prob = max(enumerate(pd.probs), key = lambda x: x[1])
         move, item_i = moves[action_item]
+        self.last_decision = self._decision(action_item)
         return move, prob, item_i, legal_moves
 
 
@@ -298,4 +511,17 @@ class PlayerBot():
         else:
             loss_give = 0
 
+        self.updates += 1
         return loss_turn, loss_give
+
+    def train_on_batch(self, batch):
+        # Trains each model on the stored decisions of its phase
+        losses = []
+        for phase, model in enumerate((self._player_turn_model, self._give_cards_model)):
+            mask = batch['phase'] == phase
+            if mask.any():
+                losses.append(model.train_on_batch({ name: column[mask] for name, column in batch.items() }))
+            else:
+                losses.append(0)
+        self.updates += 1
+        return tuple(losses)
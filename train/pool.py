@@ -0,0 +1,94 @@
+import multiprocessing as mp
+import os
+import sys
+from multiprocessing import forkserver
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+
+# Worker processes for playing games headlessly that start warm. A new Python
+# process spends seconds importing torch and the bots before it can play
+# anything; here one server process does those imports once, and every
+# worker is forked from it with them already done (multiprocessing's
+# 'forkserver' start method, with the imports preloaded). The server lives as
+# long as the program does, so pools made one after another all start in
+# milliseconds.
+#
+# Forking a fresh server, rather than the program itself, also keeps the
+# workers clear of whatever threads torch has started in the program.
+#
+# Where there is no fork server (Windows), workers are spawned cold.
+
+# Modules the server imports before forking anything. Torch imports
+# `torch._dynamo` the first time an optimiser is made, which takes as long as
+# importing torch itself (it is skipped where there is no such module).
+PRELOAD = ('headless', 'torch._dynamo')
+
+def warm_context(preload: Sequence[str] = PRELOAD):
+    # The preloaded modules are fixed once the server has started, so only
+    # the first call's count
+    if 'forkserver' not in mp.get_all_start_methods():
+        return mp.get_context('spawn')
+    ctx = mp.get_context('forkserver')
+    ctx.set_forkserver_preload(list(preload))
+    _start_server()
+    return ctx
+
+def _start_server():
+    # The server isn't given this program's `sys.path`, only its environment,
+    # and it skips modules it can't import without a word, so it would only
+    # preload anything when run from the repository
+    old = os.environ.get('PYTHONPATH')
+    os.environ['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+    try:
+        forkserver.ensure_running()
+    finally:
+        if old is None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = old
+
+
+class WarmPool:
+    # A `multiprocessing.Pool` of warm workers. Work goes to them over pipes
+    # in batches of `batch_size` items, so that short games aren't dominated
+    # by the time it takes to hand them out.
+    def __init__(
+        self, processes: Optional[int] = None, initializer: Optional[Callable] = None,
+        initargs: tuple = (), preload: Sequence[str] = PRELOAD
+    ):
+        self.processes = processes or os.cpu_count() or 1
+        self.context   = warm_context(preload)
+        self._pool = self.context.Pool(self.processes, initializer, initargs)
+
+    def apply_async(self, fn: Callable, args: tuple = (), callback = None, error_callback = None):
+        return self._pool.apply_async(fn, args, callback = callback, error_callback = error_callback)
+
+    def _batch_size(self, items: Sequence, batch_size: Optional[int]) -> int:
+        # By default, a few batches per worker
+        if batch_size is not None:
+            return batch_size
+        return max(1, len(items) // (4 * self.processes))
+
+    def map(self, fn: Callable, items: Iterable, batch_size: Optional[int] = None) -> list:
+        items = list(items)
+        return self._pool.map(fn, items, self._batch_size(items, batch_size))
+
+    def imap_unordered(self, fn: Callable, items: Iterable,
+                       batch_size: Optional[int] = None) -> Iterator:
+        # Results as soon as their batch is done
+        items = list(items)
+        return self._pool.imap_unordered(fn, items, self._batch_size(items, batch_size))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
@@ -0,0 +1,82 @@
+import itertools
+from typing import Iterator, NamedTuple
+
+from card import card_mask
+from card.games.sjuan import (
+    SjuanEngine, MOVE_SKIP, MOVE_ASK_FOR_CARDS, PHASE_PLAYER_TURN
+)
+from .io import SessionFile, RecordedDeal, RecordedMove
+from .vec_env import (
+    TURN_CARD, SUIT_LOWEST, SUIT_HIGHEST, ACTION_SKIP, ACTION_ASK_FOR_CARDS
+)
+
+
+# Replaying the games recorded by `SessionSaver` on a `SjuanEngine`, turning
+# the recorded bot actions back into moves the way `PlayerTurnModel` and
+# `GiveCardsModel` do.
+
+_TURN_CARD    = TURN_CARD.tolist()
+_SUIT_LOWEST  = SUIT_LOWEST.tolist()
+_SUIT_HIGHEST = SUIT_HIGHEST.tolist()
+
+def action_to_move(engine: SjuanEngine, action: int) -> int:
+    # The engine move for a bot action, or -1 if it doesn't stand for one
+    if engine.phase == PHASE_PLAYER_TURN:
+        if action == ACTION_SKIP:
+            return MOVE_SKIP
+        if action == ACTION_ASK_FOR_CARDS:
+            return MOVE_ASK_FOR_CARDS
+        s, above = divmod(action, 2)
+        return _TURN_CARD[s][engine.rows[s]][above]
+
+    s, above = divmod(action, 2)
+    if s >= 4:
+        return -1
+    suit_bits = (engine.hands[engine.turn] >> (13 * s)) & 0x1FFF
+    bit = (_SUIT_HIGHEST if above else _SUIT_LOWEST)[suit_bits]
+    return -1 if bit < 0 else 13 * s + bit
+
+
+class ReplayStep(NamedTuple):
+    # The position before the move. It is the same engine for every step of
+    # a game, so copy it to keep it.
+    engine: SjuanEngine
+    record: RecordedMove
+    move:   int
+
+
+def replay_game(
+    deal: RecordedDeal, moves: Iterator[RecordedMove], can_always_skip: bool = True
+) -> Iterator[ReplayStep]:
+    if not any(deal.hands):
+        raise ValueError("No cards were recorded for the game")
+
+    moves = iter(moves)
+    first = next(moves, None)
+    if first is None:
+        return
+
+    engine = SjuanEngine(
+        len(deal.hands), [ card for hand in deal.hands for card in hand ],
+        can_always_skip, deal = False
+    )
+    engine.set_position([ card_mask(hand) for hand in deal.hands ], first.player)
+
+    for record in itertools.chain((first,), moves):
+        if engine.is_terminal():
+            raise ValueError(f"Moves recorded after the game was over: {record}")
+        if (record.phase, record.player) != (engine.phase, engine.turn):
+            raise ValueError(
+                f"Recorded {record}, but it's phase {engine.phase}, player {engine.turn}"
+            )
+        move = action_to_move(engine, record.move)
+        if move < 0 or not engine.is_legal(move):
+            raise ValueError(f"Recorded an illegal move: {record}")
+
+        yield ReplayStep(engine, record, move)
+        engine.step(move)
+
+def replay_session(session: SessionFile, can_always_skip: bool = True):
+    # (iteration, steps) for every game of a session, lazily
+    for k in range(len(session)):
+        yield k, replay_game(session.deal(k), session.moves(k), can_always_skip)
@@ -0,0 +1,150 @@
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from card.seeding import RandomLike, make_rng
+from draw.games.sjuan import Sjuan
+from draw.shape import RectangleShape
+from draw.vector import Vector
+from lib import const, do_nothing
+from .playerbot import Decision
+
+
+# One game between bots, without drawing anything, with the rewards the bots
+# are trained on.
+
+AFFECT_GAMMA = 0.96
+
+class Episode(NamedTuple):
+    # Per player, in seat order: (reward, log probability, phase) for every
+    # move, as `PlayerBot.do_training` takes them, and the matching decisions
+    trajectories: List[List[tuple]]
+    decisions:    List[List[Decision]]
+    who_started:  int
+    winner:       int
+    num_cards0:   List[int]
+    num_cards:    List[int]
+    badskips:     List[int]
+    # Seconds spent on each part of the game
+    times:        Dict[str, float]
+
+
+def play_episode(
+    bots, cards_grouped,
+    on_deal: Optional[Callable] = None, on_move: Optional[Callable] = None,
+    greedy: bool = False, rng: RandomLike = None
+) -> Episode:
+    # `on_deal(players)` is called once the cards are dealt and
+    # `on_move(phase, player, move_i)` after every move, e.g. to record the
+    # game with a `SessionSaver`. Greedy bots always make their most likely
+    # move, like they do against people. `rng` deals the cards (see
+    # `card.seeding`), so the same seed gives the same deal whoever sits where.
+
+    t0 = time.time()
+    N_players = len(bots)
+    times = { 'init': 0.0, 'init_turn': 0.0, 'decisions': 0.0, 'doing': 0.0, 'end': 0.0 }
+
+    player_config = [
+        { 'type': 'human', 'name': bot.name } for bot in bots
+    ]
+    sjuan = Sjuan(player_config, RectangleShape(
+        bottom_left = Vector(0, 0), size = Vector(900, 600)
+    ), cards_grouped = cards_grouped, graphical = False, rng = make_rng(rng))
+    game = sjuan.game
+    for i, bot in enumerate(bots):
+        bot._sjuan = sjuan
+        bot._index = i
+    game.reset() # Seems to much improve speed - why? I'm not sure.
+
+    trajectories = [ [] for bot in bots ]
+    decisions    = [ [] for bot in bots ]
+
+    def update_last_turn_trajectories(fn):
+        for i in range(N_players - 1):
+            traj = trajectories[-(1 + i)]
+            if len(traj) > 0:
+                last = traj[-1]
+                traj[-1] = (fn(i, last[0]), *last[1:])
+
+    def affect_last_turn_trajectories(x):
+        update_last_turn_trajectories(lambda j, r:
+           r + x * (AFFECT_GAMMA ** j)
+        )
+
+    # Deal before recording the hands
+    game.do(game.state.queue)
+    if on_deal is not None:
+        on_deal(game.state.players)
+
+    first = True
+    who_started = None
+    badskips = [ 0 for bot in bots ]
+
+    times['init'] = time.time() - t0
+    while not sjuan.done:
+        t00 = time.time()
+        game.state.phase.match(
+            do_queue = lambda _: game.do(game.state.queue),
+            player_turn = do_nothing, give_cards = do_nothing
+        )
+
+        curr_player_i = game.state.turn_index()
+        curr_bot      = bots[curr_player_i]
+        curr_phase    = game.state.phase.match(
+            do_queue = const(None), player_turn = const(0), give_cards = const(1)
+        )
+
+        if first:
+            num_cards0 = [ len(player.cards) for player in game.state.players ]
+            who_started = curr_player_i
+            first = False
+
+        t01 = time.time()
+        times['init_turn'] += t01 - t00
+        if greedy:
+            move, log_prob, move_i, legal_moves = curr_bot.pick_most_likely_move()
+        else:
+            move, log_prob, move_i, legal_moves = curr_bot.pick_move()
+        decisions[curr_player_i].append(curr_bot.last_decision)
+        t02 = time.time()
+        times['decisions'] += t02 - t01
+        game.do([ move ])
+        if on_move is not None:
+            on_move(curr_phase, curr_player_i, move_i)
+        t03 = time.time()
+        times['doing'] += t03 - t02
+
+        my_reward = 0
+        # With two players the game is over as soon as either has won, so
+        # it was this move that won it
+        if sjuan.done:
+            my_reward += 2
+            affect_last_turn_trajectories(-1.5)
+        else:
+            if move_i < curr_bot._num_groups:
+                my_reward += 0.1
+            else:
+                move_i -= curr_bot._num_groups
+                if move_i == 0: # skip
+                    my_reward -= 0.075
+                    badskips[curr_player_i] += 1
+                    affect_last_turn_trajectories(0.075)
+                elif move_i == 1: # ask for cards
+                    if len(legal_moves) > 1:
+                        badskips[curr_player_i] += 1
+                    my_reward -= 0.5
+                    affect_last_turn_trajectories(0.1)
+
+        trajectories[curr_player_i].append(
+            (my_reward, log_prob, curr_phase)
+        )
+
+        times['end'] += time.time() - t03
+
+    winner_i = curr_player_i
+    num_cards = [ len(player.cards) for player in game.state.players ]
+    num_cards.insert(winner_i, 0)
+
+    return Episode(
+        trajectories, decisions, who_started, winner_i,
+        num_cards0, num_cards, badskips, times
+    )
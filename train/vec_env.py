@@ -0,0 +1,281 @@
+import numpy as np
+
+from card import Card, CardSuit
+from card.games.sjuan import NUM_CARDS_TO_TAKE
+from card.games.sjuan.sjuan_card_stack import (
+    NUM_ROW_STATES, ROW_LOW, ROW_HIGH, ROW_PLAYABLE, ROW_CARDS,
+    ROW_AFTER_INSERT, SEVEN_RANK, KING_RANK, rank_bit, bit_rank
+)
+
+
+# Many Sjuan games played side by side in NumPy arrays, with the rules of
+# `SjuanEngine` and the bots' action indices: action 2s plays the card below
+# suit s's row on the stack (or gives away the lowest card of suit s), 2s + 1
+# the card above it (or the highest card of suit s), where an empty row takes
+# its seven either way. Then come skipping and, optionally, asking for cards,
+# which like in `PlayerBot` are only legal when no card can be played.
+#
+# Players keep their seat for the whole game; seats that have won are just
+# marked as no longer alive.
+
+NUM_GROUPS           = 2 * len(CardSuit)
+ACTION_SKIP          = NUM_GROUPS
+ACTION_ASK_FOR_CARDS = NUM_GROUPS + 1
+
+PHASE_PLAYER_TURN = 0
+PHASE_GIVE_CARDS  = 1
+
+CARD_BITS = np.array([ 1 << i for i in range(Card.NUM_CARDS) ], dtype = np.uint64)
+SUIT_BITS = np.uint64((1 << 13) - 1)
+
+ROW_PLAYABLE_NP     = np.array(ROW_PLAYABLE,     dtype = np.uint64)
+ROW_CARDS_NP        = np.array(ROW_CARDS,        dtype = np.uint64)
+ROW_AFTER_INSERT_NP = np.array(ROW_AFTER_INSERT, dtype = np.int8)
+
+def _turn_card(s, state, above):
+    # Wrapping round like `CardValue` does, as `PlayerTurnModel` does
+    if state == 0:
+        rank = SEVEN_RANK
+    elif above:
+        rank = ROW_HIGH[state] % KING_RANK + 1
+    else:
+        rank = (ROW_LOW[state] - 2) % KING_RANK + 1
+    return s * 13 + rank_bit(rank)
+
+# TURN_CARD[s, state, above]: the card id an action tries to play on a row;
+# it is only legal if the card is in hand and playable
+TURN_CARD = np.array([
+    [ [ _turn_card(s, state, above) for above in (False, True) ]
+      for state in range(NUM_ROW_STATES) ]
+    for s in range(len(CardSuit))
+], dtype = np.int8)
+
+def _extreme_bit(bits, highest):
+    ranked = [ bit for bit in range(13) if (bits >> bit) & 1 ]
+    if not ranked:
+        return -1
+    return (max if highest else min)(ranked, key = bit_rank)
+
+# SUIT_LOWEST/HIGHEST[bits]: bit of the lowest/highest ranked card among the
+# 13 bits of one suit of a hand, or -1
+SUIT_LOWEST  = np.array([ _extreme_bit(b, False) for b in range(1 << 13) ], dtype = np.int8)
+SUIT_HIGHEST = np.array([ _extreme_bit(b, True)  for b in range(1 << 13) ], dtype = np.int8)
+
+
+class SjuanVecEnv:
+    def __init__(
+        self, num_games: int, num_players: int = 2,
+        can_always_skip: bool = True, ask_for_cards: bool = False
+    ):
+        self.num_games       = num_games
+        self.num_players     = num_players
+        self.num_actions     = NUM_GROUPS + (2 if ask_for_cards else 1)
+        self._can_always_skip = can_always_skip
+
+        N, P = num_games, num_players
+        self.hands       = np.zeros((N, P), dtype = np.uint64)
+        self.rows        = np.zeros((N, len(CardSuit)), dtype = np.int8)
+        self.phase       = np.zeros(N, dtype = np.int8)
+        self.turn        = np.zeros(N, dtype = np.int64)
+        self.to_give     = np.zeros(N, dtype = np.int8)
+        self.can_skip    = np.zeros(N, dtype = bool)
+        self.can_succumb = np.zeros(N, dtype = bool)
+        self.alive       = np.zeros((N, P), dtype = bool)
+        # The order players finished in (0 = won first), -1 until they have
+        self.place       = np.full((N, P), -1, dtype = np.int8)
+        self.num_won     = np.zeros(N, dtype = np.int8)
+        self.done        = np.ones(N, dtype = bool)
+
+    def reset(self, seeds = None):
+        # `seeds` is either one seed for the whole batch or one per game
+        N, P = self.num_games, self.num_players
+        deck = np.tile(np.arange(Card.NUM_CARDS), (N, 1))
+        if seeds is None or np.ndim(seeds) == 0:
+            rng = np.random.default_rng(seeds)
+            perms = rng.permuted(deck, axis = 1)
+            first = rng.integers(P, size = N)
+        else:
+            rngs  = [ np.random.default_rng(seed) for seed in seeds ]
+            perms = np.stack([ rng.permutation(Card.NUM_CARDS) for rng in rngs ])
+            first = np.array([ rng.integers(P) for rng in rngs ])
+
+        # The k-th card off the shuffled deck goes to player k % P
+        owner = np.empty_like(perms)
+        np.put_along_axis(owner, perms, np.arange(Card.NUM_CARDS) % P, axis = 1)
+        for p in range(P):
+            self.hands[:, p] = np.where(owner == p, CARD_BITS, np.uint64(0)).sum(
+                axis = 1, dtype = np.uint64
+            )
+
+        self.rows[:]        = 0
+        self.phase[:]       = PHASE_PLAYER_TURN
+        self.turn[:]        = first
+        self.to_give[:]     = 0
+        self.can_skip[:]    = self._can_always_skip
+        self.can_succumb[:] = True
+        self.alive[:]       = True
+        self.place[:]       = -1
+        self.num_won[:]     = 0
+        self.done[:]        = False
+
+
+    def current_hands(self) -> np.ndarray:
+        return self.hands[np.arange(self.num_games), self.turn]
+
+    def stack_masks(self) -> np.ndarray:
+        mask = np.zeros(self.num_games, dtype = np.uint64)
+        for s in range(len(CardSuit)):
+            mask |= ROW_CARDS_NP[s, self.rows[:, s]]
+        return mask
+
+    def playable_masks(self) -> np.ndarray:
+        mask = np.zeros(self.num_games, dtype = np.uint64)
+        for s in range(len(CardSuit)):
+            mask |= ROW_PLAYABLE_NP[s, self.rows[:, s]]
+        return mask
+
+    def action_cards(self) -> np.ndarray:
+        # (N, NUM_GROUPS) card id each card action would move, or -1
+        N = self.num_games
+        hands = self.current_hands()
+        playable_hands = hands & self.playable_masks()
+        giving = self.phase == PHASE_GIVE_CARDS
+        cards = np.empty((N, NUM_GROUPS), dtype = np.int64)
+        for s in range(len(CardSuit)):
+            suit_bits = ((hands >> np.uint64(13 * s)) & SUIT_BITS).astype(np.int64)
+            for above in (0, 1):
+                turn_card = TURN_CARD[s, self.rows[:, s], above].astype(np.int64)
+                held = ((playable_hands >> turn_card.astype(np.uint64))
+                        & np.uint64(1)).astype(bool)
+                turn_card[~held] = -1
+
+                give_bit = (SUIT_HIGHEST if above else SUIT_LOWEST)[suit_bits]
+                give_card = np.where(give_bit >= 0, 13 * s + give_bit, -1)
+
+                cards[:, 2 * s + above] = np.where(giving, give_card, turn_card)
+        return cards
+
+    def legal_mask(self) -> np.ndarray:
+        return self._legal_mask(self.action_cards())
+
+    def _legal_mask(self, cards) -> np.ndarray:
+        legal = np.zeros((self.num_games, self.num_actions), dtype = bool)
+        legal[:, :NUM_GROUPS] = cards >= 0
+        no_cards = ~legal[:, :NUM_GROUPS].any(axis = 1)
+        turn = self.phase == PHASE_PLAYER_TURN
+        legal[:, ACTION_SKIP] = turn & self.can_skip & no_cards
+        if self.num_actions > ACTION_ASK_FOR_CARDS:
+            legal[:, ACTION_ASK_FOR_CARDS] = turn & self.can_succumb & no_cards
+        legal[self.done] = False
+        return legal
+
+
+    def step(self, actions):
+        # Returns whether the player who acted finished (won) with this
+        # action, and which games are over. Finished games are left as they
+        # are, whatever their action.
+        actions = np.asarray(actions, dtype = np.int64)
+        cards = self.action_cards()
+        legal = self._legal_mask(cards)
+
+        g = np.nonzero(~self.done)[0]
+        a = actions[g]
+        if not legal[g, a].all():
+            bad = g[~legal[g, a]]
+            raise ValueError(f"Illegal actions {actions[bad]} in games {bad}")
+
+        turn_phase = self.phase[g] == PHASE_PLAYER_TURN
+        plays = g[turn_phase & (a < NUM_GROUPS)]
+        skips = g[turn_phase & (a == ACTION_SKIP)]
+        asks  = g[turn_phase & (a == ACTION_ASK_FOR_CARDS)]
+        gives = g[~turn_phase]
+
+        won = np.zeros(self.num_games, dtype = bool)
+
+        # Cards onto the stack
+        c = cards[plays, actions[plays]]
+        t = self.turn[plays]
+        self.hands[plays, t] ^= CARD_BITS[c]
+        s = c // 13
+        self.rows[plays, s] = ROW_AFTER_INSERT_NP[self.rows[plays, s], c % 13]
+        won[plays] = self.hands[plays, t] == 0
+        self._remove_current(plays[won[plays]])
+        # Aces (bit 12) and kings (bit 11) don't end the turn
+        extra = c % 13 >= 11
+        self._next_phase(plays[~extra])
+        self.can_skip[plays[extra]]    = True
+        self.can_succumb[plays[extra]] = False
+
+        self._next_phase(skips)
+
+        self.phase[asks]   = PHASE_GIVE_CARDS
+        self.turn[asks]    = self._next_alive(asks, self.turn[asks], -1)
+        self.to_give[asks] = NUM_CARDS_TO_TAKE
+        self._turn_change(asks)
+
+        # Cards to the next player
+        c = cards[gives, actions[gives]]
+        t = self.turn[gives]
+        self.hands[gives, t] ^= CARD_BITS[c]
+        receiver = self._next_alive(gives, t, 1)
+        self.hands[gives, receiver] |= CARD_BITS[c]
+        won[gives] = self.hands[gives, t] == 0
+        self._remove_current(gives[won[gives]])
+        # A giver who gave away their last card ends the giving; the player
+        # who asked is next in turn now, and loses it
+        ended = gives[won[gives]]
+        self.phase[ended]   = PHASE_PLAYER_TURN
+        self.to_give[ended] = 0
+        self._next_phase(gives)
+
+        return won, self.done.copy()
+
+
+    def _next_alive(self, games, seats, direction):
+        P = self.num_players
+        found = np.zeros(len(games), dtype = bool)
+        res = np.array(seats, copy = True)
+        for k in range(1, P + 1):
+            cand = (seats + direction * k) % P
+            ok = ~found & self.alive[games, cand]
+            res[ok] = cand[ok]
+            found |= ok
+        return res
+
+    def _turn_change(self, games):
+        self.can_skip[games]    = self._can_always_skip
+        self.can_succumb[games] = self.phase[games] == PHASE_PLAYER_TURN
+
+    def _next_phase(self, games):
+        games = games[~self.done[games]]
+        turn = self.phase[games] == PHASE_PLAYER_TURN
+        more = ~turn & (self.to_give[games] > 1)
+        over = ~turn & ~more
+
+        ts = games[turn]
+        self.turn[ts] = self._next_alive(ts, self.turn[ts], 1)
+
+        self.to_give[games[more]] -= 1
+
+        # The player who asked for cards loses their turn
+        os = games[over]
+        self.phase[os]   = PHASE_PLAYER_TURN
+        self.to_give[os] = 0
+        self.turn[os] = self._next_alive(os, self._next_alive(os, self.turn[os], 1), 1)
+
+        self._turn_change(games)
+
+    def _remove_current(self, games):
+        t = self.turn[games]
+        self.alive[games, t] = False
+        self.place[games, t] = self.num_won[games]
+        self.num_won[games] += 1
+
+        over = self.alive[games].sum(axis = 1) <= 1
+        self.done[games[over]] = True
+        ended = games[over]
+        self.place[ended] = np.where(self.alive[ended], self.num_won[ended, None], self.place[ended])
+
+        going = games[~over]
+        self.turn[going] = self._next_alive(going, self.turn[going], 1)
+        self._turn_change(going)